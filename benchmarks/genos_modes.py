@@ -0,0 +1,154 @@
+"""
+Side-by-side comparison of the two Gen-OS project description modes.
+
+For every Gen-OS proposal in the fixture file, writes the project description
+and executive summary (the critical path of a proposal) both as draft plus
+refinement and in a single pass with GENOS_SINGLE_PASS. Reports latency, LLM
+calls and tokens per mode and diffs the heading structure of the two
+descriptions, so the default can be switched on evidence:
+
+    python benchmarks/genos_modes.py --runs 3 --output-dir /tmp/genos   # uses the AZURE_OPENAI_* settings
+    python benchmarks/genos_modes.py --mock                              # offline: latency and tokens only
+
+The completion cache is bypassed, and the order of the two modes alternates
+between runs so neither one always goes first.
+"""
+
+import argparse
+import difflib
+import json
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from mock_openai import add_config_arguments, config_from_arguments, create_app, serve_in_thread
+from run import RESULTS_DIR, ROOT, configure_environment, git_commit, load_proposals
+
+MODES = {"refine": False, "single_pass": True}
+
+
+def structure(markdown: str) -> dict:
+    """Outline of a section: its headings, bullet count and length."""
+    lines = markdown.splitlines()
+    return {
+        "headings": [line.strip() for line in lines if re.match(r"\s*#{1,6}\s", line) or re.match(r"\s*\*\*[^*]+\*\*\s*$", line)],
+        "bullets": sum(1 for line in lines if re.match(r"\s*([-*+]|\d+\.)\s", line)),
+        "words": len(markdown.split()),
+    }
+
+
+def run_mode(proposal: dict, single_pass: bool) -> dict:
+    from proposal_builder.agent import GenerationRun, generate_executive_summary, generate_project_description
+    from proposal_builder.metrics import summarize_calls
+
+    calls = []
+    run = GenerationRun(
+        on_call=calls.append,
+        fresh=True,
+        project_type=proposal["project_type"],
+        language=proposal["language"],
+        genos_single_pass=single_pass,
+    )
+    started = time.monotonic()
+    description = generate_project_description(proposal, run)
+    description_seconds = time.monotonic() - started
+    generate_executive_summary(proposal, description, run)
+    summary = summarize_calls(calls)
+    return {
+        "description_seconds": description_seconds,
+        "critical_path_seconds": time.monotonic() - started,
+        "llm_calls": summary["llm_calls"],
+        "prompt_tokens": summary["prompt_tokens"],
+        "completion_tokens": summary["completion_tokens"],
+        "structure": structure(description),
+        "description": description,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--proposals", type=Path, default=ROOT / "benchmarks" / "proposals.jsonl")
+    parser.add_argument("--runs", type=int, default=1, help="Runs of each mode per proposal")
+    parser.add_argument("--mock", action="store_true", help="Run against the mock server instead of Azure OpenAI")
+    parser.add_argument("--mock-port", type=int, default=8900)
+    parser.add_argument("--output", type=Path, default=None, help="Results file (default: benchmarks/results/genos_modes-<commit>.json)")
+    parser.add_argument("--output-dir", type=Path, default=None, help="Also write every description as markdown for review")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    if args.mock:
+        serve_in_thread(create_app(config_from_arguments(args)), args.mock_port)
+        configure_environment(args.mock_port)
+    else:
+        sys.path.insert(0, str(ROOT / "src"))
+
+    proposals = [p for p in load_proposals(args.proposals) if p["project_type"] == "Gen-OS"]
+    if not proposals:
+        parser.error(f"No Gen-OS proposals in {args.proposals}")
+
+    results = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "proposals": []}
+    samples = {mode: [] for mode in MODES}
+    for index, proposal in enumerate(proposals):
+        name = f"{index + 1}-{proposal['client_name']}-{proposal['language']}"
+        runs = {mode: [] for mode in MODES}
+        for attempt in range(args.runs):
+            order = list(MODES) if attempt % 2 == 0 else list(reversed(MODES))
+            for mode in order:
+                print(f"{name}: {mode} run {attempt + 1}/{args.runs}...", flush=True)
+                result = run_mode(proposal, MODES[mode])
+                runs[mode].append(result)
+                samples[mode].append(result)
+                if args.output_dir is not None:
+                    args.output_dir.mkdir(parents=True, exist_ok=True)
+                    (args.output_dir / f"{name}-{mode}-{attempt + 1}.md").write_text(result["description"], encoding="utf-8")
+
+        print(f"\n{name}")
+        print(f"  {'mode':<14}{'critical path s':>16}{'calls':>7}{'prompt tok':>12}{'completion tok':>16}{'headings':>10}{'words':>8}")
+        for mode, mode_runs in runs.items():
+            print(
+                f"  {mode:<14}"
+                f"{statistics.median(r['critical_path_seconds'] for r in mode_runs):>16.2f}"
+                f"{statistics.median(r['llm_calls'] for r in mode_runs):>7.0f}"
+                f"{statistics.median(r['prompt_tokens'] for r in mode_runs):>12.0f}"
+                f"{statistics.median(r['completion_tokens'] for r in mode_runs):>16.0f}"
+                f"{statistics.median(len(r['structure']['headings']) for r in mode_runs):>10.0f}"
+                f"{statistics.median(r['structure']['words'] for r in mode_runs):>8.0f}"
+            )
+        diff = list(difflib.unified_diff(
+            runs["refine"][0]["structure"]["headings"],
+            runs["single_pass"][0]["structure"]["headings"],
+            fromfile="refine",
+            tofile="single_pass",
+            lineterm="",
+        ))
+        print("  heading structure: " + ("identical" if not diff else "differs"))
+        for line in diff[2:]:
+            print(f"    {line}")
+        results["proposals"].append({
+            "name": name,
+            "modes": {mode: [{k: v for k, v in r.items() if k != "description"} for r in mode_runs] for mode, mode_runs in runs.items()},
+            "heading_diff": diff,
+        })
+
+    print("\nAll proposals")
+    totals = {}
+    for mode, mode_samples in samples.items():
+        totals[mode] = {
+            "critical_path_p50": statistics.median(r["critical_path_seconds"] for r in mode_samples),
+            "description_p50": statistics.median(r["description_seconds"] for r in mode_samples),
+            "prompt_tokens_mean": statistics.mean(r["prompt_tokens"] for r in mode_samples),
+            "completion_tokens_mean": statistics.mean(r["completion_tokens"] for r in mode_samples),
+        }
+        print("  " + f"{mode:<14}" + ", ".join(f"{k}={v:.2f}" for k, v in totals[mode].items()))
+    results["totals"] = totals
+
+    output = args.output or RESULTS_DIR / f"genos_modes-{results['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
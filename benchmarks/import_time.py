@@ -0,0 +1,94 @@
+"""
+Cold-start benchmark: how long importing the API (or any other entry module)
+takes in a fresh interpreter, and which imports dominate it.
+
+Each run starts a new `python -X importtime -c "import <module>"` in src/, so
+nothing is cached in-process. Fails when the median exceeds --max-seconds or
+when a module listed in --forbid (streamlit by default) gets imported:
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module app --forbid --max-seconds 5
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def measure(module: str) -> tuple[float, dict[str, int]]:
+    """Total import time of `module` in seconds, and cumulative microseconds per top-level package."""
+    env = {
+        **os.environ,
+        # Settings are read at import; placeholders keep the run independent of a local .env
+        "AZURE_OPENAI_ENDPOINT": os.environ.get("AZURE_OPENAI_ENDPOINT", "http://127.0.0.1:1/"),
+        "AZURE_OPENAI_API_KEY": os.environ.get("AZURE_OPENAI_API_KEY", "benchmark"),
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT / "src",
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    packages = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is None:
+            continue
+        _, cumulative, indent, name = match.groups()
+        if name == module and not indent:
+            total = int(cumulative)
+        # The outermost import of a package carries its whole cost
+        top = name.split(".")[0]
+        packages[top] = max(packages.get(top, 0), int(cumulative))
+    return total / 1e6, packages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="api", help="Module to import from src/")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail when the median import time is above this")
+    parser.add_argument("--forbid", nargs="*", default=["streamlit"], help="Packages the module must not import")
+    args = parser.parse_args()
+
+    totals = []
+    packages = {}
+    for _ in range(args.runs):
+        total, run_packages = measure(args.module)
+        totals.append(total)
+        for name, micros in run_packages.items():
+            packages.setdefault(name, []).append(micros)
+
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.3f}s, min {min(totals):.3f}s, max {max(totals):.3f}s over {args.runs} runs")
+    print(f"\n{'package':<32}{'median ms':>10}")
+    ranked = sorted(packages.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, micros in ranked[:args.top]:
+        if name != args.module:
+            print(f"{name:<32}{statistics.median(micros) / 1000:>10.1f}")
+
+    failed = False
+    for name in args.forbid:
+        if name in packages:
+            print(f"\nFAIL: importing {args.module} imports {name}")
+            failed = True
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"\nFAIL: median import time {median:.3f}s is above {args.max_seconds:.3f}s")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
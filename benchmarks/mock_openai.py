@@ -0,0 +1,186 @@
+"""
+Local stand-in for the Azure OpenAI chat completions endpoint.
+
+Serves /openai/deployments/{deployment}/chat/completions (the path `create_llm`
+builds from AZURE_OPENAI_ENDPOINT) with configurable latency, token rate,
+streaming and injected 429s, so the pipeline and the API can be benchmarked
+without spending quota or picking up network noise.
+
+Run standalone and point the app at it:
+
+    python benchmarks/mock_openai.py --port 8900 --ttft-median 0.8 --tokens-per-second 60
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8900/ poetry run python src/api.py
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class MockConfig:
+    # Time to first token, drawn from a log-normal distribution
+    ttft_median: float = 0.5
+    ttft_sigma: float = 0.4
+    # Output length, drawn from a log-normal distribution
+    output_tokens_median: int = 400
+    output_tokens_sigma: float = 0.3
+    # Generation speed once the first token is out
+    tokens_per_second: float = 80.0
+    # Probability of answering 429 instead, and the Retry-After it sends
+    rate_limit_probability: float = 0.0
+    retry_after_seconds: float = 1.0
+    seed: int | None = None
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock Azure OpenAI")
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "rate_limited": 0}
+    app.state.config = config
+    app.state.stats = stats
+
+    def sample(median: float, sigma: float) -> float:
+        return rng.lognormvariate(math.log(median), sigma)
+
+    async def chat_completions(request: Request, deployment: str | None = None):
+        body = await request.json()
+        stats["requests"] += 1
+        if rng.random() < config.rate_limit_probability:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"code": "429", "message": "Rate limit is exceeded. Try again later."}},
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after_seconds)},
+            )
+
+        model = deployment or body.get("model", "mock")
+        prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+        prompt_tokens = max(1, prompt_chars // 4)
+        completion_tokens = max(1, int(sample(config.output_tokens_median, config.output_tokens_sigma)))
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        if max_tokens:
+            completion_tokens = min(completion_tokens, max_tokens)
+        ttft = sample(config.ttft_median, config.ttft_sigma)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + completion_tokens / config.tokens_per_second)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(["lorem"] * completion_tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: dict, finish_reason: str | None = None, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            await asyncio.sleep(ttft)
+            yield chunk({"role": "assistant", "content": ""})
+            # Tokens go out in small batches to keep the event rate realistic
+            batch = max(1, int(config.tokens_per_second // 20))
+            for sent in range(0, completion_tokens, batch):
+                count = min(batch, completion_tokens - sent)
+                yield chunk({"content": "lorem " * count})
+                await asyncio.sleep(count / config.tokens_per_second)
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield chunk(None, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def deployment_chat_completions(deployment: str, request: Request):
+        return await chat_completions(request, deployment)
+
+    @app.post("/openai/chat/completions")
+    async def base_chat_completions(request: Request):
+        return await chat_completions(request)
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"config": asdict(config), **stats}
+
+    return app
+
+
+def serve_in_thread(app: FastAPI, port: int, host: str = "127.0.0.1") -> uvicorn.Server:
+    """Start a uvicorn server for `app` on a daemon thread and wait until it accepts requests."""
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server on port {port} did not start")
+        time.sleep(0.05)
+    return server
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = MockConfig()
+    parser.add_argument("--ttft-median", type=float, default=defaults.ttft_median, help="Median time to first token (s)")
+    parser.add_argument("--ttft-sigma", type=float, default=defaults.ttft_sigma, help="Log-normal sigma of the time to first token")
+    parser.add_argument("--output-tokens-median", type=int, default=defaults.output_tokens_median, help="Median completion length (tokens)")
+    parser.add_argument("--output-tokens-sigma", type=float, default=defaults.output_tokens_sigma, help="Log-normal sigma of the completion length")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second, help="Generation speed after the first token")
+    parser.add_argument("--rate-limit-probability", type=float, default=defaults.rate_limit_probability, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after-seconds", type=float, default=defaults.retry_after_seconds, help="Retry-After sent with injected 429s")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+
+
+def config_from_arguments(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        ttft_median=args.ttft_median,
+        ttft_sigma=args.ttft_sigma,
+        output_tokens_median=args.output_tokens_median,
+        output_tokens_sigma=args.output_tokens_sigma,
+        tokens_per_second=args.tokens_per_second,
+        rate_limit_probability=args.rate_limit_probability,
+        retry_after_seconds=args.retry_after_seconds,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_arguments(args)), host=args.host, port=args.port, log_level="warning")
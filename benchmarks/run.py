@@ -0,0 +1,221 @@
+"""
+Offline benchmark for proposal generation.
+
+Starts the mock Azure OpenAI server, points the app at it and drives either
+`generate_proposal` directly (pipeline) or the FastAPI service (api) with the
+proposals in benchmarks/proposals.jsonl at each requested concurrency level.
+Reports throughput, p50/p95/p99 latency and time to first section/token, and
+saves the results under benchmarks/results/ keyed by git commit so runs can be
+compared across commits:
+
+    python benchmarks/run.py --mode pipeline api --concurrency 1 4 16
+    python benchmarks/run.py --compare benchmarks/results/<baseline>.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from mock_openai import add_config_arguments, config_from_arguments, create_app, serve_in_thread
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+
+def configure_environment(mock_port: int) -> None:
+    """Point the app at the mock server; must run before `config` is imported."""
+    os.environ["AZURE_OPENAI_ENDPOINT"] = f"http://127.0.0.1:{mock_port}/"
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("AZURE_OPENAI_API_VERSION", "2024-10-21")
+    os.environ.setdefault("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
+    # Measure the model path, not the completion cache
+    os.environ.setdefault("COMPLETION_CACHE_ENABLED", "false")
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="proposal-benchmark-"))
+    sys.path.insert(0, str(ROOT / "src"))
+
+
+def load_proposals(path: Path) -> list[dict]:
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def summarize(samples: list[dict], elapsed: float) -> dict:
+    ok = [s for s in samples if s["error"] is None]
+    latencies = [s["latency"] for s in ok]
+    first_sections = [s["first_section"] for s in ok if s["first_section"] is not None]
+    first_tokens = [s["first_token"] for s in ok if s["first_token"] is not None]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "throughput_per_minute": len(ok) / elapsed * 60 if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "first_section_p50": percentile(first_sections, 50),
+        "first_section_p95": percentile(first_sections, 95),
+        "first_token_p50": percentile(first_tokens, 50),
+        "first_token_p95": percentile(first_tokens, 95),
+    }
+
+
+def run_pipeline_request(proposal: dict) -> dict:
+    from proposal_builder.agent import generate_proposal
+
+    started = time.monotonic()
+    sample = {"latency": None, "first_section": None, "first_token": None, "error": None}
+    lock = threading.Lock()
+
+    def on_section(name: str, content: str) -> None:
+        with lock:
+            if sample["first_section"] is None:
+                sample["first_section"] = time.monotonic() - started
+
+    def on_token(name: str, token: str) -> None:
+        with lock:
+            if sample["first_token"] is None:
+                sample["first_token"] = time.monotonic() - started
+
+    try:
+        generate_proposal(proposal, on_section=on_section, on_token=on_token)
+    except Exception as e:
+        sample["error"] = str(e)
+    sample["latency"] = time.monotonic() - started
+    return sample
+
+
+def run_api_request(api_url: str, proposal: dict) -> dict:
+    import httpx
+
+    started = time.monotonic()
+    sample = {"latency": None, "first_section": None, "first_token": None, "error": None}
+    try:
+        response = httpx.post(f"{api_url}/proposals/", json=proposal, timeout=30)
+        response.raise_for_status()
+        proposal_id = response.json()["id"]
+        with httpx.stream("GET", f"{api_url}/proposals/{proposal_id}/stream", timeout=None) as stream:
+            event = None
+            for line in stream.iter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    if event == "section" and sample["first_section"] is None:
+                        sample["first_section"] = time.monotonic() - started
+                    elif event == "token" and sample["first_token"] is None:
+                        sample["first_token"] = time.monotonic() - started
+                    elif event == "done":
+                        data = json.loads(line[len("data: "):])
+                        if data["status"] != "completed":
+                            sample["error"] = data.get("error") or data["status"]
+                        break
+    except Exception as e:
+        sample["error"] = str(e)
+    sample["latency"] = time.monotonic() - started
+    return sample
+
+
+def run_scenario(request: callable, proposals: list[dict], concurrency: int, requests: int) -> dict:
+    work = [proposals[i % len(proposals)] for i in range(requests)]
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(request, work))
+    return summarize(samples, time.monotonic() - started)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> bool:
+    """Print baseline vs current per scenario; False if any p95 latency regressed beyond tolerance."""
+    ok = True
+    print(f"\n{'scenario':<18}{'metric':<24}{baseline['commit']:>12}{current['commit']:>12}{'change':>10}")
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        for metric in ("throughput_per_minute", "latency_p50", "latency_p95", "latency_p99", "first_section_p50", "first_token_p50"):
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            flag = ""
+            if metric == "latency_p95" and change > tolerance:
+                flag, ok = "  REGRESSION", False
+            print(f"{name:<18}{metric:<24}{old:>12.2f}{new:>12.2f}{change:>+10.1%}{flag}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", nargs="+", choices=["pipeline", "api"], default=["pipeline"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=None, help="Requests per scenario (default: 2 x concurrency, at least 5)")
+    parser.add_argument("--proposals", type=Path, default=ROOT / "benchmarks" / "proposals.jsonl")
+    parser.add_argument("--mock-port", type=int, default=8900)
+    parser.add_argument("--api-port", type=int, default=8901)
+    parser.add_argument("--api-url", default=None, help="Benchmark an already running API instead of an in-process one")
+    parser.add_argument("--output", type=Path, default=None, help="Results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="Baseline results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p95 latency regression before failing")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    mock_config = config_from_arguments(args)
+    serve_in_thread(create_app(mock_config), args.mock_port)
+    configure_environment(args.mock_port)
+    proposals = load_proposals(args.proposals)
+
+    api_url = args.api_url
+    if "api" in args.mode and api_url is None:
+        import api
+        serve_in_thread(api.app, args.api_port)
+        api_url = f"http://127.0.0.1:{args.api_port}"
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mock": vars(mock_config),
+        "scenarios": {},
+    }
+    for mode in args.mode:
+        request = run_pipeline_request if mode == "pipeline" else (lambda proposal: run_api_request(api_url, proposal))
+        for concurrency in args.concurrency:
+            requests = args.requests or max(5, 2 * concurrency)
+            name = f"{mode}@{concurrency}"
+            print(f"Running {name} ({requests} requests)...", flush=True)
+            result = run_scenario(request, proposals, concurrency, requests)
+            results["scenarios"][name] = result
+            print("  " + ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in result.items()), flush=True)
+
+    output = args.output or RESULTS_DIR / f"{results['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())
+        if not compare(baseline, results, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,49 @@
 FastAPI backend for handling asynchronous proposal generation.
 """
 
-from typing import Dict, Optional
-from fastapi import FastAPI
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Literal, Optional
+import anyio
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from proposal_builder.agent import generate_proposal
+from pydantic import BaseModel, ValidationError
+from config import settings, prompts
+from proposal_builder import metrics
+from proposal_builder.agent import estimate_proposal, proposal_sections, reusable_sections
+from proposal_builder.batch import parse_request
+from proposal_builder.export import FORMATS, create_exporter, export_filename, export_title
+from proposal_builder.jobs import create_job_queue
+from proposal_builder.llm import warm_up
+from proposal_builder.schemas import ProposalRequest, describe_errors, request_key
+from proposal_builder.store import create_proposal_store
+from proposal_builder.worker import start_workers
 
-app = FastAPI(title="Proposal Builder API", description="Async API for proposal generation")
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open pooled LLM connections in the background so startup is not held up
+    threading.Thread(target=warm_up, args=(settings,), daemon=True).start()
+    stop_workers = None
+    if not settings.API_EMBEDDED_WORKERS and not settings.PROPOSAL_STORE_ENABLED:
+        logger.warning("PROPOSAL_STORE_ENABLED is off, so proposals are generated by workers in the API process")
+    if settings.API_EMBEDDED_WORKERS or not settings.PROPOSAL_STORE_ENABLED:
+        stop_workers = start_workers(proposal_store, job_queue, settings.MAX_CONCURRENT_PROPOSALS)
+    yield
+    if stop_workers is not None:
+        stop_workers.set()
+    exporter.shutdown()
+
+
+app = FastAPI(title="Proposal Builder API", description="Async API for proposal generation", lifespan=lifespan)
 
 # Add CORS middleware to allow Streamlit to communicate with API
 app.add_middleware(
@@ -19,37 +55,420 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for proposals - would use a DB in production
-proposals_db = {}
+# Every proposal, with its input, sections, timings and token usage
+proposal_store = create_proposal_store(settings)
+# Proposals waiting to be generated, and their stream events. Both live in
+# DATA_DIR, so any API process can serve any proposal and workers in other
+# processes or containers (proposal_builder.worker) can generate them.
+job_queue = create_job_queue(settings)
+# Renders DOCX/PDF/HTML exports in a process pool, cached in DATA_DIR/exports
+exporter = create_exporter(settings)
+
+# Job statuses after which nothing changes any more
+FINISHED_STATUSES = ("completed", "partial", "failed", "cancelled")
+# Seconds between polls of a stream's events: right after events arrived, and at most while none do
+STREAM_POLL_SECONDS = (0.1, 1.0)
+
+class ProposalResponse(BaseModel):
+    id: str
+    # partial: finished with sections left out (see error); POST /proposals/{id}/retry redoes them
+    status: str = "queued"  # queued | running | completed | partial | failed | cancelled
+    sections: Dict[str, str] = {}  # section name -> pending | completed | failed
+    # Section name -> version of the prompts it was generated from
+    prompt_versions: Dict[str, str] = {}
+    # Pre-flight forecast of LLM calls, tokens, cost and latency, made when the job is queued
+    estimate: Optional[Dict[str, Any]] = None
+    # Timings, token usage (including prompt cache hits) and retries, in total and per section
+    metrics: Optional[Dict[str, Any]] = None
+    markdown: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    id: str
+    status: str = "queued"  # queued | running | completed
+    total: int
+    completed: int = 0
+    # Finished with sections left out
+    partial: int = 0
+    failed: int = 0
+    throughput_per_minute: float = 0.0
+    proposals: Dict[str, str] = {}  # batch line id -> proposal id
 
-class ProposalRequest(BaseModel):
+class ProposalSummary(BaseModel):
+    id: str
+    status: str
     client_name: str
-    language: str
     project_name: str
     project_type: str
-    technology_focus: str
-    general_description: str
-    planning: str
-    client_stakeholders: str
-    daredata_team: str
-    client_expectations: str
-    special_conditions: str
+    language: str
+    created_at: float
+    updated_at: float
 
-class ProposalResponse(BaseModel):
-    markdown: Optional[str] = None
+class ProposalPage(BaseModel):
+    items: List[ProposalSummary]
+    # Pass as ?cursor=... for the next page; None on the last page
+    next_cursor: Optional[str] = None
 
 
-@app.post("/proposals/", response_model=ProposalResponse)
-async def create_proposal(proposal: ProposalRequest):
+@app.post("/proposals/", response_model=ProposalResponse, status_code=202)
+def create_proposal(proposal: ProposalRequest, fresh: bool = False, previous_proposal_id: Optional[str] = None):
+    """
+    Queue a proposal; pass ?fresh=true to bypass the completion cache.
+
+    A request identical to one that is still queued or running (same
+    normalized payload and parameters) returns that job instead of starting
+    another, so double-posts share one generation and one stream. Such a
+    job is only cancelled once every request attached to it cancelled it.
+
+    With ?previous_proposal_id=..., sections of that proposal whose inputs and
+    prompts did not change are reused and only the affected sections are
+    regenerated.
+    """
     # Create proposal data dictionary
     proposal_data = proposal.model_dump()
-    markdown = generate_proposal(proposal_data)
-    
+    sections = previous_sections(proposal_data, fresh, previous_proposal_id)
+    proposal_id = register_proposal(
+        proposal_data,
+        sections,
+        fresh,
+        estimate=estimate_proposal(proposal_data, sections, fresh),
+        key=request_key(proposal_data, fresh=fresh, previous_proposal_id=previous_proposal_id),
+    )
+    return find_proposal(proposal_id)
+
+
+@app.post("/proposals/estimate")
+def estimate(proposal: ProposalRequest, fresh: bool = False, previous_proposal_id: Optional[str] = None):
+    """
+    Forecast the LLM calls, prompt/completion tokens, cost and latency of a
+    proposal without generating it. Takes the same parameters as POST /proposals/.
+    """
+    proposal_data = proposal.model_dump()
+    sections = previous_sections(proposal_data, fresh, previous_proposal_id)
+    return estimate_proposal(proposal_data, sections, fresh)
+
+
+def previous_sections(proposal_data: dict, fresh: bool, previous_proposal_id: Optional[str]) -> dict:
+    """Sections of the previous proposal that the new one can reuse."""
+    if previous_proposal_id is None:
+        return {}
+    stored = proposal_store.get(previous_proposal_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Previous proposal not found")
+    if fresh:
+        return {}
+    return reusable_sections(
+        stored["input"],
+        proposal_store.sections(previous_proposal_id),
+        proposal_data,
+        stored["prompt_versions"],
+    )
+
+
+def register_proposal(
+    proposal_data: dict,
+    sections: dict,
+    fresh: bool = False,
+    estimate: Optional[dict] = None,
+    key: Optional[str] = None,
+    batch_id: Optional[str] = None,
+) -> str:
+    """
+    Store a queued proposal, with the sections it reuses, and queue it for a
+    worker. Returns its id, or that of the queued or running job with the same
+    key, which the request is attached to instead.
+    """
+    proposal_id = uuid.uuid4().hex
+    positions = {name: i for i, name in enumerate(proposal_sections(proposal_data))}
+    proposal_store.save({"id": proposal_id, "status": "queued", "estimate": estimate}, proposal_data, sections, positions)
+    job_id = job_queue.enqueue(proposal_id, {"proposal_data": proposal_data, "fresh": fresh}, key=key, batch_id=batch_id)
+    if job_id != proposal_id:
+        proposal_store.delete(proposal_id)
+    return job_id
+
+
+def find_proposal(proposal_id: str) -> ProposalResponse:
+    """A proposal as stored so far; 404 when there is none."""
+    stored = proposal_store.get(proposal_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Proposal not found")
+    failed = (stored["metrics"] or {}).get("failed_sections", {})
     return ProposalResponse(
-        markdown=markdown,
+        id=proposal_id,
+        status=stored["status"],
+        sections={
+            name: "completed" if name in stored["section_names"] else "failed" if name in failed else "pending"
+            for name in proposal_sections(stored["input"])
+        },
+        prompt_versions=stored["prompt_versions"],
+        estimate=stored["estimate"],
+        metrics=stored["metrics"],
+        markdown=stored["markdown"],
+        error=stored["error"],
     )
 
 
+@app.post("/proposals/batch", response_model=BatchResponse, status_code=202)
+async def create_batch(request: Request, concurrency: Optional[int] = None, fresh: bool = False):
+    """
+    Queue a batch from a JSONL body with one ProposalRequest per line (an
+    optional "id" per line names it in the batch).
+
+    Every line becomes a regular proposal job, available on /proposals/{id}
+    and its stream; ?concurrency=... bounds how many run at the same time
+    (default and maximum MAX_CONCURRENT_PROPOSALS).
+    """
+    # The body is parsed as it arrives, and every line is validated before anything is queued
+    items = []
+    seen = set()
+    buffer = b""
+    number = 0
+
+    def add(line: bytes) -> None:
+        if not line.strip():
+            return
+        try:
+            item_id, data = parse_request(line.decode("utf-8"), number)
+            proposal = ProposalRequest(**data)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Line {number}: {describe_errors(e)}")
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=422, detail=f"Line {number}: {e}")
+        if item_id in seen:
+            raise HTTPException(status_code=422, detail=f"Line {number}: duplicate id {item_id}")
+        seen.add(item_id)
+        items.append((item_id, proposal.model_dump()))
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            add(line)
+    number += 1
+    add(buffer)
+    if not items:
+        raise HTTPException(status_code=422, detail="Empty batch")
+
+    limit = min(concurrency or settings.MAX_CONCURRENT_PROPOSALS, settings.MAX_CONCURRENT_PROPOSALS)
+    if limit < 1:
+        raise HTTPException(status_code=422, detail="concurrency must be at least 1")
+    return await run_in_threadpool(queue_batch, items, limit, fresh)
+
+
+def queue_batch(items: list[tuple[str, dict]], limit: int, fresh: bool) -> BatchResponse:
+    batch_id = uuid.uuid4().hex
+    proposal_ids = {item_id: register_proposal(data, {}, fresh, batch_id=batch_id) for item_id, data in items}
+    # Jobs of a batch are only leased once the batch exists, so none starts before every line is queued
+    job_queue.create_batch(batch_id, proposal_ids, limit)
+    return find_batch(batch_id)
+
+
+def find_batch(batch_id: str) -> BatchResponse:
+    batch = job_queue.batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    counts = batch["counts"]
+    total = len(batch["jobs"])
+    completed = counts.get("completed", 0)
+    partial = counts.get("partial", 0)
+    failed = counts.get("failed", 0) + counts.get("cancelled", 0)
+    if completed + partial + failed == total:
+        status = "completed"
+    elif completed or partial or failed or counts.get("leased"):
+        status = "running"
+    else:
+        status = "queued"
+    elapsed = (batch["finished_at"] if status == "completed" else time.time()) - batch["created_at"]
+    return BatchResponse(
+        id=batch_id,
+        status=status,
+        total=total,
+        completed=completed,
+        partial=partial,
+        failed=failed,
+        throughput_per_minute=completed / elapsed * 60 if elapsed > 0 else 0.0,
+        proposals=batch["jobs"],
+    )
+
+
+@app.get("/proposals/batch/{batch_id}", response_model=BatchResponse)
+def get_batch(batch_id: str):
+    return find_batch(batch_id)
+
+
+@app.get("/proposals/", response_model=ProposalPage)
+def list_proposals(
+    client_name: Optional[str] = None,
+    project_type: Optional[str] = None,
+    language: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    """
+    Stored proposals, newest first, optionally filtered by client (ignoring
+    case), project type, language or status. Pages are fetched by passing
+    the previous page's next_cursor.
+    """
+    try:
+        items, next_cursor = proposal_store.list(
+            limit=limit,
+            cursor=cursor,
+            client_name=client_name,
+            project_type=project_type,
+            language=language,
+            status=status,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return ProposalPage(items=items, next_cursor=next_cursor)
+
+
+@app.get("/proposals/{proposal_id}", response_model=ProposalResponse)
+def get_proposal(proposal_id: str):
+    return find_proposal(proposal_id)
+
+
+@app.post("/proposals/{proposal_id}/cancel", response_model=ProposalResponse, status_code=202)
+def cancel_proposal(proposal_id: str):
+    """
+    Cancel a queued or running proposal. A running one stops its LLM requests
+    within a second or so and ends as cancelled, keeping the sections that
+    were already finished. A proposal that identical requests are attached
+    to goes on until the last of them cancels it.
+    """
+    stored = proposal_store.get(proposal_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Proposal not found")
+    if stored["status"] in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Proposal is already {stored['status']}")
+    cancel_job(proposal_id)
+    return find_proposal(proposal_id)
+
+
+def cancel_job(proposal_id: str) -> None:
+    """Cancel a proposal's job on behalf of one request; one that was still queued is marked cancelled at once."""
+    if job_queue.cancel(proposal_id) == "queued":
+        proposal_store.update(proposal_id, status="cancelled", error="Cancelled")
+
+
+@app.post("/proposals/{proposal_id}/retry", response_model=ProposalResponse, status_code=202)
+def retry_proposal(proposal_id: str):
+    """
+    Queue a new proposal from a partial, failed or cancelled one, reusing its
+    finished sections so only the missing ones are generated.
+    """
+    stored = proposal_store.get(proposal_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Proposal not found")
+    if stored["status"] not in ("partial", "failed", "cancelled"):
+        raise HTTPException(status_code=409, detail=f"Proposal is {stored['status']}; only partial, failed or cancelled proposals are retried")
+    return create_proposal(ProposalRequest(**stored["input"]), previous_proposal_id=proposal_id)
+
+
+@app.get("/proposals/{proposal_id}/export")
+async def export_proposal(
+    proposal_id: str,
+    format: Literal["docx", "pdf", "html"] = "docx",
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """
+    A completed proposal as a DOCX, PDF or HTML download. Files are rendered
+    in the export process pool and cached by content hash; the hash is the
+    ETag, so clients that send If-None-Match get a 304 once they have it.
+    """
+    stored = await run_in_threadpool(proposal_store.get, proposal_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Proposal not found")
+    if stored["status"] not in ("completed", "partial"):
+        raise HTTPException(status_code=409, detail=f"Proposal is {stored['status']}, not completed")
+
+    title = export_title(stored["input"])
+    etag = f'"{exporter.key(stored["markdown"], format, title)}"'
+    headers = {
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="{export_filename(stored["input"], format)}"',
+    }
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    # Starting the pool and reading a cached file are blocking, so they run off the event loop too
+    future = await run_in_threadpool(exporter.export, stored["markdown"], format, title)
+    content = await asyncio.wrap_future(future)
+    return Response(content, media_type=FORMATS[format][0], headers=headers)
+
+
+@app.get("/proposals/{proposal_id}/stream")
+async def stream_proposal(proposal_id: str, cancel_on_disconnect: bool = False):
+    """
+    Server-Sent Events stream of a proposal: a `section` event with its position
+    in the proposal as each section finishes, `token` events as LLM output
+    arrives, a `section_failed` event for each section left out, and a final
+    `done` event carrying the job status.
+
+    With ?cancel_on_disconnect=true the proposal is cancelled if the client
+    goes away before it finishes, so its remaining LLM calls are not made,
+    unless other requests are still attached to it.
+    """
+    job = await run_in_threadpool(find_proposal, proposal_id)
+    positions = {name: i for i, name in enumerate(job.sections)}
+
+    async def event_stream():
+        yield format_event("status", {"status": job.status, "sections": list(job.sections)})
+        # Events are published by the worker generating the proposal, in whichever process it runs.
+        # They are polled off the event loop, less often while none arrive.
+        sent = 0
+        status, error = job.status, job.error
+        finished = False
+        delay = STREAM_POLL_SECONDS[0]
+        try:
+            while True:
+                finished = status in FINISHED_STATUSES
+                events = await run_in_threadpool(job_queue.events, proposal_id, sent)
+                for sent, event, data in events:
+                    yield format_event(event, data)
+                if finished:
+                    break
+                delay = STREAM_POLL_SECONDS[0] if events else min(delay * 2, STREAM_POLL_SECONDS[1])
+                await asyncio.sleep(delay)
+                state = await run_in_threadpool(proposal_store.state, proposal_id)
+                # The response has started, so a proposal deleted meanwhile ends the stream instead of a 404
+                status, error = state if state is not None else ("failed", "Proposal not found")
+        finally:
+            # Runs when the client disconnects mid-stream, too; shielded from that cancellation
+            if cancel_on_disconnect and not finished:
+                with anyio.CancelScope(shield=True):
+                    await run_in_threadpool(cancel_job, proposal_id)
+        if sent == 0:
+            # Finished long enough ago for its events to be gone: replay the stored sections
+            stored_sections = await run_in_threadpool(proposal_store.sections, proposal_id)
+            for name, content in stored_sections.items():
+                yield format_event("section", {"section": name, "position": positions.get(name, 0), "content": content})
+        yield format_event("done", {"status": status, "error": error})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/prompts")
+async def get_prompt_versions():
+    """Current version (content hash) of every prompt file."""
+    return prompts.versions()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """LLM call latency, token and retry metrics in Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health_check():
     return {"status: ok"}
@@ -57,4 +476,4 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
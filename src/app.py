@@ -2,19 +2,87 @@
 Main application entry point for the Proposal Builder.
 Handles the Streamlit UI and integrates with the simplified API.
 """
+import logging
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from streamlit_helpers import (
     setup_page_config,
     apply_styles,
     render_proposal_form,
     render_footer
 )
-from proposal_builder.agent import generate_proposal
+from config import settings
+from proposal_builder.agent import (
+    GenerationCancelled,
+    assemble_proposal,
+    describe_failures,
+    example_library,
+    generate_sections,
+    prompt_versions,
+    proposal_sections,
+    reusable_sections,
+)
+from proposal_builder.export import FORMATS, create_exporter, export_filename, export_title
+from proposal_builder.llm import warm_up
+from proposal_builder.pregeneration import Pregenerator
+from proposal_builder.schemas import request_key
+
+logger = logging.getLogger(__name__)
+
+# Pre-generated section group -> label shown under the form
+PREGENERATION_LABELS = {
+    "project_description": "Description and summary",
+    "timeline_planning": "Timeline",
+    "stakeholders_and_team": "Stakeholders and team",
+    "requirements": "Requirements",
+}
+
+# How often a generation checks that the browser session that started it is still open
+SESSION_POLL_SECONDS = 1.0
+
+@st.cache_resource
+def warm_up_llm():
+    """Open pooled LLM connections once per server process, in the background."""
+    threading.Thread(target=warm_up, args=(settings,), daemon=True).start()
+
+@st.cache_resource
+def pregeneration_executor():
+    """Threads that pre-generate sections, shared by every session of this server process."""
+    return ThreadPoolExecutor(
+        max_workers=settings.MAX_CONCURRENT_PROPOSALS * settings.MAX_CONCURRENT_SECTIONS,
+        thread_name_prefix="pregenerate",
+    )
+
+@st.cache_resource
+def proposal_exporter():
+    """DOCX/PDF/HTML renderer processes, shared by every session of this server process."""
+    return create_exporter(settings)
+
+def pregenerate(form_data):
+    """Start generating the sections whose inputs are filled in (form on_change callback)."""
+    fresh = st.session_state.get("regenerate_fresh", False)
+    st.session_state["pregenerator"].update(form_data, fresh)
+
+@st.fragment(run_every=2)
+def render_pregeneration_status():
+    """One line on the sections already being written in the background."""
+    statuses = st.session_state["pregenerator"].status()
+    if statuses:
+        icons = {"waiting": "✏️", "running": "⏳", "ready": "✅", "failed": "⚠️"}
+        st.caption("Drafted while you type: " + " · ".join(
+            f"{icons[status]} {PREGENERATION_LABELS[group]}" for group, status in statuses.items()
+        ))
 
 def main():
     """Main application function"""
     # Configure the page
     setup_page_config()
+    warm_up_llm()
    
     # Apply custom styling
     apply_styles()
@@ -29,9 +97,25 @@ def main():
         st.session_state["proposal_markdown"] = ""
     if "last_proposal_data" not in st.session_state:
         st.session_state["last_proposal_data"] = {}
+    if "proposal_sections" not in st.session_state:
+        st.session_state["proposal_sections"] = {}
+    if "proposal_prompt_versions" not in st.session_state:
+        st.session_state["proposal_prompt_versions"] = {}
+    if "proposal_failures" not in st.session_state:
+        st.session_state["proposal_failures"] = {}
+    if "pregenerator" not in st.session_state:
+        pregenerator = st.session_state["pregenerator"] = Pregenerator(
+            pregeneration_executor(), settings.PREGENERATE_DEBOUNCE_SECONDS
+        )
+        # Background drafts of a closed session are stopped with it
+        threading.Thread(
+            target=watch_session, args=(get_script_run_ctx().session_id, pregenerator.cancel, threading.Event()), daemon=True
+        ).start()
     
     # Always show the form (whether or not a proposal has been generated)
-    proposal_data, submitted = render_proposal_form()
+    proposal_data, submitted = render_proposal_form(on_change=pregenerate if settings.PREGENERATE_SECTIONS else None)
+    if settings.PREGENERATE_SECTIONS:
+        render_pregeneration_status()
     
     # Handle form submission
     if submitted:
@@ -48,6 +132,8 @@ def main():
             if st.button("Clear Results", type="secondary"):
                 st.session_state["proposal_generated"] = False
                 st.session_state["proposal_markdown"] = ""
+                st.session_state["proposal_sections"] = {}
+                st.session_state["proposal_failures"] = {}
                 st.rerun()
    
     # Render footer
@@ -55,29 +141,152 @@ def main():
 
 def generate_and_display_proposal(proposal_data):
     """
-    Submit proposal to the API and display results
+    Generate the proposal, rendering each section as soon as it is ready
    
     Args:
         proposal_data: Dictionary containing proposal form data
     """
-    with st.spinner("Generating proposal... This may take a moment."):
+    fresh = st.session_state.get("regenerate_fresh", False)
+
+    # Sections generated for the previous submission (including ones finished
+    # before an interrupted rerun) are reused unless their inputs or prompts changed
+    if fresh:
+        sections = {}
+    else:
+        sections = reusable_sections(
+            st.session_state["last_proposal_data"],
+            st.session_state["proposal_sections"],
+            proposal_data,
+            st.session_state["proposal_prompt_versions"],
+        )
+    # Sections pre-generated while the form was filled in; those still being
+    # written are joined by the identical calls generate_sections makes
+    sections.update(st.session_state["pregenerator"].sections(proposal_data, fresh))
+    st.session_state["proposal_sections"] = sections
+    st.session_state["last_proposal_data"] = proposal_data
+    st.session_state["proposal_prompt_versions"] = prompt_versions(proposal_data)
+
+    st.markdown("---")
+    st.info("Generating proposal... Sections appear below as soon as they are ready.")
+    placeholders = {name: st.empty() for name in proposal_sections(proposal_data)}
+
+    # Generation runs in a background thread; the script thread only renders its events
+    events = queue.Queue()
+    failures = {}
+    # Set when the browser session goes away, to stop the LLM calls nobody will see
+    cancel = threading.Event()
+    finished = threading.Event()
+
+    def on_failure(name, reason):
+        failures[name] = reason
+        events.put(("failed", name, reason))
+
+    def generate():
         try:
-            # Submit to API
-            #response = requests.post(f"{API_URL}/proposals/", json=proposal_data)
-            #response.raise_for_status()
-            #proposal_info = response.json()
-           
-            # Store the markdown and proposal data
-            #markdown_content = proposal_info.get("markdown", "")
-            markdown_content = generate_proposal(proposal_data)
-            st.session_state["proposal_markdown"] = markdown_content
-            st.session_state["last_proposal_data"] = proposal_data
-            st.session_state["proposal_generated"] = True
-           
-            # Force a rerun to display the proposal
-            st.rerun()
+            generate_sections(
+                proposal_data,
+                on_section=lambda name, content: events.put(("section", name, content)),
+                on_token=lambda name, token: events.put(("token", name, token)),
+                on_failure=on_failure,
+                sections=sections,
+                fresh=fresh,
+                cancel=cancel,
+            )
+            events.put(("done", None, None))
+        except GenerationCancelled as e:
+            logger.info("Proposal generation cancelled: the session was closed")
+            # Releases the script thread, which may still be waiting for events
+            events.put(("error", None, e))
         except Exception as e:
-            st.error(f"Error generating proposal: {str(e)}")
+            events.put(("error", None, e))
+        finally:
+            finished.set()
+
+    threading.Thread(target=generate, daemon=True).start()
+    threading.Thread(target=watch_session, args=(get_script_run_ctx().session_id, cancel.set, finished), daemon=True).start()
+
+    try:
+        render_section_events(events, placeholders)
+
+        st.session_state["proposal_markdown"] = assemble_proposal(sections)
+        st.session_state["proposal_generated"] = True
+        st.session_state["proposal_failures"] = failures
+        # Later proposals can use this one as an example; embedding it must not hold up the rerun
+        if not failures:
+            threading.Thread(
+                target=index_proposal, args=(request_key(proposal_data, fresh=fresh), proposal_data, dict(sections)), daemon=True
+            ).start()
+       
+        # Force a rerun to display the proposal
+        st.rerun()
+    except RuntimeError as e:
+        st.error(f"Error generating proposal: {str(e)}")
+
+def watch_session(session_id, on_close, finished):
+    """
+    Call on_close() once the browser session is gone (tab closed or
+    disconnected for good), unless `finished` is set first. Used to cancel
+    generations nobody will see; reruns of a live session keep them going,
+    so their sections can still be reused by the next submission.
+    """
+    while not finished.wait(SESSION_POLL_SECONDS):
+        # No runtime when the script is run outside a server, e.g. in AppTest
+        if runtime.exists() and not runtime.get_instance().is_active_session(session_id):
+            on_close()
+            return
+
+def index_proposal(proposal_id, proposal_data, sections):
+    """Add a finished proposal to the example index, logging rather than raising on failure."""
+    try:
+        example_library.add_proposals([(f"app:{proposal_id}", proposal_data, sections)])
+    except Exception:
+        logger.exception("Could not add the proposal to the example index")
+
+def render_section_events(events, placeholders):
+    """
+    Render generation events into their section placeholders until generation ends.
+
+    Tokens are streamed with st.write_stream one section at a time; events for
+    other sections that arrive meanwhile are held back and replayed right after,
+    so every section catches up instantly once it gets its turn.
+
+    Args:
+        events: Queue of (kind, section, payload) events from the generation thread
+        placeholders: Section name -> st.empty() placeholder, in proposal order
+    """
+    backlog = deque()
+
+    def next_event():
+        return backlog.popleft() if backlog else events.get()
+
+    def section_tokens(name, first_token):
+        deferred = []
+        yield first_token
+        while True:
+            event = next_event()
+            kind, section, payload = event
+            if section == name and kind == "token":
+                yield payload
+                continue
+            deferred.append(event)
+            if section == name or kind in ("done", "error"):
+                break
+        backlog.extendleft(reversed(deferred))
+
+    while True:
+        kind, name, payload = next_event()
+        if kind == "done":
+            return
+        if kind == "error":
+            raise RuntimeError(str(payload)) from payload
+        if kind == "section":
+            placeholders[name].markdown(payload)
+        elif kind == "failed":
+            title = name.replace("_", " ").capitalize()
+            placeholders[name].warning(f"{title} was not generated ({payload}).")
+        elif kind == "token":
+            with placeholders[name].container():
+                st.write_stream(section_tokens(name, payload))
 
 def display_results(markdown_content):
     """
@@ -87,12 +296,53 @@ def display_results(markdown_content):
         markdown_content: The markdown content of the proposal
     """
     # Display success message
-    st.success("Proposal generated successfully! You can modify the form above and regenerate if needed.")
+    failures = st.session_state["proposal_failures"]
+    if failures:
+        st.warning(
+            describe_failures(failures)
+            + ". Click Generate Proposal again to retry them; the finished sections are kept."
+        )
+    else:
+        st.success("Proposal generated successfully! You can modify the form above and regenerate if needed.")
    
     # Display in a container with styling
     st.markdown('<div class="result-container">', unsafe_allow_html=True)
     st.markdown(markdown_content)
     st.markdown('</div>', unsafe_allow_html=True)
 
+    render_downloads(markdown_content, st.session_state["last_proposal_data"])
+
+def render_downloads(markdown_content, proposal_data):
+    """
+    Buttons for the proposal as DOCX, PDF and HTML. A file is only rendered
+    once its "Prepare" button is clicked, in the export processes; it is
+    cached on disk, so later reruns only read it back.
+    """
+    exporter = proposal_exporter()
+    title = export_title(proposal_data)
+    for column, format in zip(st.columns(len(FORMATS)), FORMATS):
+        with column:
+            # Prepared files are remembered by their export key, so a regenerated proposal needs preparing again
+            key = exporter.key(markdown_content, format, title)
+            prepared = st.session_state.setdefault("prepared_exports", {})
+            if prepared.get(format) != key:
+                if not st.button(f"Prepare {format.upper()}", key=f"prepare_{format}"):
+                    continue
+                prepared[format] = key
+            try:
+                with st.spinner(f"Rendering {format.upper()}..."):
+                    data = exporter.export(markdown_content, format, title).result()
+            except Exception as e:
+                prepared.pop(format, None)
+                st.error(f"{format.upper()} export failed: {e}")
+                continue
+            st.download_button(
+                f"Download {format.upper()}",
+                data=data,
+                file_name=export_filename(proposal_data, format),
+                mime=FORMATS[format][0],
+                key=f"download_{format}",
+            )
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
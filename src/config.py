@@ -1,23 +1,60 @@
 import os
-import streamlit as st
+import sys
+from dotenv import load_dotenv
 
-from proposal_builder.helpers import read_prompt
+from proposal_builder.prompt_registry import PromptRegistry
 from pathlib import Path
 
+# Read once, at import; values already in the environment take precedence
+load_dotenv()
+
+def streamlit_secrets():
+    """
+    st.secrets when running inside a Streamlit app, otherwise None.
+
+    Streamlit is only looked up if the process already imported it, so the API,
+    batch runs and workers never pay for importing it.
+    """
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return None
+    from streamlit import runtime
+    if not runtime.exists():
+        return None
+    return st.secrets
+
 def get_setting(key: str, default: str = None):
     """
     Get a setting from Streamlit secrets, environment variables, or default value
     Priority: Streamlit secrets > Environment variables > Default
     """
-    try:
-        # Try Streamlit secrets first (production)
-        return st.secrets[key]
-    except:
-        # Fall back to environment variables (local development)
-        from dotenv import load_dotenv
-        load_dotenv()
-        
-        return os.getenv(key, default)
+    secrets = streamlit_secrets()
+    if secrets is not None:
+        try:
+            # Try Streamlit secrets first (production)
+            return secrets[key]
+        except Exception:
+            # No secrets file, or the key is not in it
+            pass
+    # Fall back to environment variables (local development)
+    return os.getenv(key, default)
+
+def parse_limits(value) -> dict[str, int]:
+    """
+    Per-name integer settings written as "name:value,name:value" (or a table
+    in Streamlit secrets)
+    """
+    if isinstance(value, dict):
+        return {name: int(limit) for name, limit in value.items()}
+    limits = {}
+    for item in (value or "").split(","):
+        if item.strip():
+            name, limit = item.split(":")
+            limits[name.strip()] = int(limit)
+    return limits
+
+DIR = Path(__file__).parent
+PROMPTS_PATH = DIR / "proposal_builder" / "prompts"
 
 # Simple settings class (optional - keeps your existing usage pattern)
 class Settings:
@@ -28,22 +65,103 @@ class Settings:
     OPENAI_API_KEY = get_setting("OPENAI_API_KEY")
     OPENAI_API_VERSION = get_setting("OPENAI_API_VERSION")
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT = get_setting("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+    # Past proposal excerpts added to the description and timeline prompts as examples (0 = off),
+    # their length, and the cosine similarity below which they are not used
+    EXAMPLES_TOP_K = int(get_setting("EXAMPLES_TOP_K", "2"))
+    EXAMPLE_MAX_TOKENS = int(get_setting("EXAMPLE_MAX_TOKENS", "300"))
+    EXAMPLES_MIN_SIMILARITY = float(get_setting("EXAMPLES_MIN_SIMILARITY", "0.3"))
+    # Ask for token usage on streamed completions (needs API version 2024-09-01-preview or later)
+    AZURE_OPENAI_STREAM_USAGE = get_setting("AZURE_OPENAI_STREAM_USAGE", "true").lower() == "true"
+    # Retries of a chat completion on rate limits, connection and server errors
+    LLM_MAX_RETRIES = int(get_setting("LLM_MAX_RETRIES", "2"))
+    # Deployment quotas enforced client-side before every call (0 = no limit)
+    AZURE_OPENAI_RPM = int(get_setting("AZURE_OPENAI_RPM", "0"))
+    AZURE_OPENAI_TPM = int(get_setting("AZURE_OPENAI_TPM", "0"))
+    # Completion tokens reserved per call until its real usage is known
+    RATE_LIMIT_COMPLETION_TOKENS = int(get_setting("RATE_LIMIT_COMPLETION_TOKENS", "1000"))
+    # Share the quota with every process using DATA_DIR, not just this one
+    RATE_LIMIT_SHARED = get_setting("RATE_LIMIT_SHARED", "true").lower() == "true"
+    # HTTP transport of the LLM client, shared by every call in the process
+    LLM_MAX_CONNECTIONS = int(get_setting("LLM_MAX_CONNECTIONS", "32"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(get_setting("LLM_MAX_KEEPALIVE_CONNECTIONS", "16"))
+    LLM_KEEPALIVE_SECONDS = float(get_setting("LLM_KEEPALIVE_SECONDS", "120"))
+    # Needs the optional h2 package (pip install httpx[http2])
+    LLM_HTTP2 = get_setting("LLM_HTTP2", "false").lower() == "true"
+    LLM_CONNECT_TIMEOUT = float(get_setting("LLM_CONNECT_TIMEOUT", "5"))
+    LLM_READ_TIMEOUT = float(get_setting("LLM_READ_TIMEOUT", "120"))
+    # Connections opened when the app or API starts
+    LLM_WARMUP_CONNECTIONS = int(get_setting("LLM_WARMUP_CONNECTIONS", "2"))
+    # Upper bound on concurrent LLM calls made for a single proposal
+    MAX_CONCURRENT_SECTIONS = int(get_setting("MAX_CONCURRENT_SECTIONS", "4"))
+    # Upper bound on proposals generated at the same time by the API or by each worker process
+    MAX_CONCURRENT_PROPOSALS = int(get_setting("MAX_CONCURRENT_PROPOSALS", "4"))
+    # Streamlit app: generate sections in the background as soon as their form fields are filled in
+    PREGENERATE_SECTIONS = get_setting("PREGENERATE_SECTIONS", "true").lower() == "true"
+    # Seconds a section's inputs must stay unchanged before it is generated in the background
+    PREGENERATE_DEBOUNCE_SECONDS = float(get_setting("PREGENERATE_DEBOUNCE_SECONDS", "2"))
+    # Let the API process generate queued proposals itself; turn off when dedicated workers run
+    API_EMBEDDED_WORKERS = get_setting("API_EMBEDDED_WORKERS", "true").lower() == "true"
+    # Job queue: lease renewed by heartbeats, leases of a job before giving up, idle polling interval
+    JOB_LEASE_SECONDS = float(get_setting("JOB_LEASE_SECONDS", "30"))
+    JOB_MAX_ATTEMPTS = int(get_setting("JOB_MAX_ATTEMPTS", "3"))
+    JOB_POLL_SECONDS = float(get_setting("JOB_POLL_SECONDS", "0.5"))
+    # Chunks of the MLOps and DevOps frameworks sent with the project description, besides their
+    # introductions, picked by BM25 against the description and technology focus (0 = whole documents)
+    REFERENCE_CHUNKS = int(get_setting("REFERENCE_CHUNKS", "4"))
+    # Output cap per section, as max_tokens on its calls (0 = uncapped)
+    SECTION_MAX_TOKENS = parse_limits(get_setting(
+        "SECTION_MAX_TOKENS",
+        "executive_summary:1000,project_description:4000,timeline_planning:2000,stakeholders_and_team:800,requirements:400",
+    ))
+    # Seconds a section may take, all of its LLM calls included, before it is left out of the
+    # proposal as failed (0 = no limit), with per-section overrides as "section:seconds,..."
+    SECTION_TIMEOUT_SECONDS = float(get_setting("SECTION_TIMEOUT_SECONDS", "180"))
+    SECTION_TIMEOUTS = parse_limits(get_setting("SECTION_TIMEOUTS", "project_description:300"))
+    # Seconds a whole proposal may take; sections still running then are left out (0 = no limit)
+    PROPOSAL_TIMEOUT_SECONDS = float(get_setting("PROPOSAL_TIMEOUT_SECONDS", "420"))
+    # Estimated prompt size above which reference frameworks, then client text, are trimmed
+    PROMPT_TOKEN_BUDGET = int(get_setting("PROMPT_TOKEN_BUDGET", "12000"))
+    # Pre-flight estimates: generation speed and price per 1000 tokens of the deployment
+    ESTIMATE_TIME_TO_FIRST_TOKEN = float(get_setting("ESTIMATE_TIME_TO_FIRST_TOKEN", "1.0"))
+    ESTIMATE_TOKENS_PER_SECOND = float(get_setting("ESTIMATE_TOKENS_PER_SECOND", "50"))
+    PROMPT_PRICE_PER_1K_TOKENS = float(get_setting("PROMPT_PRICE_PER_1K_TOKENS", "0.0025"))
+    COMPLETION_PRICE_PER_1K_TOKENS = float(get_setting("COMPLETION_PRICE_PER_1K_TOKENS", "0.01"))
+    # Fold the Gen-OS guidance into the first project description call instead of refining the draft
+    GENOS_SINGLE_PASS = get_setting("GENOS_SINGLE_PASS", "false").lower() == "true"
+    # Re-read prompt files edited while the process runs, checking each at most every PROMPT_RELOAD_SECONDS
+    PROMPT_HOT_RELOAD = get_setting("PROMPT_HOT_RELOAD", "true").lower() == "true"
+    PROMPT_RELOAD_SECONDS = float(get_setting("PROMPT_RELOAD_SECONDS", "2"))
+    # Local state (completion cache, ...) shared by the app and API processes
+    DATA_DIR = Path(get_setting("DATA_DIR", str(DIR.parent / "data")))
+    COMPLETION_CACHE_ENABLED = get_setting("COMPLETION_CACHE_ENABLED", "true").lower() == "true"
+    COMPLETION_CACHE_TTL_SECONDS = int(get_setting("COMPLETION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    COMPLETION_CACHE_MEMORY_ENTRIES = int(get_setting("COMPLETION_CACHE_MEMORY_ENTRIES", "256"))
+    COMPLETION_CACHE_MAX_MB = int(get_setting("COMPLETION_CACHE_MAX_MB", "100"))
+    # Keep every proposal the API generates in DATA_DIR/proposals.sqlite3 (otherwise in memory only)
+    PROPOSAL_STORE_ENABLED = get_setting("PROPOSAL_STORE_ENABLED", "true").lower() == "true"
+    # Processes rendering DOCX/PDF/HTML exports, and the size of DATA_DIR/exports before old files are removed
+    EXPORT_PROCESSES = int(get_setting("EXPORT_PROCESSES", "2"))
+    EXPORT_CACHE_MAX_MB = int(get_setting("EXPORT_CACHE_MAX_MB", "200"))
 
-DIR = Path(__file__).parent
-PROMPTS_PATH = DIR / "proposal_builder" / "prompts"
-
-class Prompts:
-    SYSTEM_PROMPT = read_prompt( PROMPTS_PATH / "system_prompt.txt")
-    PROJECT_DESCRIPTION = read_prompt( PROMPTS_PATH / "project_description.txt") 
-    EXECUTIVE_SUMMARY = read_prompt( PROMPTS_PATH / "executive_summary.txt") 
-    TIMELINE_AND_PLANNING_GENOS = read_prompt( PROMPTS_PATH / "timeline_and_planning_GENOS.txt") 
-    TIMELINE_AND_PLANNING_COCREATION = read_prompt( PROMPTS_PATH / "timeline_and_planning_CoCreation.txt") 
-    TIMELINE_AND_PLANNING_CLOSED_PROJECT = read_prompt( PROMPTS_PATH / "timeline_and_planning_ClosedProject.txt") 
-    STAKEHOLDERS_AND_TEAM = read_prompt( PROMPTS_PATH / "stakeholders_and_team.txt")
-    REQUIREMENTS_AND_PRICING = read_prompt( PROMPTS_PATH / "requirements_and_pricing.txt")     
-    GENOS = read_prompt( PROMPTS_PATH / "gen_os.txt")       
-    MLOPS = read_prompt( PROMPTS_PATH / "mlops.txt")
-    DEV_OPS = read_prompt( PROMPTS_PATH / "devops.txt")
+# Prompt name -> file in PROMPTS_PATH
+PROMPT_FILES = {
+    "SYSTEM_PROMPT": "system_prompt.txt",
+    "PROJECT_DESCRIPTION": "project_description.txt",
+    "EXECUTIVE_SUMMARY": "executive_summary.txt",
+    "TIMELINE_AND_PLANNING_GENOS": "timeline_and_planning_GENOS.txt",
+    "TIMELINE_AND_PLANNING_COCREATION": "timeline_and_planning_CoCreation.txt",
+    "TIMELINE_AND_PLANNING_CLOSED_PROJECT": "timeline_and_planning_ClosedProject.txt",
+    "STAKEHOLDERS_AND_TEAM": "stakeholders_and_team.txt",
+    "REQUIREMENTS_AND_PRICING": "requirements_and_pricing.txt",
+    "GENOS": "gen_os.txt",
+    "MLOPS": "mlops.txt",
+    "DEV_OPS": "devops.txt",
+    "EXAMPLES": "examples.txt",
+}
 
 settings = Settings()
-prompts = Prompts()
\ No newline at end of file
+prompts = PromptRegistry(
+    PROMPTS_PATH,
+    PROMPT_FILES,
+    reload_interval=settings.PROMPT_RELOAD_SECONDS if settings.PROMPT_HOT_RELOAD else None,
+)
@@ -1,33 +1,723 @@
+import hashlib
 import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator
+import httpx
+import openai
 from config import settings, prompts
-from proposal_builder.llm import create_llm
+from proposal_builder import metrics, templates
+from proposal_builder.cache import create_completion_cache
+from proposal_builder.examples import create_example_library
+from proposal_builder.budget import (
+    CHARS_PER_TOKEN,
+    call_estimate,
+    estimate_text_tokens,
+    estimate_tokens,
+    fit_references,
+    section_max_tokens,
+    summarize_estimates,
+    truncate_to_tokens,
+)
+from proposal_builder.llm import backoff_delay, create_rate_limiter, get_llm, retry_after
+from proposal_builder.references import ReferenceLibrary
+from proposal_builder.singleflight import Flight, SingleFlight
 
-LLM = create_llm(settings)
+completion_cache = create_completion_cache(settings)
+# LLM calls are made in worker processes; /metrics on any API process reports them all
+metrics.share(settings.DATA_DIR / "metrics")
+rate_limiter = create_rate_limiter(settings)
+completions_in_flight = SingleFlight()
+# Past proposal sections, retrieved as examples for the description and timeline prompts
+example_library = create_example_library(settings)
+# Chunk indexes of the MLOps and DevOps frameworks, of which only the relevant parts are sent
+reference_library = ReferenceLibrary(prompts, ["MLOPS", "DEV_OPS"], settings.REFERENCE_CHUNKS)
 
-def generate_proposal(data: dict) -> str:
-    project_desc = generate_project_description(data)
-    timeline_planning = generate_timeline_planning(data)
-    stakeholders_and_team = generate_stakeholders_and_team(data)
-    requirements = generate_requirements(data)
-    work_agreement = generate_work_agreement(data)
-    exc_summ = generate_executive_summary(data, project_desc)
+# Sections in the order they appear in the final proposal
+SECTIONS = [
+    "executive_summary",
+    "project_description",
+    "timeline_planning",
+    "stakeholders_and_team",
+    "requirements",
+    "sifide",
+    "work_agreement",
+]
+
+# Form fields sent to the model by each section generator
+PROJECT_DESCRIPTION_FIELDS = [
+    "client_name",
+    "language",
+    "technology_focus",
+    "general_description",
+]
+TIMELINE_PLANNING_FIELDS = [
+    "language",
+    "planning",
+]
+STAKEHOLDERS_AND_TEAM_FIELDS = [
+    "client_name",
+    "language",
+    "client_stakeholders",
+    "daredata_team"
+]
+REQUIREMENTS_FIELDS = [
+    "client_name",
+    "language",
+    "client_expectations",
+]
+
+# Every form field that shapes each section, including the switches that change
+# its prompt. The executive summary also depends on the project description.
+SECTION_INPUTS = {
+    "executive_summary": ["language"],
+    "project_description": PROJECT_DESCRIPTION_FIELDS + ["mlops", "devops", "extended_description", "project_type"],
+    "timeline_planning": TIMELINE_PLANNING_FIELDS + ["project_type"],
+    "stakeholders_and_team": STAKEHOLDERS_AND_TEAM_FIELDS + ["project_type"],
+    "requirements": REQUIREMENTS_FIELDS,
+    "sifide": ["language"],
+    "work_agreement": ["language", "project_type"],
+}
+
+# Timeline prompt per project type
+TIMELINE_PLANNING_PROMPTS = {
+    "Gen-OS": "TIMELINE_AND_PLANNING_GENOS",
+    "Closed Project": "TIMELINE_AND_PLANNING_CLOSED_PROJECT",
+    "Co-Creation": "TIMELINE_AND_PLANNING_COCREATION",
+}
+
+def section_prompts(data: dict) -> dict[str, list[str]]:
+    """Prompts each section is written from for this request (static sections use none)."""
+    description = ["SYSTEM_PROMPT", "PROJECT_DESCRIPTION", "EXAMPLES"]
+    if data["mlops"] == "Yes":
+        description.append("MLOPS")
+    if data["devops"] == "Yes":
+        description.append("DEV_OPS")
+    if data["project_type"] == "Gen-OS":
+        description.append("GENOS")
+    return {
+        "executive_summary": ["SYSTEM_PROMPT", "EXECUTIVE_SUMMARY"],
+        "project_description": description,
+        "timeline_planning": ["SYSTEM_PROMPT", TIMELINE_PLANNING_PROMPTS[data["project_type"]], "EXAMPLES"],
+        "stakeholders_and_team": ["SYSTEM_PROMPT", "STAKEHOLDERS_AND_TEAM"],
+        "requirements": ["SYSTEM_PROMPT", "REQUIREMENTS_AND_PRICING"],
+        "sifide": [],
+        "work_agreement": [],
+    }
+
+def prompt_versions(data: dict) -> dict[str, str]:
+    """
+    Section name -> combined version of the prompts and templates it is
+    currently written from, and of the Gen-OS description mode.
+    """
+    versions = {}
+    for section, names in section_prompts(data).items():
+        version = prompts.combined_version(names)
+        if templates.version(section):
+            version = hashlib.sha256(f"{version}:{templates.version(section)}".encode("utf-8")).hexdigest()[:12]
+        if section == "project_description" and data["project_type"] == "Gen-OS" and settings.GENOS_SINGLE_PASS:
+            # One call with the Gen-OS guidance writes a different description than a draft and a refinement
+            version = hashlib.sha256(f"{version}:single-pass".encode("utf-8")).hexdigest()[:12]
+        versions[section] = version
+    return versions
+
+def proposal_sections(data: dict) -> list[str]:
+    """Sections included in the proposal for this request, in proposal order."""
     if data["language"] == "Portuguese":
-        sifide = generate_SIFIDE()
+        return list(SECTIONS)
+    return [section for section in SECTIONS if section != "sifide"]
+
+class GenerationCancelled(Exception):
+    """The proposal was cancelled, e.g. because whoever asked for it went away."""
+
+class SectionTimeout(TimeoutError):
+    """A section, or the proposal it belongs to, ran past its deadline."""
+
+def section_timeout(section: str) -> float:
+    """Seconds a section may take (SECTION_TIMEOUTS, else SECTION_TIMEOUT_SECONDS); 0 for no limit."""
+    return float(settings.SECTION_TIMEOUTS.get(section, settings.SECTION_TIMEOUT_SECONDS))
+
+def failure_reason(error: BaseException) -> str:
+    """Short, user-facing reason a section was left out of a proposal."""
+    if isinstance(error, SectionTimeout):
+        return str(error)
+    if isinstance(error, GenerationCancelled):
+        return "cancelled"
+    return f"failed: {error}"
+
+def describe_failures(failures: dict[str, str]) -> str:
+    return "Sections not generated: " + "; ".join(f"{name} ({reason})" for name, reason in failures.items())
+
+@dataclass
+class GenerationRun:
+    """Options and callbacks shared by every LLM call made for one proposal."""
+    on_section: Callable[[str, str], None] | None = None
+    on_token: Callable[[str, str], None] | None = None
+    on_call: Callable[[dict], None] | None = None
+    on_failure: Callable[[str, str], None] | None = None
+    # Skip the completion cache and always ask the model for a new draft
+    fresh: bool = False
+    # Metric labels
+    project_type: str = ""
+    language: str = ""
+    # Write Gen-OS descriptions in one call instead of a draft and a refinement
+    genos_single_pass: bool = field(default_factory=lambda: settings.GENOS_SINGLE_PASS)
+    # Section name -> seconds it waited for a worker before starting
+    queue_waits: dict = field(default_factory=dict)
+    # When set, calls are only estimated (see estimate_proposal) and collected here
+    estimates: list | None = None
+    # Set to stop every section at its next check; streamed requests are closed
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    # time.monotonic() by which the whole proposal must be done, if any
+    deadline: float | None = None
+    # Section name -> its own deadline, set the first time the section is checked
+    section_deadlines: dict = field(default_factory=dict)
+
+    def section_done(self, section: str, content: str) -> None:
+        if self.on_section is not None:
+            self.on_section(section, content)
+
+    def section_failed(self, section: str, reason: str) -> None:
+        if self.on_failure is not None:
+            self.on_failure(section, reason)
+
+    def expires(self, section: str) -> float | None:
+        """When the section must be done: its own deadline or the proposal's, whichever comes first."""
+        if section not in self.section_deadlines:
+            timeout = section_timeout(section)
+            self.section_deadlines[section] = time.monotonic() + timeout if timeout > 0 else None
+        deadlines = [d for d in (self.section_deadlines[section], self.deadline) if d is not None]
+        return min(deadlines) if deadlines else None
+
+    def remaining(self, section: str) -> float | None:
+        """Seconds left for the section, or None when it has no deadline."""
+        expires = self.expires(section)
+        return None if expires is None else expires - time.monotonic()
+
+    def check(self, section: str) -> None:
+        """Raise GenerationCancelled or SectionTimeout when the section should stop now."""
+        if self.cancelled.is_set():
+            raise GenerationCancelled(f"{section} was cancelled")
+        remaining = self.remaining(section)
+        if remaining is not None and remaining <= 0:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                raise SectionTimeout(f"proposal timed out after {settings.PROPOSAL_TIMEOUT_SECONDS:g}s")
+            raise SectionTimeout(f"timed out after {section_timeout(section):g}s")
+
+    def wait(self, section: str, seconds: float) -> None:
+        """Sleep up to `seconds`, cut short (with the exception check raises) by cancellation or the deadline."""
+        remaining = self.remaining(section)
+        if remaining is not None:
+            seconds = min(seconds, max(remaining, 0.0))
+        self.cancelled.wait(seconds)
+        self.check(section)
+
+    def request_timeout(self, section: str) -> httpx.Timeout | None:
+        """Per-request timeout that keeps an LLM call within the section's deadline; None to keep the client's."""
+        remaining = self.remaining(section)
+        if remaining is None:
+            return None
+        remaining = max(remaining, 0.001)
+        return httpx.Timeout(min(settings.LLM_READ_TIMEOUT, remaining), connect=min(settings.LLM_CONNECT_TIMEOUT, remaining))
+
+    def token(self, section: str, token: str) -> None:
+        if self.on_token is not None:
+            self.on_token(section, token)
+
+    def call(self, record: dict) -> None:
+        metrics.record_call(record, self.project_type, self.language)
+        if self.on_call is not None:
+            self.on_call(record)
+
+def stale_sections(previous_data: dict, data: dict, previous_versions: dict | None = None) -> set[str]:
+    """
+    Sections whose inputs differ between two versions of the form data and,
+    when the prompt versions of the previous sections are given, sections
+    whose prompts changed since.
+    """
+    changed = {field for field in previous_data.keys() | data.keys() if previous_data.get(field) != data.get(field)}
+    stale = {section for section, fields in SECTION_INPUTS.items() if changed.intersection(fields)}
+    if previous_versions is not None:
+        versions = prompt_versions(data)
+        stale |= {section for section, version in versions.items() if previous_versions.get(section) != version}
+    # The summary is written from the description, so it follows it
+    if "project_description" in stale:
+        stale.add("executive_summary")
+    return stale
+
+def reusable_sections(
+    previous_data: dict,
+    previous_sections: dict,
+    data: dict,
+    previous_versions: dict | None = None,
+) -> dict:
+    """Sections of a previous proposal that can be kept as-is for the new form data."""
+    stale = stale_sections(previous_data, data, previous_versions)
+    return {name: content for name, content in previous_sections.items() if name not in stale}
+
+def generate_proposal(
+    data: dict,
+    on_section: Callable[[str, str], None] | None = None,
+    on_token: Callable[[str, str], None] | None = None,
+    fresh: bool = False,
+    on_call: Callable[[dict], None] | None = None,
+) -> str:
+    sections = generate_sections(data, on_section=on_section, on_token=on_token, fresh=fresh, on_call=on_call)
+    return assemble_proposal(sections)
+
+def estimate_proposal(data: dict, sections: dict | None = None, fresh: bool = False) -> dict:
+    """
+    Pre-flight estimate of the LLM calls, tokens, cost and latency of
+    generating a proposal, made without calling the chat model; examples are
+    still looked up, as for the real run. Sections given in `sections` are
+    reused and cost nothing; cached completions count as hits unless fresh is
+    set.
+    """
+    sections = sections or {}
+    run = GenerationRun(fresh=fresh, project_type=data["project_type"], language=data["language"], estimates=[])
+    if "project_description" in sections:
+        description = sections["project_description"]
     else:
-        sifide = ""
-
-    proposal = "\n".join([
-        exc_summ,
-        project_desc,
-        timeline_planning,
-        stakeholders_and_team,
-        requirements,
-        sifide,
-        work_agreement
-    ])
-    return proposal
-
-def generate_executive_summary(data: dict, description: str) -> str:
+        description = generate_project_description(data, run)
+    if "executive_summary" not in sections:
+        generate_executive_summary(data, description, run)
+    for name, generator in LLM_SECTION_GENERATORS.items():
+        if name not in sections:
+            generator(data, run)
+    return summarize_estimates(run.estimates)
+
+def assemble_proposal(sections: dict) -> str:
+    return "\n".join(sections.get(section, "") for section in SECTIONS)
+
+def generate_sections(
+    data: dict,
+    on_section: Callable[[str, str], None] | None = None,
+    on_token: Callable[[str, str], None] | None = None,
+    sections: dict | None = None,
+    fresh: bool = False,
+    on_call: Callable[[dict], None] | None = None,
+    on_failure: Callable[[str, str], None] | None = None,
+    cancel: threading.Event | None = None,
+) -> dict:
+    """
+    Generate every proposal section, calling on_section(name, content) as each
+    one finishes and, when given, on_token(name, token) as LLM output streams in
+    and on_call(record) with the timings and token usage of every LLM call.
+
+    Sections already present in `sections` are reused instead of regenerated,
+    and newly generated ones are added to it as they finish. With fresh=True
+    the completion cache is bypassed.
+
+    Each section has SECTION_TIMEOUT_SECONDS (or its SECTION_TIMEOUTS entry)
+    and the proposal PROPOSAL_TIMEOUT_SECONDS. A section that runs out of time
+    or fails is left out and reported to on_failure(name, reason) instead of
+    failing the proposal; generating again with the returned sections retries
+    only those. Setting `cancel` stops every section and closes the requests
+    in flight, after which GenerationCancelled is raised.
+    """
+    if sections is None:
+        sections = {}
+    run = GenerationRun(
+        on_section=on_section,
+        on_token=on_token,
+        on_call=on_call,
+        on_failure=on_failure,
+        fresh=fresh,
+        project_type=data["project_type"],
+        language=data["language"],
+        cancelled=cancel or threading.Event(),
+        deadline=time.monotonic() + settings.PROPOSAL_TIMEOUT_SECONDS if settings.PROPOSAL_TIMEOUT_SECONDS > 0 else None,
+    )
+    started = time.monotonic()
+
+    def done(name: str, content: str) -> None:
+        sections[name] = content
+        run.section_done(name, content)
+
+    def failed(name: str, error: BaseException) -> None:
+        reason = failure_reason(error)
+        kind = "timeout" if isinstance(error, SectionTimeout) else "cancelled" if isinstance(error, GenerationCancelled) else "error"
+        metrics.SECTION_FAILURES.inc(section=name, project_type=run.project_type, language=run.language, reason=kind)
+        run.section_failed(name, reason)
+
+    # Reused sections are reported up front so callers can render them immediately
+    for name, content in list(sections.items()):
+        done(name, content)
+
+    def description_and_summary(submitted: float) -> None:
+        run.queue_waits["project_description"] = time.monotonic() - submitted
+        if "project_description" in sections:
+            project_desc = sections["project_description"]
+        else:
+            try:
+                run.check("project_description")
+                project_desc = generate_project_description(data, run)
+            except Exception as e:
+                failed("project_description", e)
+                if "executive_summary" not in sections:
+                    run.section_failed("executive_summary", "skipped: the project description was not generated")
+                return
+            done("project_description", project_desc)
+        if "executive_summary" not in sections:
+            try:
+                run.check("executive_summary")
+                done("executive_summary", generate_executive_summary(data, project_desc, run))
+            except Exception as e:
+                failed("executive_summary", e)
+
+    def generate(name: str, generator: Callable[..., str], submitted: float) -> None:
+        run.queue_waits[name] = time.monotonic() - submitted
+        try:
+            run.check(name)
+            content = generator(data, run)
+        except Exception as e:
+            failed(name, e)
+            return
+        done(name, content)
+
+    # Only the executive summary depends on another section, so the description
+    # (and its summary) is submitted first as the critical path and every other
+    # LLM section runs alongside it.
+    with ThreadPoolExecutor(max_workers=settings.MAX_CONCURRENT_SECTIONS) as executor:
+        futures = [executor.submit(description_and_summary, time.monotonic())]
+        futures += [
+            executor.submit(generate, name, generator, time.monotonic())
+            for name, generator in LLM_SECTION_GENERATORS.items()
+            if name not in sections
+        ]
+
+        done("work_agreement", generate_work_agreement(data))
+        if data["language"] == "Portuguese":
+            done("sifide", generate_SIFIDE())
+
+        # Sections stop themselves at their deadlines or on cancellation
+        for future in futures:
+            future.result()
+
+    metrics.PROPOSAL_DURATION.observe(time.monotonic() - started, project_type=run.project_type, language=run.language)
+    if run.cancelled.is_set():
+        raise GenerationCancelled("Proposal generation was cancelled")
+    return sections
+
+# Transient failures worth another attempt; the client itself is built with max_retries=0
+# so every retry is counted here
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+# How often a call waiting for the model, or for an identical call in flight, checks its own
+# deadline and cancellation
+POLL_SECONDS = 0.25
+
+def complete(
+    messages: list,
+    section: str,
+    run: GenerationRun | None = None,
+    stream: bool = True,
+    call: str | None = None,
+) -> str:
+    """
+    Run a chat completion for a section and return its text.
+
+    Completions are served from the completion cache unless the run is fresh.
+    When the run has a token callback (and stream is set) the completion is
+    streamed and every content delta is forwarded as it arrives. Every call
+    is reported to the run as a record of its timings and token usage,
+    labelled with `call` when a section makes more than one.
+    """
+    if run is None:
+        run = GenerationRun()
+    key = completion_cache.key(settings.AZURE_OPENAI_DEPLOYMENT, messages)
+
+    if run.estimates is not None:
+        cached = None if run.fresh else completion_cache.get(key)
+        estimate = call_estimate(section, call or section, messages, cached is not None)
+        run.estimates.append(estimate)
+        # Later calls (the summary, the Gen-OS refinement) are sized from a stand-in of the expected length
+        return cached if cached is not None else "." * (estimate["completion_tokens"] * CHARS_PER_TOKEN)
+
+    stream = stream and run.on_token is not None
+    record = {
+        "section": section,
+        "call": call or section,
+        "queue_wait_seconds": run.queue_waits.pop(section, 0.0),
+        "time_to_first_token_seconds": None,
+        "latency_seconds": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "retries": 0,
+        "rate_limit_wait_seconds": 0.0,
+        "cache_hit": False,
+        # Served by an identical call that was already in flight
+        "shared": False,
+        # Cut off by the section's max_tokens
+        "truncated": False,
+    }
+    started = time.monotonic()
+
+    # Identical prompts in flight at the same time (a resubmitted form, a
+    # double-posted request) are completed once and shared
+    flight_key = key + ":fresh" if run.fresh else key
+    while True:
+        run.check(section)
+        flight, leader = completions_in_flight.join(flight_key)
+        if leader:
+            break
+        try:
+            return follow_completion(flight, section, run, stream, record, started)
+        except (GenerationCancelled, SectionTimeout):
+            # The leader may have stopped for its own deadline or cancellation:
+            # unless this run has to stop too, it makes the call itself
+            run.check(section)
+    try:
+        content = lead_completion(messages, section, run, stream, record, started, key, flight)
+    except BaseException as e:
+        completions_in_flight.land(flight_key, flight, error=e)
+        raise
+    completions_in_flight.land(flight_key, flight, content)
+    return content
+
+
+def follow_completion(flight: Flight, section: str, run: GenerationRun, stream: bool, record: dict, started: float) -> str:
+    """Wait for the identical call leading `flight`, streaming its tokens to this run as they arrive."""
+    received = []
+
+    def on_token(token: str) -> None:
+        if not received:
+            record["time_to_first_token_seconds"] = time.monotonic() - started
+        received.append(token)
+        run.token(section, token)
+
+    if stream:
+        flight.subscribe(on_token)
+    try:
+        # Waited for in slices, so that this run's own deadline and cancellation still apply
+        while not wait([flight.future], timeout=poll_timeout(run, section)).done:
+            run.check(section)
+        content = flight.result()
+    finally:
+        if stream:
+            flight.unsubscribe(on_token)
+    if stream and not received:
+        # The leader did not stream (or hit the cache): forward the text in one piece
+        on_token(content)
+    record["shared"] = True
+    record["latency_seconds"] = time.monotonic() - started
+    run.call(record)
+    return content
+
+
+def poll_timeout(run: GenerationRun, section: str) -> float:
+    remaining = run.remaining(section)
+    return POLL_SECONDS if remaining is None else max(0.0, min(POLL_SECONDS, remaining))
+
+
+def abandonable(run: GenerationRun, section: str, open_stream: Callable[[], Iterable]) -> Iterator:
+    """
+    Items of open_stream(), which is called and iterated in a helper thread,
+    so that waiting for the model (for its response or its next chunk) ends
+    as soon as the run is cancelled or out of time, with the exception check
+    raises. The abandoned thread then closes the stream after its current
+    chunk, which ends the request.
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def pump() -> None:
+        try:
+            stream = open_stream()
+            try:
+                for item in stream:
+                    items.put((True, item))
+                    if stop.is_set():
+                        break
+            finally:
+                if hasattr(stream, "close"):
+                    stream.close()
+        except BaseException as e:
+            items.put((False, e))
+        else:
+            items.put((False, None))
+
+    threading.Thread(target=pump, name=f"llm-{section}", daemon=True).start()
+    try:
+        while True:
+            try:
+                more, item = items.get(timeout=poll_timeout(run, section))
+            except queue.Empty:
+                run.check(section)
+                continue
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            run.check(section)
+            yield item
+    finally:
+        stop.set()
+
+
+def lead_completion(
+    messages: list,
+    section: str,
+    run: GenerationRun,
+    stream: bool,
+    record: dict,
+    started: float,
+    key: str,
+    flight: Flight,
+) -> str:
+    """Complete `messages` from the cache or the model, publishing streamed tokens to the flight's followers."""
+
+    def emit(token: str) -> None:
+        run.token(section, token)
+        flight.publish(token)
+
+    if not run.fresh:
+        cached = completion_cache.get(key)
+        if cached is not None:
+            if stream:
+                run.token(section, cached)
+            record["cache_hit"] = True
+            record["latency_seconds"] = record["time_to_first_token_seconds"] = time.monotonic() - started
+            run.call(record)
+            return cached
+
+    call = record["call"]
+    extra = {}
+    max_tokens = section_max_tokens(section)
+    if max_tokens:
+        extra["max_tokens"] = max_tokens
+    timeout = run.request_timeout(section)
+    if timeout is not None:
+        extra["timeout"] = timeout
+    # Tokens held in the rate limiter until the real usage is known
+    reserved = estimate_tokens(messages) + (max_tokens or settings.RATE_LIMIT_COMPLETION_TOKENS)
+    # Set once the model accepted the request; from then on the reservation is settled here
+    admitted = threading.Event()
+    parts = []
+
+    def request(**kwargs):
+        response = create_completion(record, reserved, run, messages=messages, **extra, **kwargs)
+        admitted.set()
+        return response
+
+    try:
+        if not stream:
+            # The request cannot be closed early, but it is no longer waited for once the run stops
+            (response,) = abandonable(run, section, lambda: [request()])
+            content = response.choices[0].message.content
+            record["time_to_first_token_seconds"] = time.monotonic() - started
+            record["truncated"] = response.choices[0].finish_reason == "length"
+            add_usage(record, response.usage)
+        else:
+            if settings.AZURE_OPENAI_STREAM_USAGE:
+                extra["stream_options"] = {"include_usage": True}
+            # A stream left early is closed, which aborts the request so the model stops generating
+            chunks = abandonable(run, section, lambda: request(stream=True))
+            for chunk in chunks:
+                # Azure sends content filter results in chunks without choices
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not parts:
+                        record["time_to_first_token_seconds"] = time.monotonic() - started
+                    parts.append(chunk.choices[0].delta.content)
+                    emit(chunk.choices[0].delta.content)
+                if chunk.choices and chunk.choices[0].finish_reason == "length":
+                    record["truncated"] = True
+                # With include_usage the last chunk carries the usage of the whole stream
+                if getattr(chunk, "usage", None) is not None:
+                    add_usage(record, chunk.usage)
+            content = "".join(parts)
+    except (GenerationCancelled, SectionTimeout):
+        raise
+    except Exception:
+        # A request cut short by the section's deadline is a timeout, not an LLM error
+        run.check(section)
+        metrics.LLM_ERRORS.inc(section=section, call=call, project_type=run.project_type, language=run.language)
+        raise
+    finally:
+        # Also when the call failed or was cut short, so no reservation stays held in the shared
+        # bucket. A non-streamed call that was abandoned is still running, and keeps its reservation.
+        if admitted.is_set():
+            used = record["prompt_tokens"] + record["completion_tokens"]
+            if not used:
+                # No usage reported (stopped early, or streamed without usage): count what was seen
+                used = estimate_tokens(messages) + estimate_text_tokens("".join(parts))
+            rate_limiter.settle(reserved, used)
+
+    record["latency_seconds"] = time.monotonic() - started
+    run.call(record)
+    # A completion cut off by max_tokens is not stored, so the next run asks the model again
+    if not record["truncated"]:
+        completion_cache.set(key, content)
+    return content
+
+
+def create_completion(record: dict, reserved_tokens: int, run: GenerationRun | None = None, **kwargs):
+    """
+    chat.completions.create behind the shared rate limiter, with jittered
+    backoff on transient errors that honours Retry-After. Retries are counted
+    in record["retries"] and time spent waiting for the limiter in
+    record["rate_limit_wait_seconds"]. Waiting (for the limiter or between
+    retries) stops at the run's deadline or cancellation.
+
+    The reservation of a call that raises is given back here; once a
+    response is returned, the caller settles it against the usage.
+    """
+    if run is None:
+        run = GenerationRun()
+    section = record["section"]
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        record["rate_limit_wait_seconds"] += rate_limiter.acquire(reserved_tokens, sleep=lambda seconds: run.wait(section, seconds))
+        try:
+            return get_llm(settings).chat.completions.create(model=settings.AZURE_OPENAI_DEPLOYMENT, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            # The rejected call did not use its share of the quota
+            rate_limiter.settle(reserved_tokens, 0, request=False)
+            # Timeouts from the deadline-capped request timeout are not retried
+            run.check(section)
+            if attempt == settings.LLM_MAX_RETRIES:
+                raise
+            record["retries"] += 1
+            server_delay = retry_after(e)
+            if server_delay is not None:
+                # Everyone sharing the quota backs off, not just this call
+                rate_limiter.pause(server_delay)
+            run.wait(section, backoff_delay(attempt, server_delay))
+        except Exception:
+            # Rejected outright (e.g. a bad request): no tokens were used
+            rate_limiter.settle(reserved_tokens, 0)
+            raise
+
+def add_usage(record: dict, usage) -> None:
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    record["prompt_tokens"] += usage.prompt_tokens
+    record["completion_tokens"] += usage.completion_tokens
+    # Prompt tokens served from Azure OpenAI's prompt cache
+    record["cached_tokens"] += (details.cached_tokens or 0) if details is not None else 0
+
+def find_examples(section: str, data: dict, run: GenerationRun | None = None) -> list[str]:
+    """
+    Past proposal excerpts for a section's prompt. Estimates look them up too,
+    so they price the same messages as the real call; the query embedding is
+    cached, so the real run does not embed it again.
+    """
+    if run is None:
+        return example_library.find(section, data)
+    # Retries of the embedding call stop with the run's cancellation or the section's deadline
+    return example_library.find(section, data, sleep=lambda seconds: run.wait(section, seconds))
+
+def examples_message(examples: list[str]) -> list[dict]:
+    """The user message presenting retrieved examples, or nothing when there are none."""
+    if not examples:
+        return []
+    return [{"role": "user", "content": prompts.EXAMPLES + "\n\n" + "\n\n---\n\n".join(examples)}]
+
+def generate_executive_summary(data: dict, description: str, run: GenerationRun | None = None) -> str:
     executive_summary_dict = {
         "language": data["language"],
         "project description": description,
@@ -36,196 +726,132 @@ def generate_executive_summary(data: dict, description: str) -> str:
         {"role": "system", "content": prompts.SYSTEM_PROMPT},
         {"role": "user", "content": prompts.EXECUTIVE_SUMMARY + json.dumps(executive_summary_dict) }
     ]
-    response = LLM.chat.completions.create(
-        model=settings.AZURE_OPENAI_DEPLOYMENT,
-        messages=messages,
-    )
-    return response.choices[0].message.content
-
-def generate_project_description(data):
-    fields = [
-        "client_name",
-        "language",
-        "technology_focus",
-        "general_description",
-    ]
-    selected_data = {k: v for k, v in data.items() if k in fields}
-    content = prompts.PROJECT_DESCRIPTION + json.dumps(selected_data)
-    
+    return complete(messages, "executive_summary", run)
+
+def generate_project_description(data, run: GenerationRun | None = None):
+    if run is None:
+        run = GenerationRun()
+    selected_data = {k: v for k, v in data.items() if k in PROJECT_DESCRIPTION_FIELDS}
+
+    # Reference frameworks, most important first; they are trimmed before any
+    # client text when the prompt is over budget
+    references = []
     if data["mlops"]=="Yes":
-        content = content + "\n\n" + prompts.MLOPS
+        references.append(reference_library.select("MLOPS", data))
     if data["devops"]=="Yes":
-        content = content + "\n\n" + """
+        references.append("""
         ---
         DEVOPS BEST PRACTICES FRAMEWORK
         Use as reference to enrich Solution Design. Extract and adapt relevant principles - do not copy verbatim. Integrate naturally using inline bold subheadings. Adapt to project's technology stack and context.
         ---
 
-        """ + prompts.DEV_OPS
-    messages = [
-        {"role": "system", "content": prompts.SYSTEM_PROMPT},
-        {"role": "user", "content": content}
-    ]
-    
-    # append prompt if an extended description is necessary 
-    if data["extended_description"]==True:
-        messages.append({
-            "role": "user", "content": "Please provide an extended, more comprehensive project description. The description should be thorough and substantial, suitable for a large-scale client project."})
-    
-    response = LLM.chat.completions.create(
-        model=settings.AZURE_OPENAI_DEPLOYMENT,
-        messages=messages,
-    )
-    final_response = response.choices[0].message.content
-    if data["project_type"]=="Gen-OS":
-            content = final_response + "\n\n" + "Improve the text above by taking into account the following" + "\n\n"+ prompts.GENOS + "\n\n"+ selected_data["language"]
+        """ + reference_library.select("DEV_OPS", data))
+    # Gen-OS guidance is either folded into this call or applied by a second, refining call
+    genos = data["project_type"]=="Gen-OS"
+    single_pass = genos and run.genos_single_pass
+    examples = find_examples("project_description", data, run)
+
+    def build_messages(references: list[str], selected_data: dict) -> list:
+        # Instructions and reference frameworks are static, so they lead the prompt
+        # where Azure OpenAI's prompt caching can reuse them; client data comes last
+        content = prompts.PROJECT_DESCRIPTION
+        for reference in references:
+            content = content + "\n\n" + reference
+        if single_pass:
+            content = content + "\n\n" + "Write the description taking into account the following" + "\n\n" + prompts.GENOS
+        messages = [
+            {"role": "system", "content": prompts.SYSTEM_PROMPT},
+            {"role": "user", "content": content},
+            *examples_message(examples),
+            {"role": "user", "content": json.dumps(selected_data)}
+        ]
+        # append prompt if an extended description is necessary
+        if data["extended_description"]==True:
+            messages.append({
+                "role": "user", "content": "Please provide an extended, more comprehensive project description. The description should be thorough and substantial, suitable for a large-scale client project."})
+        return messages
+
+    messages = build_messages(references, selected_data)
+    over_budget = estimate_tokens(messages) - settings.PROMPT_TOKEN_BUDGET
+    # Examples are dropped first, then the reference frameworks are trimmed, then the client text
+    if over_budget > 0 and examples:
+        available = sum(estimate_text_tokens(example) for example in examples) - over_budget
+        examples = fit_references(examples, max(0, available))
+        messages = build_messages(references, selected_data)
+        over_budget = estimate_tokens(messages) - settings.PROMPT_TOKEN_BUDGET
+    if over_budget > 0 and references:
+        available = sum(estimate_text_tokens(reference) for reference in references) - over_budget
+        references = fit_references(references, max(0, available))
+        messages = build_messages(references, selected_data)
+        over_budget = estimate_tokens(messages) - settings.PROMPT_TOKEN_BUDGET
+    if over_budget > 0:
+        description = selected_data["general_description"]
+        selected_data = {
+            **selected_data,
+            "general_description": truncate_to_tokens(description, max(0, estimate_text_tokens(description) - over_budget)),
+        }
+        messages = build_messages(references, selected_data)
+
+    # The Gen-OS refinement rewrites the first draft, so only the final pass is streamed
+    refine = genos and not single_pass
+    final_response = complete(messages, "project_description", run, stream=not refine)
+    if refine:
             messages = [
                 {"role": "system", "content": prompts.SYSTEM_PROMPT},
-                {"role": "user", "content": content}
+                {"role": "user", "content": "Improve the text in the next message by taking into account the following" + "\n\n"+ prompts.GENOS},
+                {"role": "user", "content": final_response + "\n\n"+ selected_data["language"]}
             ]
-            response = LLM.chat.completions.create(
-                model=settings.AZURE_OPENAI_DEPLOYMENT,
-                messages=messages,
-            )
-            final_response = response.choices[0].message.content
+            final_response = complete(messages, "project_description", run, call="genos_refinement")
     
     return final_response
 
-def generate_timeline_planning(data: dict) -> str:
-    fields = [
-        "language",
-        "planning",
-    ]
-    selected_data = {k: v for k, v in data.items() if k in fields}
+def generate_timeline_planning(data: dict, run: GenerationRun | None = None) -> str:
+    selected_data = {k: v for k, v in data.items() if k in TIMELINE_PLANNING_FIELDS}
     type_of_project_dict = {
         "Gen-OS": prompts.TIMELINE_AND_PLANNING_GENOS,
         "Closed Project": prompts.TIMELINE_AND_PLANNING_CLOSED_PROJECT,
         "Co-Creation": prompts.TIMELINE_AND_PLANNING_COCREATION
     }
+    # The static instructions lead the prompt, as in generate_project_description; client data comes last
     messages = [
         {"role": "system", "content": prompts.SYSTEM_PROMPT},
-        {"role": "user", "content": type_of_project_dict[data["project_type"]] + json.dumps(selected_data)}
-    ]
-    response = LLM.chat.completions.create(
-        model=settings.AZURE_OPENAI_DEPLOYMENT,
-        messages=messages,
-    )
-    return response.choices[0].message.content
-
-def generate_stakeholders_and_team(data: dict) -> str:
-    fields = [
-        "client_name",
-        "language",
-        "client_stakeholders",
-        "daredata_team"
+        {"role": "user", "content": type_of_project_dict[data["project_type"]]},
+        *examples_message(find_examples("timeline_planning", data, run)),
+        {"role": "user", "content": json.dumps(selected_data)}
     ]
-    data = {k: v for k, v in data.items() if k in fields}
+    # The model writes the table rows; title and header come from the template
+    return templates.render_timeline(data, complete(messages, "timeline_planning", run))
+
+def generate_stakeholders_and_team(data: dict, run: GenerationRun | None = None) -> str:
+    selected_data = {k: v for k, v in data.items() if k in STAKEHOLDERS_AND_TEAM_FIELDS}
     messages = [
         {"role": "system", "content": prompts.SYSTEM_PROMPT},
-        {"role": "user", "content": prompts.STAKEHOLDERS_AND_TEAM + json.dumps(data)}
+        {"role": "user", "content": prompts.STAKEHOLDERS_AND_TEAM + json.dumps(selected_data)}
     ]
-    response = LLM.chat.completions.create(
-        model=settings.AZURE_OPENAI_DEPLOYMENT,
-        messages=messages,
-    )
-    return response.choices[0].message.content
+    # The model writes the stakeholder list; the team roles are fixed
+    return templates.render_stakeholders_and_team(data, complete(messages, "stakeholders_and_team", run))
 
-def generate_requirements(data: dict) -> str:
-    fields = [
-        "client_name",
-        "language",
-        "client_expectations",
-    ]
-    data = {k: v for k, v in data.items() if k in fields}
+def generate_requirements(data: dict, run: GenerationRun | None = None) -> str:
+    # The standard requirements are fixed; the model only writes about the client's own expectations
+    if not data["client_expectations"].strip():
+        return templates.render_requirements(data)
+    selected_data = {k: v for k, v in data.items() if k in REQUIREMENTS_FIELDS}
     messages = [
         {"role": "system", "content": prompts.SYSTEM_PROMPT},
-        {"role": "user", "content": prompts.REQUIREMENTS_AND_PRICING + json.dumps(data)}
+        {"role": "user", "content": prompts.REQUIREMENTS_AND_PRICING + json.dumps(selected_data)}
     ]
-    response = LLM.chat.completions.create(
-        model=settings.AZURE_OPENAI_DEPLOYMENT,
-        messages=messages,
-    )
-    return response.choices[0].message.content
-
-def generate_SIFIDE():
-    content = """# 7. Preço
-A DareData é reconhecida com o Selo ID: Reconhecimento de Idoneidade. Isso significa acesso ao sistema de incentivos fiscais para R&D empresarial que visa aumentar a competitividade das empresas, apoiando os seus esforços em Pesquisa e Desenvolvimento através da dedução total das despesas de R&D na cobrança do IRC.
-Vários dos nossos clientes conseguem poupar significativamente na dedução do IRC (de 32,5% até 82,5%) porque somos uma empresa certificada. É necessário criar um projeto interno de I&D na sua organização, dentro do âmbito do SIFIDE.
-
-Nota: no primeiro ano em que se candidatar, tem garantido um desconto de 82,5%. A maioria das empresas já tem um departamento para estes processos, mas podemos ajudar com a proposta, se necessário.
+    return templates.render_requirements(data, complete(messages, "requirements", run))
 
-Exemplo de preço de um projeto:
-- Preço do projeto: 100k€
-- Despesa elegível ao abrigo do SIFIDE: 100k€
-- Possível benefício fiscal no IRC: 32,5k€-82,5k€
+# LLM sections written independently of the others (the project description
+# and its executive summary are generated as a pair)
+LLM_SECTION_GENERATORS = {
+    "timeline_planning": generate_timeline_planning,
+    "stakeholders_and_team": generate_stakeholders_and_team,
+    "requirements": generate_requirements,
+}
 
-Novo preço (através de desconto indireto via benefício fiscal IRC): 
-- Máximo: 100,000€ -> 67,500€
-- Mínimo:  100,000 € -> 17,500€
-
-O mínimo de 32,5% e o máximo de 82,5% dos possíveis benefícios fiscais no IRC baseiam-se no total das despesas elegíveis em I&D da sua organização!
-
-Melhores práticas:
-- Familiarize-se com os processos SIFIDE;
-- Tenha um projeto interno de I&D (ou crie um) para cada projeto DareData;
-- Inscreva-se no SIFIDE todos os anos, associando cada projeto DareData como uma despesa dentro do projeto interno de I&D da organização.
-
-    """
-    return content
+def generate_SIFIDE():
+    return templates.SIFIDE
 
 def generate_work_agreement(data: dict) -> str:
-    work_agreement_dict_en = {
-        "Closed Project": "Payment of 30% on acceptance of the proposal, payment of 70% at the end",
-        "Gen-OS": "Setup: Payment of 30% on acceptance of the proposal, payment of 70% at the end\n\nRun: Monthly Payment / Annual Payment (5% discount)",
-        "Co-Creation": "Payment based on work timesheets",
-    }
-    work_agreement_dict_pt = {
-        "Closed Project": "Pagamento do 30% aquando da aceitação da proposta, 70% no final",
-        "Gen-OS": "Setup: 30% aquando da aceitação da proposta, 70% no final\n\nRun: Pagamentos Mensais/ Anuais (5% desconto)",
-        "Co-Creation": "Pagamento com base em timesheets",
-    }
-
-    text_pt = "\n\n".join([
-        " ",
-        "# 8. Condições Comerciais",
-        "Acordo de trabalho",
-        "Todo o trabalho será efetuado remotamente (preferencialmente).",
-        " ",
-        "Condições de pagamento",
-        work_agreement_dict_pt[data["project_type"]],
-        "Pagamento devido no prazo de 30 dias a contar da data de apresentação da fatura",
-        "O IVA, se aplicável, deve ser aplicado a todos os valores da presente proposta",
-        " ",
-        "Validade",
-        "A presente proposta é válida por 30 dias úteis",
-        " ",
-        "Todas as faturas deverão ser pagas à:",
-        "Empresa: DareData, SA",
-        "NIF: PT 515362166",
-        "Endereço: AV FONTES PEREIRA MELO , 31 5 C LISBOA 1050-117 LISBOA"  
-    ])
-    
-    text_en = "\n\n".join([
-        " ",
-        "# 8. Commercial Conditions",
-        "Work agreement",
-        "All the work will be done remotely.",
-        " ",
-        "Payment terms",
-        work_agreement_dict_en[data['project_type']],
-        "Payment due within 30 days of invoice issue date",
-        "VAT, where applicable, should be applied to all figures in this proposal",
-        " ",
-        "Validity",
-        "This proposal is valid for 30 working days",
-        " ",
-        "All bills should be paid to:",
-        "Company: DareData, SA",
-        "VAT Number: PT 515362166",
-        "Address: AV FONTES PEREIRA MELO , 31 5 C LISBOA 1050-117 LISBOA"
-    ])
-
-    if data["language"] == "English":
-        return text_en
-    if data["language"] == "Portuguese":
-        return text_pt
+    return templates.render_static("work_agreement", data)
@@ -0,0 +1,236 @@
+"""
+Bulk proposal generation from a JSONL file of ProposalRequest objects.
+
+Run from src/:
+
+    python -m proposal_builder.batch proposals.jsonl --output drafts.jsonl --concurrency 4
+    python -m proposal_builder.batch proposals.jsonl --output drafts/
+
+Each input line may carry an "id"; otherwise its line number is used. Results
+are written as each proposal finishes: to the output JSONL, or as <id>.md files
+plus a results.jsonl in an output directory. The results file is also the
+checkpoint, so rerunning an interrupted command skips the proposals it already
+completed and retries the ones that failed or came back partial (with
+sections that missed their deadline).
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from pydantic import ValidationError
+from config import settings
+from proposal_builder.agent import assemble_proposal, describe_failures, generate_sections, prompt_versions
+from proposal_builder.metrics import summarize_calls
+from proposal_builder.schemas import ProposalRequest, describe_errors
+
+RESULTS_FILE = "results.jsonl"
+
+
+@dataclass
+class BatchProgress:
+    completed: int = 0
+    failed: int = 0
+    # Proposals already completed by a previous run of the same batch
+    skipped: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def throughput_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.completed / elapsed * 60 if elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_seconds": time.monotonic() - self.started,
+            "throughput_per_minute": self.throughput_per_minute,
+        }
+
+
+@dataclass
+class InvalidLine:
+    """Stands in for the request of a line that is not a JSON object, so it fails on its own."""
+    error: str
+
+
+def parse_request(line: str, number: int) -> tuple[str, dict]:
+    """
+    (id, request) from one JSONL line; requests without an "id" are named
+    after their line number. Raises ValueError for lines that are not JSON objects.
+    """
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    return str(data.pop("id", None) or f"line-{number}"), data
+
+
+def read_requests(lines: Iterable[str]) -> Iterator[tuple[str, dict | InvalidLine]]:
+    """
+    (id, request) pairs from JSONL lines; validation happens per proposal in
+    generate_result. A line that cannot be parsed is yielded as an InvalidLine
+    named after its line number, so the rest of the file still runs.
+    """
+    for number, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                yield parse_request(line, number)
+            except ValueError as e:
+                yield f"line-{number}", InvalidLine(f"Line {number}: {e}")
+
+
+def generate_result(item_id: str, data: dict | InvalidLine, fresh: bool = False) -> dict:
+    """Generate one proposal of a batch; failures are reported in the result instead of raised."""
+    result = {"id": item_id, "status": "completed", "markdown": None, "error": None, "metrics": None, "prompt_versions": None}
+    if isinstance(data, InvalidLine):
+        return dict(result, status="failed", error=data.error)
+    calls = []
+    started = time.monotonic()
+    try:
+        proposal = ProposalRequest(**data).model_dump()
+        result["prompt_versions"] = prompt_versions(proposal)
+        failures = {}
+        sections = generate_sections(proposal, on_call=calls.append, on_failure=failures.__setitem__, fresh=fresh)
+        result["markdown"] = assemble_proposal(sections)
+        if failures:
+            result["status"] = "partial"
+            result["error"] = describe_failures(failures)
+    except ValidationError as e:
+        result["status"] = "failed"
+        result["error"] = describe_errors(e)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    result["metrics"] = summarize_calls(calls)
+    result["metrics"]["total_seconds"] = time.monotonic() - started
+    return result
+
+
+def run_batch(
+    items: Iterable[tuple[str, dict]],
+    process: Callable[[str, dict], dict],
+    concurrency: int,
+    on_result: Callable[[dict, BatchProgress], None] | None = None,
+    skip: set[str] = frozenset(),
+) -> BatchProgress:
+    """
+    Run process(id, request) over `items` with at most `concurrency` proposals
+    in flight, calling on_result(result, progress) as each one finishes.
+
+    Items are pulled from the iterable only as slots free up, so arbitrarily
+    large input files are never held in memory. Ids in `skip` are not processed.
+    """
+    progress = BatchProgress()
+    slots = threading.BoundedSemaphore(concurrency)
+    lock = threading.Lock()
+
+    def work(item_id: str, data: dict) -> None:
+        try:
+            try:
+                result = process(item_id, data)
+            except Exception as e:
+                result = {"id": item_id, "status": "failed", "markdown": None, "error": str(e), "metrics": None}
+            with lock:
+                if result["status"] == "completed":
+                    progress.completed += 1
+                else:
+                    progress.failed += 1
+                if on_result is not None:
+                    on_result(result, progress)
+        finally:
+            slots.release()
+
+    # On interruption the executor still waits for the proposals in flight,
+    # so their results reach the checkpoint before the process exits
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for item_id, data in items:
+            if item_id in skip:
+                progress.skipped += 1
+                continue
+            slots.acquire()
+            executor.submit(work, item_id, data)
+    return progress
+
+
+class ResultWriter:
+    """Appends batch results to a JSONL file, or to a directory of <id>.md files plus results.jsonl."""
+
+    def __init__(self, output: Path):
+        self.directory = None if output.suffix == ".jsonl" else output
+        self.path = output if self.directory is None else output / RESULTS_FILE
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def completed(self) -> set[str]:
+        """Ids already completed according to the results file."""
+        ids = set()
+        if not self.path.exists():
+            return ids
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short when a previous run was killed
+                    continue
+                if result.get("status") == "completed":
+                    ids.add(result["id"])
+        return ids
+
+    def write(self, result: dict) -> None:
+        with self._lock:
+            if self.directory is not None:
+                if result["markdown"] is not None:
+                    (self.directory / f"{result['id']}.md").write_text(result["markdown"], encoding="utf-8")
+                result = {key: value for key, value in result.items() if key != "markdown"}
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", type=Path, help="JSONL file with one ProposalRequest per line")
+    parser.add_argument("--output", type=Path, required=True, help="Output .jsonl file, or a directory for one .md per proposal")
+    parser.add_argument("--concurrency", type=int, default=settings.MAX_CONCURRENT_PROPOSALS, help="Proposals generated at the same time")
+    parser.add_argument("--fresh", action="store_true", help="Bypass the completion cache")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and regenerate every proposal")
+    args = parser.parse_args()
+
+    writer = ResultWriter(args.output)
+    skip = set() if args.restart else writer.completed()
+    if skip:
+        print(f"Resuming: {len(skip)} proposals already completed in {writer.path}", file=sys.stderr)
+
+    def on_result(result: dict, progress: BatchProgress) -> None:
+        writer.write(result)
+        status = result["status"] if result["error"] is None else f"{result['status']} ({result['error']})"
+        print(
+            f"[{progress.completed} completed, {progress.failed} failed] {result['id']}: {status}"
+            f" - {progress.throughput_per_minute:.1f} proposals/min",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    with open(args.input, encoding="utf-8") as file:
+        progress = run_batch(
+            read_requests(file),
+            lambda item_id, data: generate_result(item_id, data, fresh=args.fresh),
+            args.concurrency,
+            on_result=on_result,
+            skip=skip,
+        )
+    print(json.dumps(progress.as_dict()), file=sys.stderr)
+    if progress.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Token budgets and pre-flight estimates for proposal generation.
+
+Prompt sizes are estimated locally (no tokenizer round trip) before every
+call. Prompts over PROMPT_TOKEN_BUDGET are trimmed, reference frameworks
+first and client text last, and every section's output is capped by
+SECTION_MAX_TOKENS. The same estimates give a cost and latency forecast for
+a proposal before any model call is made.
+"""
+
+from config import settings
+from proposal_builder import metrics
+
+# Rough size of a token in characters, for English and Portuguese prose
+CHARS_PER_TOKEN = 4
+# Trimmed reference frameworks are dropped rather than cut below this size
+MIN_REFERENCE_TOKENS = 200
+TRIM_MARKER = "\n\n[...]"
+
+
+def estimate_text_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def estimate_tokens(messages: list) -> int:
+    """Rough prompt size in tokens (about 4 characters per token plus per-message overhead)."""
+    return 3 + sum(4 + estimate_text_tokens(message.get("content") or "") for message in messages)
+
+
+def section_max_tokens(section: str) -> int | None:
+    """Output cap for a section's calls, or None when it is not capped."""
+    return settings.SECTION_MAX_TOKENS.get(section) or None
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """`text` cut to about `tokens`, at a paragraph or sentence boundary when there is one nearby."""
+    if estimate_text_tokens(text) <= tokens:
+        return text
+    limit = max(0, tokens * CHARS_PER_TOKEN - len(TRIM_MARKER))
+    cut = text[:limit]
+    for boundary in ("\n\n", "\n", ". "):
+        position = cut.rfind(boundary)
+        if position > limit * 0.8:
+            cut = cut[:position + len(boundary.rstrip())]
+            break
+    return cut.rstrip() + TRIM_MARKER
+
+
+def fit_references(references: list[str], available: int) -> list[str]:
+    """
+    Reference frameworks that fit in `available` prompt tokens, in order of
+    importance: later ones are trimmed or dropped before earlier ones.
+    """
+    kept = []
+    for reference in references:
+        size = estimate_text_tokens(reference)
+        if size <= available:
+            kept.append(reference)
+            available -= size
+        elif available >= MIN_REFERENCE_TOKENS:
+            kept.append(truncate_to_tokens(reference, available))
+            available = 0
+    return kept
+
+
+def expected_completion_tokens(section: str, call: str) -> int:
+    """Completion length of a call: this process's average so far, or the section cap / reservation."""
+    calls = metrics.LLM_CALLS.total(section=section, call=call, cache="miss")
+    if calls:
+        return round(metrics.LLM_TOKENS.total(section=section, call=call, kind="completion") / calls)
+    cap = section_max_tokens(section)
+    return min(cap, settings.RATE_LIMIT_COMPLETION_TOKENS) if cap else settings.RATE_LIMIT_COMPLETION_TOKENS
+
+
+def call_estimate(section: str, call: str, messages: list, cache_hit: bool) -> dict:
+    """Pre-flight estimate of one LLM call."""
+    prompt_tokens = estimate_tokens(messages)
+    completion_tokens = expected_completion_tokens(section, call)
+    return {
+        "section": section,
+        "call": call,
+        "cache_hit": cache_hit,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "max_tokens": section_max_tokens(section),
+        "prompt_over_budget": prompt_tokens > settings.PROMPT_TOKEN_BUDGET,
+        "latency_seconds": 0.0 if cache_hit else (
+            settings.ESTIMATE_TIME_TO_FIRST_TOKEN + completion_tokens / settings.ESTIMATE_TOKENS_PER_SECOND
+        ),
+        "cost": 0.0 if cache_hit else (
+            prompt_tokens * settings.PROMPT_PRICE_PER_1K_TOKENS + completion_tokens * settings.COMPLETION_PRICE_PER_1K_TOKENS
+        ) / 1000,
+    }
+
+
+def summarize_estimates(calls: list[dict]) -> dict:
+    """
+    Proposal-level estimate from call estimates. Sections run in parallel, so
+    the latency is that of the slowest section, where the description and the
+    executive summary written from it count as one chain.
+    """
+    sections = {}
+    for call in calls:
+        section = sections.setdefault(call["section"], {
+            "llm_calls": 0,
+            "cache_hits": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latency_seconds": 0.0,
+            "cost": 0.0,
+        })
+        section["llm_calls"] += 1
+        section["cache_hits"] += int(call["cache_hit"])
+        for key in ("prompt_tokens", "completion_tokens", "latency_seconds", "cost"):
+            section[key] += call[key]
+    chains = [
+        sum(sections.get(name, {}).get("latency_seconds", 0.0) for name in ("project_description", "executive_summary")),
+        *(totals["latency_seconds"] for name, totals in sections.items() if name not in ("project_description", "executive_summary")),
+    ]
+    return {
+        "llm_calls": sum(s["llm_calls"] for s in sections.values()),
+        "cache_hits": sum(s["cache_hits"] for s in sections.values()),
+        "prompt_tokens": sum(s["prompt_tokens"] for s in sections.values()),
+        "completion_tokens": sum(s["completion_tokens"] for s in sections.values()),
+        "cost": sum(s["cost"] for s in sections.values()),
+        "latency_seconds": max(chains),
+        "prompt_over_budget": any(call["prompt_over_budget"] for call in calls),
+        "sections": sections,
+    }
@@ -0,0 +1,145 @@
+"""
+Content-addressed cache for chat completions.
+
+A completion is keyed by a hash of the deployment and the full messages list,
+so a section is only sent to the model again when something that goes into its
+prompt changes. Entries live in a small in-memory LRU in front of a SQLite file
+shared by every process on the machine.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+class CompletionCache:
+    def __init__(
+        self,
+        path: Path | None = None,
+        memory_entries: int = 256,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_bytes: int = 100 * 1024 * 1024,
+    ):
+        """
+        Args:
+            path: SQLite file for the persistent tier, or None for memory only
+            memory_entries: Number of completions kept in the in-memory LRU
+            ttl_seconds: Age after which an entry is treated as missing
+            max_bytes: Size of the persistent tier above which the least
+                recently used entries are evicted
+        """
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS completions_accessed_at ON completions (accessed_at)")
+            self._db.commit()
+
+    @staticmethod
+    def key(model: str, messages: list) -> str:
+        payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT value, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, value, created_at)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM completions")
+                self._db.commit()
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float) -> None:
+        self._db.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl_seconds,))
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the store is back under its budget
+        excess = total - self.max_bytes
+        rows = self._db.execute("SELECT key, size FROM completions ORDER BY accessed_at").fetchall()
+        stale = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+        self._db.executemany("DELETE FROM completions WHERE key = ?", stale)
+
+
+def create_completion_cache(settings) -> CompletionCache:
+    if not settings.COMPLETION_CACHE_ENABLED:
+        return CompletionCache(path=None, memory_entries=0)
+    return CompletionCache(
+        path=settings.DATA_DIR / "completion_cache.sqlite3",
+        memory_entries=settings.COMPLETION_CACHE_MEMORY_ENTRIES,
+        ttl_seconds=settings.COMPLETION_CACHE_TTL_SECONDS,
+        max_bytes=settings.COMPLETION_CACHE_MAX_MB * 1024 * 1024,
+    )
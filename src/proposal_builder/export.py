@@ -0,0 +1,614 @@
+"""
+Export of generated proposals to HTML, DOCX and PDF.
+
+Rendering is CPU-bound, so it runs in a pool of worker processes, never in the
+API's event loop or Streamlit's script thread. Rendered files are kept in
+DATA_DIR/exports, named by a hash of the format, title, markdown and this
+module's source, so downloading the same proposal again only reads a file.
+
+The markdown this app produces (headings, paragraphs, bullet and numbered
+lists, tables, rules, code blocks, bold, italic, inline code, links and <br>
+line breaks) is parsed here once; HTML is written directly, DOCX with
+python-docx and PDF with reportlab, which are only imported in the export
+processes.
+"""
+
+import hashlib
+import html
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from functools import cache
+from typing import TYPE_CHECKING, NamedTuple
+from xml.sax.saxutils import escape as xml_escape
+
+# python-docx and reportlab are imported by the renderers, so only the export processes load them
+if TYPE_CHECKING:
+    from reportlab.platypus import ListFlowable
+
+logger = logging.getLogger(__name__)
+
+# Format -> (media type, file extension)
+FORMATS = {
+    "docx": ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "docx"),
+    "pdf": ("application/pdf", "pdf"),
+    "html": ("text/html; charset=utf-8", "html"),
+}
+
+# Changes to the renderers invalidate every cached export
+RENDERER_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
+
+class Run(NamedTuple):
+    """A piece of inline text with its formatting; "\\n" is a line break."""
+    text: str
+    bold: bool = False
+    italic: bool = False
+    code: bool = False
+    link: str | None = None
+
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+LIST_ITEM = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+INLINE = re.compile(
+    r"\*\*(?P<bold>.+?)\*\*"
+    r"|__(?P<bold_>.+?)__"
+    r"|(?<![\w*])\*(?P<italic>[^\s*](?:.*?[^\s*])?)\*(?![\w*])"
+    r"|(?<!\w)_(?P<italic_>[^\s_](?:.*?[^\s_])?)_(?!\w)"
+    r"|`(?P<code>[^`]+)`"
+    r"|\[(?P<label>[^\]]+)\]\((?P<url>[^)\s]+)\)"
+    r"|(?P<br><br\s*/?>)",
+    re.IGNORECASE,
+)
+
+
+def parse_inline(text: str, bold: bool = False, italic: bool = False, link: str | None = None) -> list[Run]:
+    runs = []
+    position = 0
+    for match in INLINE.finditer(text):
+        if match.start() > position:
+            runs.append(Run(html.unescape(text[position:match.start()]), bold, italic, False, link))
+        if match["bold"] or match["bold_"]:
+            runs += parse_inline(match["bold"] or match["bold_"], True, italic, link)
+        elif match["italic"] or match["italic_"]:
+            runs += parse_inline(match["italic"] or match["italic_"], bold, True, link)
+        elif match["code"]:
+            runs.append(Run(match["code"], bold, italic, True, link))
+        elif match["label"]:
+            runs += parse_inline(match["label"], bold, italic, match["url"])
+        else:
+            runs.append(Run("\n", bold, italic, False, link))
+        position = match.end()
+    if position < len(text):
+        runs.append(Run(html.unescape(text[position:]), bold, italic, False, link))
+    return runs
+
+
+def split_cells(line: str) -> list[str]:
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    return [cell.strip().replace("\\|", "|") for cell in re.split(r"(?<!\\)\|", line)]
+
+
+def parse_markdown(markdown: str) -> list[tuple]:
+    """
+    Split markdown into blocks:
+        ("heading", level, runs)
+        ("paragraph", runs)
+        ("list", ordered, [(level, runs), ...])
+        ("table", header cells, rows of cells), cells being lists of runs
+        ("code", text)
+        ("rule",)
+    """
+    blocks = []
+    paragraph = []
+    items = []
+    ordered = False
+    lines = markdown.splitlines()
+
+    def flush() -> None:
+        nonlocal items
+        if paragraph:
+            blocks.append(("paragraph", parse_inline(" ".join(paragraph))))
+            paragraph.clear()
+        if items:
+            blocks.append(("list", ordered, [(level, parse_inline(" ".join(text))) for level, text in items]))
+            items = []
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        if not stripped:
+            # Lines holding only non-breaking spaces are spacers in the templates.
+            # A blank line between two items does not end their list.
+            following = next((other for other in lines[i + 1:] if other.strip()), "")
+            if not (items and LIST_ITEM.match(following)):
+                flush()
+        elif stripped.startswith("```"):
+            flush()
+            code = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith("```"):
+                code.append(lines[i])
+                i += 1
+            blocks.append(("code", "\n".join(code)))
+        elif match := HEADING.match(line):
+            flush()
+            blocks.append(("heading", len(match[1]), parse_inline(match[2])))
+        elif RULE.match(line):
+            flush()
+            blocks.append(("rule",))
+        elif stripped.startswith("|") and i + 1 < len(lines) and TABLE_SEPARATOR.match(lines[i + 1]):
+            flush()
+            header = [parse_inline(cell) for cell in split_cells(line)]
+            rows = []
+            i += 2
+            while i < len(lines) and lines[i].strip().startswith("|"):
+                cells = [parse_inline(cell) for cell in split_cells(lines[i])]
+                rows.append((cells + [[]] * len(header))[:len(header)])
+                i += 1
+            blocks.append(("table", header, rows))
+            continue
+        elif match := LIST_ITEM.match(line):
+            if paragraph:
+                flush()
+            if not items:
+                ordered = match[2][0].isdigit()
+            items.append((len(match[1].expandtabs(4)) // 2, [match[3]]))
+        elif items and line[:1].isspace():
+            items[-1][1].append(stripped)
+        else:
+            if items:
+                flush()
+            paragraph.append(stripped.lstrip(">").strip())
+        i += 1
+    flush()
+    return blocks
+
+
+# HTML
+
+HTML_STYLE = """
+body { font-family: Helvetica, Arial, sans-serif; color: #333333; max-width: 50rem; margin: 2rem auto; padding: 0 1rem; line-height: 1.5; }
+h1, h2, h3, h4 { color: #6a0dad; }
+table { border-collapse: collapse; width: 100%; margin: 1rem 0; }
+th, td { border: 1px solid #cccccc; padding: 0.4rem 0.6rem; text-align: left; vertical-align: top; }
+th { background-color: #e6e6fa; }
+code, pre { font-family: Courier, monospace; background-color: #f5f5f5; }
+pre { padding: 0.75rem; overflow-x: auto; }
+"""
+
+
+def html_runs(runs: list[Run]) -> str:
+    parts = []
+    for run in runs:
+        if run.text == "\n":
+            parts.append("<br>")
+            continue
+        text = html.escape(run.text, quote=False)
+        if run.code:
+            text = f"<code>{text}</code>"
+        if run.italic:
+            text = f"<em>{text}</em>"
+        if run.bold:
+            text = f"<strong>{text}</strong>"
+        if run.link:
+            text = f'<a href="{html.escape(run.link)}">{text}</a>'
+        parts.append(text)
+    return "".join(parts)
+
+
+def render_html(markdown: str, title: str = "") -> bytes:
+    body = []
+    for block in parse_markdown(markdown):
+        kind = block[0]
+        if kind == "heading":
+            body.append(f"<h{block[1]}>{html_runs(block[2])}</h{block[1]}>")
+        elif kind == "paragraph":
+            body.append(f"<p>{html_runs(block[1])}</p>")
+        elif kind == "list":
+            tag = "ol" if block[1] else "ul"
+            depth = -1
+            for level, runs in block[2]:
+                level = min(level, depth + 1)
+                if level > depth:
+                    body.append(f"<{tag}>")
+                else:
+                    body.append("</li>")
+                    body.extend([f"</{tag}></li>"] * (depth - level))
+                depth = level
+                body.append(f"<li>{html_runs(runs)}")
+            body.append("</li>")
+            body.extend([f"</{tag}></li>"] * depth)
+            body.append(f"</{tag}>")
+        elif kind == "table":
+            header = "".join(f"<th>{html_runs(cell)}</th>" for cell in block[1])
+            rows = "".join("<tr>" + "".join(f"<td>{html_runs(cell)}</td>" for cell in row) + "</tr>" for row in block[2])
+            body.append(f"<table><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>")
+        elif kind == "code":
+            body.append(f"<pre><code>{html.escape(block[1], quote=False)}</code></pre>")
+        elif kind == "rule":
+            body.append("<hr>")
+    document = (
+        "<!DOCTYPE html>\n"
+        '<html>\n<head>\n<meta charset="utf-8">\n'
+        f"<title>{html.escape(title)}</title>\n"
+        f"<style>{HTML_STYLE}</style>\n"
+        "</head>\n<body>\n" + "\n".join(body) + "\n</body>\n</html>\n"
+    )
+    return document.encode("utf-8")
+
+
+# DOCX
+
+DOCX_HEADER_FILL = "E6E6FA"
+DOCX_LINK_COLOR = "0563C1"
+
+
+def add_docx_runs(paragraph, runs: list[Run]) -> None:
+    from docx.opc.constants import RELATIONSHIP_TYPE
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    from docx.shared import RGBColor
+
+    hyperlinks = {}
+    for run in runs:
+        if run.text == "\n":
+            paragraph.add_run().add_break()
+            continue
+        added = paragraph.add_run(run.text)
+        added.bold = run.bold or None
+        added.italic = run.italic or None
+        if run.code:
+            added.font.name = "Courier New"
+        if run.link:
+            added.font.underline = True
+            added.font.color.rgb = RGBColor.from_string(DOCX_LINK_COLOR)
+            # Consecutive runs of one link share a single hyperlink element
+            hyperlink = hyperlinks.get(run.link)
+            if hyperlink is None or hyperlink.getnext() is not None:
+                hyperlink = hyperlinks[run.link] = OxmlElement("w:hyperlink")
+                hyperlink.set(qn("r:id"), paragraph.part.relate_to(run.link, RELATIONSHIP_TYPE.HYPERLINK, is_external=True))
+                paragraph._p.append(hyperlink)
+            hyperlink.append(added._r)
+
+
+def restart_numbering(document, style: str) -> int:
+    """Numbering instance of a numbered list style that starts again at 1."""
+    numbering = document.part.numbering_part.element
+    style_num_id = document.styles[style].element.pPr.numPr.numId.val
+    num = numbering.add_num(numbering.num_having_numId(style_num_id).abstractNumId.val)
+    num.add_lvlOverride(ilvl=0).add_startOverride(1)
+    return num.numId
+
+
+def render_docx(markdown: str, title: str = "") -> bytes:
+    import docx
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    from docx.shared import Pt
+
+    document = docx.Document()
+    document.core_properties.title = title
+    for block in parse_markdown(markdown):
+        kind = block[0]
+        if kind == "heading":
+            add_docx_runs(document.add_heading(level=min(block[1], 9)), block[2])
+        elif kind == "paragraph":
+            add_docx_runs(document.add_paragraph(), block[1])
+        elif kind == "list":
+            # Every numbered list restarts at 1
+            num_id = restart_numbering(document, "List Number") if block[1] else None
+            for level, runs in block[2]:
+                level = min(level, 2)
+                style = ("List Number" if num_id is not None else "List Bullet") + (f" {level + 1}" if level else "")
+                paragraph = document.add_paragraph(style=style)
+                if num_id is not None and level == 0:
+                    paragraph._p.get_or_add_pPr().get_or_add_numPr().get_or_add_numId().val = num_id
+                add_docx_runs(paragraph, runs)
+        elif kind == "table":
+            header, rows = block[1], block[2]
+            table = document.add_table(rows=1, cols=len(header), style="Table Grid")
+            for cell, runs in zip(table.rows[0].cells, header):
+                add_docx_runs(cell.paragraphs[0], [run._replace(bold=True) for run in runs])
+                shading = OxmlElement("w:shd")
+                shading.set(qn("w:val"), "clear")
+                shading.set(qn("w:fill"), DOCX_HEADER_FILL)
+                cell._tc.get_or_add_tcPr().append(shading)
+            # The header row is repeated on every page the table spans
+            table.rows[0]._tr.get_or_add_trPr().append(OxmlElement("w:tblHeader"))
+            for row in rows:
+                for cell, runs in zip(table.add_row().cells, row):
+                    add_docx_runs(cell.paragraphs[0], runs)
+            # Keeps consecutive tables apart
+            document.add_paragraph()
+        elif kind == "code":
+            for line in block[1].split("\n"):
+                paragraph = document.add_paragraph()
+                paragraph.paragraph_format.space_after = Pt(0)
+                add_docx_runs(paragraph, [Run(line, code=True)])
+        elif kind == "rule":
+            border = OxmlElement("w:pBdr")
+            bottom = OxmlElement("w:bottom")
+            for name, value in {"val": "single", "sz": "6", "space": "1", "color": "BFBFBF"}.items():
+                bottom.set(qn(f"w:{name}"), value)
+            border.append(bottom)
+            document.add_paragraph()._p.get_or_add_pPr().append(border)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+# PDF
+
+PDF_MARGIN = 56
+
+
+@cache
+def pdf_styles() -> dict:
+    """Paragraph styles by name: body, cell, code and heading1 to heading6."""
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+    sample = getSampleStyleSheet()
+    body = ParagraphStyle("Body", sample["BodyText"], fontSize=10.5, leading=14, spaceAfter=6, textColor="#333333")
+    styles = {
+        "body": body,
+        "cell": ParagraphStyle("Cell", body, fontSize=9, leading=12, spaceAfter=0),
+        "code": ParagraphStyle("Code", sample["Code"], fontSize=9, leading=12, leftIndent=8),
+    }
+    for level in range(1, 7):
+        styles[f"heading{level}"] = ParagraphStyle(
+            f"Heading{level}", sample[f"Heading{level}"], textColor="#6a0dad", keepWithNext=True
+        )
+    return styles
+
+
+def pdf_runs(runs: list[Run]) -> str:
+    """Runs as reportlab paragraph markup."""
+    parts = []
+    for run in runs:
+        if run.text == "\n":
+            parts.append("<br/>")
+            continue
+        text = xml_escape(run.text)
+        if run.code:
+            text = f'<font face="Courier">{text}</font>'
+        if run.italic:
+            text = f"<i>{text}</i>"
+        if run.bold:
+            text = f"<b>{text}</b>"
+        if run.link:
+            text = f'<a href="{xml_escape(run.link, {chr(34): "&quot;"})}" color="#0563C1"><u>{text}</u></a>'
+        parts.append(text)
+    return "".join(parts)
+
+
+def pdf_list(items: list[tuple[int, list[Run]]], ordered: bool, level: int = 0) -> "ListFlowable":
+    """Nested list flowable; only the top level of a numbered list is numbered."""
+    from reportlab.platypus import ListFlowable, ListItem, Paragraph
+
+    body = pdf_styles()["body"]
+    flowables = []
+    i = 0
+    while i < len(items):
+        item = [Paragraph(pdf_runs(items[i][1]), body)]
+        i += 1
+        children = []
+        while i < len(items) and items[i][0] > level:
+            children.append(items[i])
+            i += 1
+        if children:
+            item.append(pdf_list(children, False, level + 1))
+        flowables.append(ListItem(item))
+    if ordered:
+        return ListFlowable(flowables, bulletType="1", bulletFormat="%s.", bulletFontSize=body.fontSize, leftIndent=18)
+    return ListFlowable(flowables, bulletType="bullet", start="•", bulletFontSize=body.fontSize, leftIndent=18)
+
+
+@cache
+def numbered_canvas() -> type:
+    """Canvas class that writes "page / pages" at the foot of every page once the page count is known."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen.canvas import Canvas
+
+    class NumberedCanvas(Canvas):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._pages = []
+
+        def showPage(self):
+            self._pages.append(dict(self.__dict__))
+            self._startPage()
+
+        def save(self):
+            for state in self._pages:
+                self.__dict__.update(state)
+                self.setFont("Helvetica", 8)
+                self.setFillGray(0.4)
+                self.drawCentredString(A4[0] / 2, PDF_MARGIN / 2, f"{self._pageNumber} / {len(self._pages)}")
+                super().showPage()
+            super().save()
+
+    return NumberedCanvas
+
+
+def render_pdf(markdown: str, title: str = "") -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import HRFlowable, Paragraph, Preformatted, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = pdf_styles()
+    story = []
+    width = A4[0] - 2 * PDF_MARGIN
+    for block in parse_markdown(markdown):
+        kind = block[0]
+        if kind == "heading":
+            story.append(Paragraph(pdf_runs(block[2]), styles[f"heading{block[1]}"]))
+        elif kind == "paragraph":
+            story.append(Paragraph(pdf_runs(block[1]), styles["body"]))
+        elif kind == "list":
+            story.append(pdf_list(block[2], block[1]))
+            story.append(Spacer(0, 4))
+        elif kind == "table":
+            header, rows = block[1], block[2]
+            cells = [[Paragraph(pdf_runs(cell), styles["cell"]) for cell in row] for row in [header] + rows]
+            table = Table(cells, colWidths=[width / len(header)] * len(header), repeatRows=1)
+            table.setStyle(TableStyle([
+                ("GRID", (0, 0), (-1, -1), 0.5, "#bfbfbf"),
+                ("BACKGROUND", (0, 0), (-1, 0), "#e6e6fa"),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ]))
+            story.append(table)
+            story.append(Spacer(0, 8))
+        elif kind == "code":
+            story.append(Preformatted(block[1], styles["code"]))
+        elif kind == "rule":
+            story.append(HRFlowable(width="100%", thickness=0.5, color="#bfbfbf", spaceBefore=6, spaceAfter=6))
+    buffer = io.BytesIO()
+    document = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=PDF_MARGIN,
+        rightMargin=PDF_MARGIN,
+        topMargin=PDF_MARGIN,
+        bottomMargin=PDF_MARGIN,
+        title=title,
+    )
+    document.build(story, canvasmaker=numbered_canvas())
+    return buffer.getvalue()
+
+
+RENDERERS = {"html": render_html, "docx": render_docx, "pdf": render_pdf}
+
+
+def render(markdown: str, format: str, title: str = "") -> bytes:
+    return RENDERERS[format](markdown, title)
+
+
+def render_to_file(markdown: str, format: str, title: str, path: Path | None) -> bytes:
+    """Render in a pool process and write the cache file atomically."""
+    content = render(markdown, format, title)
+    if path is not None:
+        temporary = path.with_name(f".{path.name}.{os.getpid()}")
+        temporary.write_bytes(content)
+        os.replace(temporary, path)
+    return content
+
+
+class Exporter:
+    def __init__(self, cache_dir: Path | None = None, processes: int = 2, max_bytes: int = 200 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: Directory of rendered files, or None to render every time
+            processes: Size of the rendering process pool, started on first use
+            max_bytes: Size of the cache above which the least recently used files are removed
+        """
+        self.cache_dir = cache_dir
+        self.processes = processes
+        self.max_bytes = max_bytes
+        if cache_dir is not None:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+        self._pool = None
+        self._lock = threading.Lock()
+        # Key -> render in progress, so concurrent downloads of one file render it once
+        self._in_flight: dict[str, Future] = {}
+
+    @staticmethod
+    def key(markdown: str, format: str, title: str = "") -> str:
+        payload = "\0".join([RENDERER_VERSION, format, title, markdown])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def export(self, markdown: str, format: str, title: str = "") -> Future:
+        """Future of the rendered file's bytes; resolved at once when it is cached."""
+        if format not in FORMATS:
+            raise ValueError(f"Unknown export format {format!r}; expected one of {', '.join(FORMATS)}")
+        key = self.key(markdown, format, title)
+        path = None if self.cache_dir is None else self.cache_dir / f"{key}.{FORMATS[format][1]}"
+        if path is not None and path.exists():
+            future = Future()
+            try:
+                future.set_result(path.read_bytes())
+                os.utime(path)
+                return future
+            except FileNotFoundError:
+                # Removed by a concurrent cleanup; render it again
+                pass
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._submit(render_to_file, markdown, format, title, path)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._landed(key))
+        return future
+
+    def _submit(self, *args) -> Future:
+        if self._pool is None:
+            # Spawned rather than forked: the API and Streamlit processes are multi-threaded
+            self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            return self._pool.submit(*args)
+        except BrokenProcessPool:
+            logger.warning("Export process pool broke; starting a new one")
+            self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool.submit(*args)
+
+    def _landed(self, key: str) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+        self.prune()
+
+    def prune(self) -> None:
+        """Remove the least recently used files while the cache is over max_bytes."""
+        if self.cache_dir is None:
+            return
+        files = []
+        for path in self.cache_dir.iterdir():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if not path.name.startswith("."):
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def export_title(data: dict) -> str:
+    """Document title of a proposal, from its form data."""
+    return " - ".join(part for part in (data.get("project_name"), data.get("client_name")) if part) or "Proposal"
+
+
+def export_filename(data: dict, format: str) -> str:
+    """ASCII file name for a proposal export, e.g. Proposal-ACME-Churn-model.pdf."""
+    name = unicodedata.normalize("NFKD", export_title(data)).encode("ascii", "ignore").decode()
+    name = re.sub(r"[^A-Za-z0-9]+", "-", name).strip("-") or "proposal"
+    return f"Proposal-{name}.{FORMATS[format][1]}"
+
+
+def create_exporter(settings) -> Exporter:
+    return Exporter(
+        cache_dir=settings.DATA_DIR / "exports",
+        processes=settings.EXPORT_PROCESSES,
+        max_bytes=settings.EXPORT_CACHE_MAX_MB * 1024 * 1024,
+    )
@@ -0,0 +1,300 @@
+"""
+Durable job queue shared by the API and worker processes.
+
+Jobs live in a SQLite file (WAL mode) in DATA_DIR, so any number of API and
+worker processes on the machine, or containers sharing the volume, can
+enqueue and consume them. A worker leases a job for JOB_LEASE_SECONDS and
+renews the lease with heartbeats while it runs; a job whose worker crashed
+is leased again once its lease expires, up to JOB_MAX_ATTEMPTS times.
+
+Stream events (finished sections and LLM tokens) are kept in the same file,
+so a job can be streamed from whichever API process serves the request, and
+so are cancellation requests, which the worker running a job polls for.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Stream events of finished jobs are kept this long for clients still reading them
+EVENT_RETENTION_SECONDS = 600
+
+
+class JobQueue:
+    def __init__(self, path: Path | None = None, lease_seconds: float = 30, max_attempts: int = 3):
+        """
+        Args:
+            path: SQLite file, or None for a queue private to this process
+            lease_seconds: How long a job stays leased without a heartbeat
+            max_attempts: Leases of a job before it is given up on
+        """
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Jobs that finished before this had their events pruned by this queue already
+        self._pruned_until = 0.0
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit; transactions that must be atomic across processes use BEGIN IMMEDIATE
+        self._db = sqlite3.connect(
+            ":memory:" if path is None else path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                -- queued | leased | completed | partial | failed | cancelled
+                status TEXT NOT NULL,
+                -- request_key of the job, to attach identical requests to it
+                key TEXT,
+                -- Requests attached to the job; it is only cancelled once all of them gave it up
+                clients INTEGER NOT NULL DEFAULT 1,
+                batch_id TEXT,
+                worker TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+            CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id, status);
+            -- Events of jobs finished before the retention period are pruned on every finish
+            CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+            CREATE TABLE IF NOT EXISTS batches (
+                id TEXT PRIMARY KEY,
+                -- Jobs of the batch leased at the same time, at most
+                concurrency INTEGER NOT NULL,
+                -- Batch line id -> job id
+                jobs TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            -- Leased jobs their worker should stop
+            CREATE TABLE IF NOT EXISTS cancellations (
+                job_id TEXT PRIMARY KEY,
+                requested_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            );
+            """
+        )
+
+    def enqueue(self, job_id: str, payload: dict, key: str | None = None, batch_id: str | None = None) -> str:
+        """
+        Queue a job, unless a job with the same key is already queued or
+        running, in which case the request is attached to that job. Returns
+        the id of the job that will serve the request.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = None if key is None else self._db.execute(
+                    """
+                    SELECT id FROM jobs
+                    WHERE key = ? AND status IN ('queued', 'leased') AND id NOT IN (SELECT job_id FROM cancellations)
+                    ORDER BY created_at LIMIT 1
+                    """,
+                    (key,),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE jobs SET clients = clients + 1 WHERE id = ?", (row[0],))
+                else:
+                    self._db.execute(
+                        "INSERT INTO jobs (id, payload, status, key, batch_id, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                        (job_id, json.dumps(payload, ensure_ascii=False), key, batch_id, time.time()),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return job_id if row is None else row[0]
+
+    def lease(self, worker: str) -> tuple[str, dict] | None:
+        """
+        Lease the oldest job that is queued or whose lease expired, skipping
+        jobs of batches already running at their concurrency. Returns the job
+        id and payload, or None when there is nothing to run.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    """
+                    SELECT id, payload FROM jobs
+                    WHERE (status = 'queued' OR (status = 'leased' AND lease_expires_at < ?))
+                        AND attempts < ?
+                        AND (
+                            batch_id IS NULL
+                            OR (SELECT COUNT(*) FROM jobs AS running
+                                WHERE running.batch_id = jobs.batch_id AND running.status = 'leased' AND running.lease_expires_at >= ?)
+                               < (SELECT concurrency FROM batches WHERE batches.id = jobs.batch_id)
+                        )
+                    ORDER BY created_at
+                    LIMIT 1
+                    """,
+                    (now, self.max_attempts, now),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'leased', worker = ?, lease_expires_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        (worker, now + self.lease_seconds, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def heartbeat(self, job_id: str, worker: str) -> bool:
+        """Extend the lease; False when the worker no longer holds it."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id: str, worker: str, status: str) -> bool:
+        """Record the outcome (completed, partial, failed or cancelled) of a leased job; False when the lease was lost."""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, lease_expires_at = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+                (status, now, job_id, worker),
+            )
+            # Only jobs that left the retention period since the last prune are looked at
+            self._db.execute(
+                "DELETE FROM events WHERE job_id IN (SELECT id FROM jobs WHERE finished_at >= ? AND finished_at < ?)",
+                (self._pruned_until, now - EVENT_RETENTION_SECONDS),
+            )
+            self._pruned_until = now - EVENT_RETENTION_SECONDS
+            self._db.execute("DELETE FROM cancellations WHERE job_id = ?", (job_id,))
+        return cursor.rowcount == 1
+
+    def cancel(self, job_id: str) -> str | None:
+        """
+        Cancel a job for one of the requests attached to it: a queued one is
+        cancelled right away, a leased one is flagged for its worker to stop.
+        While other requests are still attached, the request is only detached
+        and "attached" is returned. Otherwise returns the job's status before
+        (None when there is no such job); finished jobs are left alone.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT status, clients FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is not None and row[0] in ("queued", "leased") and row[1] > 1:
+                    self._db.execute("UPDATE jobs SET clients = clients - 1 WHERE id = ?", (job_id,))
+                    row = ("attached",)
+                elif row is not None and row[0] == "queued":
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?", (now, job_id)
+                    )
+                elif row is not None and row[0] == "leased":
+                    self._db.execute(
+                        "INSERT OR IGNORE INTO cancellations (job_id, requested_at) VALUES (?, ?)", (job_id, now)
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return row[0] if row else None
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM cancellations WHERE job_id = ?", (job_id,)).fetchone()
+        return row is not None
+
+    def abandon(self) -> list[str]:
+        """Fail jobs whose last allowed lease expired (their worker kept crashing); returns their ids."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [
+                    job_id
+                    for (job_id,) in self._db.execute(
+                        "SELECT id FROM jobs WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= ?",
+                        (now, self.max_attempts),
+                    )
+                ]
+                self._db.executemany(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, lease_expires_at = NULL WHERE id = ?",
+                    [(now, job_id) for job_id in ids],
+                )
+                self._db.executemany("DELETE FROM cancellations WHERE job_id = ?", [(job_id,) for job_id in ids])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return ids
+
+    def status(self, job_id: str) -> str | None:
+        with self._lock:
+            row = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def publish(self, job_id: str, events: list[tuple[str, dict]]) -> None:
+        """Append stream events of a job, in order."""
+        if not events:
+            return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                (last,) = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM events WHERE job_id = ?", (job_id,)).fetchone()
+                self._db.executemany(
+                    "INSERT INTO events (job_id, seq, event, data) VALUES (?, ?, ?, ?)",
+                    [(job_id, last + i + 1, event, json.dumps(data, ensure_ascii=False)) for i, (event, data) in enumerate(events)],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def events(self, job_id: str, after: int = 0) -> list[tuple[int, str, dict]]:
+        """Stream events of a job after sequence number `after`, as (seq, event, data)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, event, data FROM events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        return [(seq, event, json.loads(data)) for seq, event, data in rows]
+
+    def create_batch(self, batch_id: str, jobs: dict[str, str], concurrency: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO batches (id, concurrency, jobs, created_at) VALUES (?, ?, ?, ?)",
+                (batch_id, concurrency, json.dumps(jobs), time.time()),
+            )
+
+    def batch(self, batch_id: str) -> dict | None:
+        """A batch's jobs, start time, job counts by status and when its last job finished."""
+        with self._lock:
+            row = self._db.execute("SELECT jobs, created_at FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY status", (batch_id,)
+            ).fetchall())
+            (finished_at,) = self._db.execute("SELECT MAX(finished_at) FROM jobs WHERE batch_id = ?", (batch_id,)).fetchone()
+        return {"jobs": json.loads(row[0]), "created_at": row[1], "counts": counts, "finished_at": finished_at}
+
+
+def create_job_queue(settings) -> JobQueue:
+    # Proposals kept in memory can only be written by workers in the same process, so their jobs stay there too
+    return JobQueue(
+        path=settings.DATA_DIR / "jobs.sqlite3" if settings.PROPOSAL_STORE_ENABLED else None,
+        lease_seconds=settings.JOB_LEASE_SECONDS,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
@@ -1,8 +1,272 @@
-from openai import AzureOpenAI
+import asyncio
+import importlib.util
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Callable
+import httpx
+from openai import AsyncAzureOpenAI, AzureOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
+
+try:
+    import fcntl
+except ImportError:  # Windows: the limiter is then shared by threads only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Process-wide clients, built on first use so importing the package needs no credentials
+_llm = None
+_async_llms = weakref.WeakKeyDictionary()  # event loop -> client; async connections belong to one loop
+_llm_lock = threading.Lock()
+
+def http_options(settings) -> dict:
+    """Connection pool, keep-alive, timeout and HTTP/2 options shared by the sync and async transports."""
+    http2 = settings.LLM_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("LLM_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+        http2 = False
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_SECONDS,
+        ),
+        # The read timeout is per chunk, so it only has to cover the time to first token
+        "timeout": httpx.Timeout(settings.LLM_READ_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+        "http2": http2,
+    }
+
+def client_options(settings) -> dict:
+    return {
+        "api_key": settings.AZURE_OPENAI_API_KEY,
+        "base_url": settings.AZURE_OPENAI_ENDPOINT + "openai/",
+        "api_version": settings.AZURE_OPENAI_API_VERSION,
+        # The client applies its own timeout to every request, overriding the transport's
+        "timeout": httpx.Timeout(settings.LLM_READ_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+        # Retries are done (and counted) by agent.create_completion
+        "max_retries": 0,
+    }
 
 def create_llm(settings) -> AzureOpenAI:
-    return AzureOpenAI(
-        api_key=settings.AZURE_OPENAI_API_KEY,
-        base_url=settings.AZURE_OPENAI_ENDPOINT + "openai/",
-        api_version=settings.AZURE_OPENAI_API_VERSION,
-    )
\ No newline at end of file
+    return AzureOpenAI(http_client=DefaultHttpxClient(**http_options(settings)), **client_options(settings))
+
+def create_async_llm(settings) -> AsyncAzureOpenAI:
+    return AsyncAzureOpenAI(http_client=DefaultAsyncHttpxClient(**http_options(settings)), **client_options(settings))
+
+def get_llm(settings) -> AzureOpenAI:
+    """The process-wide client; every section call shares its connection pool."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = create_llm(settings)
+    return _llm
+
+def get_async_llm(settings) -> AsyncAzureOpenAI:
+    """The async client for the running event loop, shared by every coroutine on it."""
+    loop = asyncio.get_running_loop()
+    with _llm_lock:
+        client = _async_llms.get(loop)
+        if client is None:
+            client = _async_llms[loop] = create_async_llm(settings)
+    return client
+
+def warm_up(settings, connections: int | None = None) -> None:
+    """
+    Open `connections` pooled connections (default LLM_WARMUP_CONNECTIONS) so the
+    first section calls do not pay for DNS, TCP and TLS setup. Failures are only
+    logged; the calls themselves will surface a real problem.
+    """
+    connections = settings.LLM_WARMUP_CONNECTIONS if connections is None else connections
+    if connections <= 0 or not settings.AZURE_OPENAI_ENDPOINT:
+        return
+    llm = get_llm(settings)
+
+    def ping(_) -> None:
+        # Any answer, even an error status, leaves a kept-alive connection behind
+        try:
+            llm.models.list()
+        except Exception as e:
+            logger.debug("LLM warm-up request failed: %s", e)
+
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        list(executor.map(ping, range(connections)))
+
+class RateLimiter:
+    """
+    Client-side admission for the deployment's requests-per-minute and
+    tokens-per-minute quotas.
+
+    Each quota is a token bucket that refills continuously at quota/60 per
+    second, up to one minute of quota. A call is admitted once both buckets
+    hold its cost; the tokens it reserves (estimated prompt plus completion)
+    are settled against the real usage when it finishes. The buckets live in a
+    small JSON file locked with flock, so every thread, coroutine and process
+    using the same file draws from the same quota.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, path: Path | None = None):
+        """
+        Args:
+            requests_per_minute: Request quota, or 0 for no limit
+            tokens_per_minute: Token quota, or 0 for no limit
+            path: State file shared between processes, or None to share
+                within this process only
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch(exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_minute > 0 or self.tokens_per_minute > 0
+
+    def try_acquire(self, tokens: int) -> float:
+        """Admit a call costing `tokens` and return 0, or return the seconds to wait before trying again."""
+        if not self.enabled:
+            return 0.0
+        # A call larger than the whole bucket is admitted once the bucket is full
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        def admit(state: dict, now: float) -> float:
+            if state["paused_until"] > now:
+                return state["paused_until"] - now
+            waits = [0.0]
+            if self.requests_per_minute and state["requests"] < 1:
+                waits.append((1 - state["requests"]) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute and state["tokens"] < tokens:
+                waits.append((tokens - state["tokens"]) * 60 / self.tokens_per_minute)
+            wait = max(waits)
+            if wait == 0:
+                if self.requests_per_minute:
+                    state["requests"] -= 1
+                if self.tokens_per_minute:
+                    state["tokens"] -= tokens
+            return wait
+
+        return self._update(admit)
+
+    def acquire(self, tokens: int, sleep: Callable[[float], None] = time.sleep) -> float:
+        """
+        Block until a call costing `tokens` is admitted; returns the seconds
+        waited. Waits go through `sleep`, which may raise to give up.
+        """
+        started = time.monotonic()
+        while (wait := self.try_acquire(tokens)) > 0:
+            sleep(wait)
+        return time.monotonic() - started
+
+    async def acquire_async(self, tokens: int) -> float:
+        """Like acquire, without blocking the event loop while waiting."""
+        started = time.monotonic()
+        while (wait := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+        return time.monotonic() - started
+
+    def settle(self, reserved: int, used: int, request: bool = True) -> None:
+        """
+        Correct the token bucket once a call's real usage is known. A call that
+        never reached the model (request=False) also gives its request back.
+        """
+        if not self.enabled:
+            return
+
+        def correct(state: dict, now: float) -> None:
+            if self.tokens_per_minute:
+                state["tokens"] = min(state["tokens"] + reserved - used, self.tokens_per_minute)
+            if self.requests_per_minute and not request:
+                state["requests"] = min(state["requests"] + 1, self.requests_per_minute)
+
+        self._update(correct)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller back for `seconds`, e.g. after a 429 with Retry-After."""
+        if not self.enabled:
+            return
+
+        def hold(state: dict, now: float) -> None:
+            state["paused_until"] = max(state["paused_until"], now + seconds)
+
+        self._update(hold)
+
+    def _update(self, change):
+        with self._lock:
+            if self.path is None:
+                return self._apply(change)
+            with open(self.path, "r+", encoding="utf-8") as file:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    self._state = json.loads(file.read() or "null")
+                    result = self._apply(change)
+                    file.seek(0)
+                    file.truncate()
+                    file.write(json.dumps(self._state))
+                    # Written out before the lock is released, not when the file closes
+                    file.flush()
+                    return result
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _apply(self, change):
+        # Wall-clock time, since the state is shared between processes
+        now = time.time()
+        state = self._state
+        if state is None:
+            state = {"requests": self.requests_per_minute, "tokens": self.tokens_per_minute, "paused_until": 0.0, "updated": now}
+        elapsed = max(0.0, now - state["updated"])
+        state["requests"] = min(self.requests_per_minute, state["requests"] + elapsed * self.requests_per_minute / 60)
+        state["tokens"] = min(self.tokens_per_minute, state["tokens"] + elapsed * self.tokens_per_minute / 60)
+        state["updated"] = now
+        self._state = state
+        return change(state, now)
+
+def create_rate_limiter(settings) -> RateLimiter:
+    if not (settings.AZURE_OPENAI_RPM or settings.AZURE_OPENAI_TPM):
+        return RateLimiter()
+    path = settings.DATA_DIR / "rate_limit.json" if settings.RATE_LIMIT_SHARED else None
+    return RateLimiter(settings.AZURE_OPENAI_RPM, settings.AZURE_OPENAI_TPM, path)
+
+def retry_after(error: Exception) -> float | None:
+    """Seconds the server asked us to wait (retry-after-ms or Retry-After headers), if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+    return None
+
+def backoff_delay(attempt: int, server_delay: float | None = None, base: float = 0.5, cap: float = 8.0) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based): the server's
+    Retry-After when it sent one, otherwise exponential backoff. Either way a
+    random share is added or kept so that callers rejected together do not all
+    come back at the same moment.
+    """
+    if server_delay is not None:
+        return server_delay + random.uniform(0, min(1.0, base + server_delay * 0.1))
+    delay = min(base * 2 ** attempt, cap)
+    return delay / 2 + random.uniform(0, delay / 2)
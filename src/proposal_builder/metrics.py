@@ -0,0 +1,289 @@
+"""
+Latency and token instrumentation for proposal generation.
+
+Every LLM call is recorded in process-wide counters and histograms, and
+summarized per proposal. Once share() is called, every process also writes its
+metrics to a file in a shared directory (DATA_DIR/metrics), and /metrics on any
+API process reports the sum over all of them, workers included. A file is kept
+after its process exits, so counters never go back.
+"""
+
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+# How often a process writes its metrics to the shared directory
+FLUSH_SECONDS = 5.0
+# Seconds; LLM calls range from sub-second cache hits to multi-minute descriptions
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple, extra: dict | None = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self, states: list | None = None) -> list[str]:
+        """Exposition lines of this process's series, or of the sum of `states` (see state)."""
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def state(self) -> list:
+        """This process's series, as JSON."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _changed.set()
+
+    def total(self, **labels) -> float:
+        """Sum over every series matching the given labels."""
+        positions = [(self.labelnames.index(name), str(value)) for name, value in labels.items()]
+        with self._lock:
+            return sum(
+                value for key, value in self._values.items()
+                if all(key[i] == wanted for i, wanted in positions)
+            )
+
+    def state(self) -> list:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render(self, states: list | None = None) -> list[str]:
+        lines = super().render()
+        for key, value in sorted(self._merge(states).items()):
+            lines.append(f"{self.name}{self._labels(key)} {value}")
+        return lines
+
+    def _merge(self, states: list | None) -> dict:
+        if states is None:
+            with self._lock:
+                return dict(self._values)
+        values = {}
+        for state in states:
+            for key, value in state:
+                values[tuple(key)] = values.get(tuple(key), 0) + value
+        return values
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+        _changed.set()
+
+    def state(self) -> list:
+        with self._lock:
+            return [[list(key), counts[:], total, count] for key, (counts, total, count) in self._series.items()]
+
+    def render(self, states: list | None = None) -> list[str]:
+        lines = super().render()
+        for key, (counts, total, count) in sorted(self._merge(states).items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{self._labels(key, {'le': bound})} {bucket_count}")
+            lines.append(f"{self.name}_bucket{self._labels(key, {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+    def _merge(self, states: list | None) -> dict:
+        if states is None:
+            with self._lock:
+                return {key: (counts[:], total, count) for key, (counts, total, count) in self._series.items()}
+        series = {}
+        for state in states:
+            for key, counts, total, count in state:
+                merged = series.setdefault(tuple(key), [[0] * len(self.buckets), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return series
+
+
+REGISTRY = []
+# Set by every change, cleared once the change is written to the shared directory
+_changed = threading.Event()
+# This process's file in the shared directory, once share() was called
+_file: Path | None = None
+_flush_lock = threading.Lock()
+
+CALL_LABELS = ("section", "call", "project_type", "language")
+
+LLM_CALLS = Counter("proposal_llm_calls_total", "LLM calls by section and result source (cache: miss, hit, shared)", CALL_LABELS + ("cache",))
+LLM_QUEUE_WAIT = Histogram("proposal_llm_queue_wait_seconds", "Time a section waited for a worker before its LLM call", CALL_LABELS)
+LLM_RATE_LIMIT_WAIT = Histogram("proposal_llm_rate_limit_wait_seconds", "Time an LLM call was held back by the client-side rate limiter", CALL_LABELS)
+LLM_TIME_TO_FIRST_TOKEN = Histogram("proposal_llm_time_to_first_token_seconds", "Time from request to first content token", CALL_LABELS)
+LLM_LATENCY = Histogram("proposal_llm_latency_seconds", "Total LLM call latency, including retries", CALL_LABELS)
+LLM_TOKENS = Counter("proposal_llm_tokens_total", "Tokens used by LLM calls (kind: prompt, completion, cached)", CALL_LABELS + ("kind",))
+LLM_RETRIES = Counter("proposal_llm_retries_total", "Retried LLM requests", CALL_LABELS)
+LLM_TRUNCATED = Counter("proposal_llm_truncated_total", "LLM calls cut off by their section's max_tokens", CALL_LABELS)
+LLM_ERRORS = Counter("proposal_llm_errors_total", "LLM calls that failed after all retries", CALL_LABELS)
+SECTION_FAILURES = Counter(
+    "proposal_section_failures_total",
+    "Sections left out of a proposal (reason: timeout, cancelled, error)",
+    ("section", "project_type", "language", "reason"),
+)
+PROPOSAL_DURATION = Histogram("proposal_generation_seconds", "Wall-clock time to generate a proposal", ("project_type", "language"))
+
+
+def record_call(record: dict, project_type: str, language: str) -> None:
+    """Add one LLM call record (see agent.complete) to the process-wide metrics."""
+    labels = {"section": record["section"], "call": record["call"], "project_type": project_type, "language": language}
+    LLM_CALLS.inc(cache="hit" if record["cache_hit"] else "shared" if record["shared"] else "miss", **labels)
+    LLM_QUEUE_WAIT.observe(record["queue_wait_seconds"], **labels)
+    if record["cache_hit"] or record["shared"]:
+        return
+    LLM_LATENCY.observe(record["latency_seconds"], **labels)
+    LLM_RATE_LIMIT_WAIT.observe(record["rate_limit_wait_seconds"], **labels)
+    if record["time_to_first_token_seconds"] is not None:
+        LLM_TIME_TO_FIRST_TOKEN.observe(record["time_to_first_token_seconds"], **labels)
+    for kind in ("prompt", "completion", "cached"):
+        LLM_TOKENS.inc(record[f"{kind}_tokens"], kind=kind, **labels)
+    if record["retries"]:
+        LLM_RETRIES.inc(record["retries"], **labels)
+    if record["truncated"]:
+        LLM_TRUNCATED.inc(**labels)
+
+
+def summarize_calls(calls: list[dict]) -> dict:
+    """Per-proposal summary of LLM call records, in total and per section."""
+    summary = {
+        "llm_calls": 0,
+        "cache_hits": 0,
+        "shared_calls": 0,
+        "retries": 0,
+        "rate_limit_wait_seconds": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "sections": {},
+    }
+    for record in calls:
+        section = summary["sections"].setdefault(record["section"], {
+            "llm_calls": 0,
+            "cache_hits": 0,
+            "shared_calls": 0,
+            "retries": 0,
+            "rate_limit_wait_seconds": 0.0,
+            "queue_wait_seconds": record["queue_wait_seconds"],
+            "time_to_first_token_seconds": None,
+            "latency_seconds": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+        })
+        # A section can take several calls (e.g. the Gen-OS refinement); the
+        # first token is the first one its final call streamed
+        if record["time_to_first_token_seconds"] is not None:
+            section["time_to_first_token_seconds"] = section["latency_seconds"] + record["time_to_first_token_seconds"]
+        section["latency_seconds"] += record["latency_seconds"]
+        for totals in (summary, section):
+            totals["llm_calls"] += 1
+            totals["cache_hits"] += int(record["cache_hit"])
+            totals["shared_calls"] += int(record["shared"])
+            totals["retries"] += record["retries"]
+            totals["rate_limit_wait_seconds"] += record["rate_limit_wait_seconds"]
+            for kind in ("prompt", "completion", "cached"):
+                totals[f"{kind}_tokens"] += record[f"{kind}_tokens"]
+    return summary
+
+
+def share(directory: Path, interval: float = FLUSH_SECONDS) -> None:
+    """
+    Write this process's metrics to its own file in `directory` every
+    `interval` seconds and at exit, and render the sum over every file there.
+    """
+    global _file
+    if _file is not None:
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+    # The pid alone is not unique: containers sharing the directory reuse pids
+    _file = directory / f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+    _changed.set()
+    flush()
+    threading.Thread(target=_flush_every, args=(interval,), daemon=True).start()
+    atexit.register(flush)
+
+
+def flush() -> None:
+    """Write this process's metrics to the shared directory, if they changed since the last write."""
+    if _file is None:
+        return
+    with _flush_lock:
+        if not _changed.is_set():
+            return
+        _changed.clear()
+        temporary = _file.with_suffix(".tmp")
+        temporary.write_text(json.dumps({metric.name: metric.state() for metric in REGISTRY}))
+        os.replace(temporary, _file)
+
+
+def _flush_every(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        flush()
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format, summed over every sharing process."""
+    states = None
+    if _file is not None:
+        flush()
+        states = {}
+        for path in _file.parent.glob("*.json"):
+            try:
+                written = json.loads(path.read_text())
+            except (FileNotFoundError, ValueError):
+                # Removed, or not fully written by a process that was killed mid-write
+                continue
+            for name, state in written.items():
+                states.setdefault(name, []).append(state)
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(None if states is None else states.get(metric.name, [])))
+    return "\n".join(lines) + "\n"
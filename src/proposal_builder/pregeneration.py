@@ -0,0 +1,166 @@
+"""
+Sections generated in the background while the proposal form is being filled.
+
+Once the inputs of a section are filled in and have stopped changing for a
+short while, the section is generated in a thread pool, so that submitting the
+form mostly assembles sections that are already written. A run whose inputs
+change again is cancelled and replaced. Results are kept with the form data they were written for
+and are only handed out while that section's inputs (and prompts) are
+unchanged. A section still being written when the form is submitted is not
+started again: the submission's identical LLM calls join the ones in flight.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass, field
+
+from proposal_builder.agent import (
+    LLM_SECTION_GENERATORS,
+    SECTION_INPUTS,
+    GenerationRun,
+    generate_executive_summary,
+    generate_project_description,
+    prompt_versions,
+    reusable_sections,
+)
+
+logger = logging.getLogger(__name__)
+
+# Free-text fields a section needs before it is worth generating; the project
+# description group also writes the executive summary
+REQUIRED_FIELDS = {
+    "project_description": ["client_name", "general_description"],
+    "timeline_planning": ["planning"],
+    "stakeholders_and_team": ["client_name", "client_stakeholders", "daredata_team"],
+    "requirements": ["client_name", "client_expectations"],
+}
+
+
+@dataclass
+class Pregeneration:
+    key: str
+    data: dict
+    versions: dict
+    fresh: bool
+    # Set to stop the run, e.g. once newer inputs replace it or nobody will use its sections
+    cancel: threading.Event = field(default_factory=threading.Event)
+    # None until the inputs have been left unchanged for the debounce delay
+    future: Future | None = None
+    timer: threading.Timer | None = None
+
+    def stop(self) -> None:
+        self.cancel.set()
+        if self.timer is not None:
+            self.timer.cancel()
+
+
+def inputs_key(group: str, data: dict, fresh: bool) -> str:
+    """Hash of what a group's sections are written from: their inputs, prompts and the fresh flag."""
+    versions = prompt_versions(data)
+    names = [group, "executive_summary"] if group == "project_description" else [group]
+    payload = {
+        "inputs": {name: [data.get(field) for field in SECTION_INPUTS[name]] for name in names},
+        "versions": {name: versions[name] for name in names},
+        "fresh": fresh,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def generate_group(group: str, data: dict, fresh: bool = False, cancel: threading.Event | None = None) -> dict:
+    """Generate one group of sections on its own; returns section name -> content."""
+    run = GenerationRun(
+        fresh=fresh,
+        project_type=data["project_type"],
+        language=data["language"],
+        cancelled=cancel or threading.Event(),
+    )
+    if group == "project_description":
+        description = generate_project_description(data, run)
+        return {
+            "project_description": description,
+            "executive_summary": generate_executive_summary(data, description, run),
+        }
+    return {group: LLM_SECTION_GENERATORS[group](data, run)}
+
+
+class Pregenerator:
+    """Background generation of the sections of one form (one Streamlit session)."""
+
+    def __init__(self, executor: Executor, debounce_seconds: float = 0.0):
+        """
+        Args:
+            executor: Pool the sections are generated in
+            debounce_seconds: How long a group's inputs must stay unchanged
+                before it is generated
+        """
+        self._executor = executor
+        self.debounce_seconds = debounce_seconds
+        # Group -> latest pregeneration; earlier ones are cancelled
+        self._runs: dict[str, Pregeneration] = {}
+
+    def update(self, data: dict, fresh: bool = False) -> list[str]:
+        """
+        Schedule the groups whose required fields are filled in and whose
+        inputs changed since they were last scheduled, cancelling the runs
+        they replace. Returns the groups scheduled.
+        """
+        scheduled = []
+        for group, fields in REQUIRED_FIELDS.items():
+            if not all(str(data.get(field) or "").strip() for field in fields):
+                continue
+            key = inputs_key(group, data, fresh)
+            current = self._runs.get(group)
+            if current is not None and current.key == key:
+                continue
+            if current is not None:
+                current.stop()
+            snapshot = dict(data)
+            run = self._runs[group] = Pregeneration(
+                key=key, data=snapshot, versions=prompt_versions(snapshot), fresh=fresh
+            )
+            if self.debounce_seconds > 0:
+                run.timer = threading.Timer(self.debounce_seconds, self._start, args=(group, run))
+                run.timer.daemon = True
+                run.timer.start()
+            else:
+                self._start(group, run)
+            scheduled.append(group)
+        return scheduled
+
+    def cancel(self) -> None:
+        """Stop every run still waiting or in progress, e.g. when the session ends."""
+        for run in self._runs.values():
+            run.stop()
+
+    def _start(self, group: str, run: Pregeneration) -> None:
+        if not run.cancel.is_set():
+            run.future = self._executor.submit(generate_group, group, run.data, run.fresh, run.cancel)
+
+    def status(self) -> dict[str, str]:
+        """Group -> waiting, running, ready or failed."""
+        statuses = {}
+        for group, run in self._runs.items():
+            if run.future is None:
+                statuses[group] = "waiting"
+            elif not run.future.done():
+                statuses[group] = "running"
+            elif run.future.exception() is not None:
+                statuses[group] = "failed"
+            else:
+                statuses[group] = "ready"
+        return statuses
+
+    def sections(self, data: dict, fresh: bool = False) -> dict:
+        """Finished sections that are still valid for `data`."""
+        sections = {}
+        for group, run in self._runs.items():
+            if run.fresh != fresh or run.future is None or not run.future.done():
+                continue
+            if run.future.exception() is not None:
+                logger.warning("Pre-generating %s failed: %s", group, run.future.exception())
+                continue
+            sections.update(reusable_sections(run.data, run.future.result(), data, run.versions))
+        return sections
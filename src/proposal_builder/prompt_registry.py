@@ -0,0 +1,86 @@
+"""
+Prompt files with content-hash versions and hot reload.
+
+Prompts are read on first use and re-read whenever their file's mtime or size
+changes, so a prompt tweak is picked up by running processes without a
+restart. Each prompt has a version, a short hash of its content, which is
+stored with generated sections to tell which ones a prompt change affects.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from proposal_builder.helpers import read_prompt
+
+
+@dataclass
+class PromptEntry:
+    text: str
+    version: str
+    # (mtime_ns, size) of the file the text was read from
+    stamp: tuple
+    # When the file was last checked for changes (time.monotonic)
+    checked: float
+
+
+class PromptRegistry:
+    def __init__(self, directory: Path, files: dict[str, str], reload_interval: float | None = 2.0):
+        """
+        Args:
+            directory: Folder holding the prompt files
+            files: Prompt name -> file name in `directory`
+            reload_interval: Seconds between checks of a prompt file for
+                changes, or None to read every prompt only once
+        """
+        self.directory = directory
+        self.files = files
+        self.reload_interval = reload_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> str:
+        # prompts.SYSTEM_PROMPT and friends
+        if name.startswith("_") or name not in self.files:
+            raise AttributeError(name)
+        return self.get(name)
+
+    def get(self, name: str) -> str:
+        return self._entry(name).text
+
+    def version(self, name: str) -> str:
+        return self._entry(name).version
+
+    def versions(self) -> dict[str, str]:
+        """Prompt name -> version of every registered prompt."""
+        return {name: self.version(name) for name in self.files}
+
+    def combined_version(self, names: list[str]) -> str:
+        """One version for a set of prompts, e.g. all the prompts a section is written from."""
+        if not names:
+            return ""
+        payload = ",".join(f"{name}:{self.version(name)}" for name in sorted(names))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+    def _entry(self, name: str) -> PromptEntry:
+        entry = self._entries.get(name)
+        now = time.monotonic()
+        if entry is not None and (self.reload_interval is None or now - entry.checked < self.reload_interval):
+            return entry
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and (self.reload_interval is None or now - entry.checked < self.reload_interval):
+                return entry
+            path = self.directory / self.files[name]
+            stat = os.stat(path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if entry is not None and entry.stamp == stamp:
+                entry.checked = now
+                return entry
+            text = read_prompt(path)
+            version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+            entry = self._entries[name] = PromptEntry(text, version, stamp, now)
+            return entry
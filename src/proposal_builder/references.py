@@ -0,0 +1,158 @@
+"""
+Lexical retrieval of the reference frameworks added to the project description prompt.
+
+The MLOps and DevOps frameworks are split into chunks, one paragraph each under
+its nearest heading, and indexed with BM25. Instead of pasting a whole
+framework into the prompt, only its introduction and the chunks that best
+match the project's description and cloud are added, in document order. An
+index is built from the prompt's current text and rebuilt whenever the prompt
+file changes (its version in the prompt registry changes).
+"""
+
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+
+# BM25 parameters (the usual defaults)
+K1 = 1.5
+B = 0.75
+
+# Lines shorter than this that are followed by a paragraph are taken for headings
+HEADING_MAX_CHARS = 80
+
+# Vocabulary of each technology focus, so the cloud-specific parts of a framework rank higher
+TECHNOLOGY_TERMS = {
+    "AWS": "aws amazon sagemaker cloudformation codepipeline codebuild ecr lambda s3 cloudwatch",
+    "GCP": "gcp google vertex cloud build artifact registry bigquery dataflow cloud monitoring",
+    "Azure": "azure devops databricks azure ml container registry api management synapse monitor",
+    "OnPrem": "on-premise kubernetes docker jenkins ansible terraform prometheus grafana gitlab",
+}
+
+# English and Portuguese words too common to tell chunks apart
+STOPWORDS = set("""
+a an and are as at be by for from has have in is it its of on or that the this to we will with our
+o os as um uma uns umas e de do da dos das em no na nos nas por para com que se ao aos
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        # A crude plural folding, enough for "pipelines" to match "pipeline"
+        if len(token) > 4 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+@dataclass
+class Chunk:
+    heading: str
+    text: str
+
+
+def split_chunks(document: str) -> list[Chunk]:
+    """One chunk per paragraph, with the heading it falls under; short lines that are not headings stay with the paragraph before them."""
+    lines = [line.strip() for line in document.splitlines() if line.strip()]
+    chunks = []
+    heading = ""
+    for i, line in enumerate(lines):
+        following = lines[i + 1] if i + 1 < len(lines) else ""
+        is_short = len(line) < HEADING_MAX_CHARS
+        if is_short and not line.endswith((".", ":")) and len(following) >= HEADING_MAX_CHARS:
+            heading = line
+        elif is_short and chunks:
+            chunks[-1].text += "\n" + line
+        else:
+            chunks.append(Chunk(heading, line))
+    return chunks
+
+
+class ReferenceIndex:
+    """BM25 index over the chunks of one reference document."""
+
+    def __init__(self, document: str):
+        self.chunks = split_chunks(document)
+        self._terms = [Counter(tokenize(f"{chunk.heading}\n{chunk.text}")) for chunk in self.chunks]
+        self._lengths = [sum(terms.values()) for terms in self._terms]
+        self._average_length = sum(self._lengths) / max(len(self._lengths), 1)
+        frequencies = Counter(term for terms in self._terms for term in terms)
+        total = len(self.chunks)
+        self._idf = {term: math.log(1 + (total - count + 0.5) / (count + 0.5)) for term, count in frequencies.items()}
+
+    def scores(self, query: str) -> list[float]:
+        query_terms = set(tokenize(query))
+        scores = []
+        for terms, length in zip(self._terms, self._lengths):
+            score = 0.0
+            for term in query_terms & terms.keys():
+                frequency = terms[term]
+                score += self._idf[term] * frequency * (K1 + 1) / (
+                    frequency + K1 * (1 - B + B * length / self._average_length)
+                )
+            scores.append(score)
+        return scores
+
+    def select(self, query: str, k: int) -> str:
+        """
+        The introduction and the k chunks that best match `query`, in
+        document order with their headings. With no match at all, the first
+        chunks are kept.
+        """
+        if len(self.chunks) <= k + 1:
+            chosen = range(len(self.chunks))
+        else:
+            scores = self.scores(query)
+            ranked = sorted(range(1, len(self.chunks)), key=lambda i: (-scores[i], i))
+            chosen = sorted([0] + ranked[:k])
+        parts = []
+        heading = None
+        for i in chosen:
+            chunk = self.chunks[i]
+            if chunk.heading and chunk.heading != heading:
+                parts.append(chunk.heading)
+            heading = chunk.heading
+            parts.append(chunk.text)
+        return "\n".join(parts)
+
+
+class ReferenceLibrary:
+    """Chunk indexes of the reference prompts, rebuilt when a prompt's version changes."""
+
+    def __init__(self, prompts, names: list[str], chunks: int = 4):
+        """
+        Args:
+            prompts: Prompt registry holding the reference documents
+            names: Reference prompts, indexed right away
+            chunks: Chunks selected from each document besides its
+                introduction, or 0 to use whole documents
+        """
+        self.prompts = prompts
+        self.chunks = chunks
+        self._indexes: dict[str, tuple[str, ReferenceIndex]] = {}
+        self._lock = threading.Lock()
+        if chunks > 0:
+            for name in names:
+                self.index(name)
+
+    def index(self, name: str) -> ReferenceIndex:
+        version = self.prompts.version(name)
+        with self._lock:
+            built = self._indexes.get(name)
+            if built is None or built[0] != version:
+                built = self._indexes[name] = (version, ReferenceIndex(self.prompts.get(name)))
+            return built[1]
+
+    def select(self, name: str, data: dict) -> str:
+        """The parts of reference prompt `name` relevant to this request's description and technology focus."""
+        if self.chunks <= 0:
+            return self.prompts.get(name)
+        technology = data.get("technology_focus", "")
+        query = " ".join([data.get("general_description", ""), technology, TECHNOLOGY_TERMS.get(technology, "")])
+        return self.index(name).select(query, self.chunks)
@@ -0,0 +1,46 @@
+"""
+Request models shared by the API and the batch runner.
+"""
+
+import hashlib
+import json
+from typing import Literal
+
+from pydantic import BaseModel, ValidationError
+
+
+class ProposalRequest(BaseModel):
+    client_name: str
+    # The languages and project types the prompts and templates are written for
+    language: Literal["English", "Portuguese"]
+    project_name: str
+    project_type: Literal["Gen-OS", "Closed Project", "Co-Creation"]
+    technology_focus: str
+    general_description: str
+    planning: str
+    client_stakeholders: str
+    daredata_team: str
+    client_expectations: str
+    special_conditions: str
+    extended_description: bool = False
+    mlops: str = "No"
+    devops: str = "No"
+    llmops: str = "No"
+    wow: str = "No"
+
+
+def describe_errors(error: ValidationError) -> str:
+    """One-line summary of a validation error, e.g. "client_name: Field required"."""
+    return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+
+
+def request_key(data: dict, **options) -> str:
+    """
+    Identity of a proposal request: a hash of its normalized payload (defaults
+    filled in, surrounding whitespace ignored) and the given request options.
+    """
+    payload = {
+        name: value.strip() if isinstance(value, str) else value
+        for name, value in ProposalRequest(**data).model_dump().items()
+    }
+    return hashlib.sha256(json.dumps([payload, options], sort_keys=True).encode("utf-8")).hexdigest()
@@ -0,0 +1,91 @@
+"""
+Coalescing of identical in-flight work.
+
+The first caller for a key becomes the leader and does the work; callers that
+arrive with the same key while it is running attach to its flight and get the
+same result (or exception), plus a replay of everything streamed so far and
+the rest as it arrives.
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+
+class Subscriber:
+    """A follower's token callback and how many of the flight's tokens it was given."""
+
+    def __init__(self, callback: Callable[[str], None]):
+        self.callback = callback
+        self.sent = 0
+        self.active = True
+        self.lock = threading.Lock()
+
+    def catch_up(self, tokens: list[str]) -> None:
+        """Pass on the tokens it has not had yet; its own lock keeps them in order."""
+        with self.lock:
+            while self.active and self.sent < len(tokens):
+                self.sent += 1
+                self.callback(tokens[self.sent - 1])
+
+
+class Flight:
+    def __init__(self):
+        self.future = Future()
+        self._tokens = []
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def publish(self, token: str) -> None:
+        """Forward a streamed piece of the result to every follower."""
+        # Callbacks run outside the flight's lock, so a slow follower holds up no one else's subscribe
+        with self._lock:
+            self._tokens.append(token)
+            subscribers = self._subscribers[:]
+        for subscriber in subscribers:
+            subscriber.catch_up(self._tokens)
+
+    def subscribe(self, callback: Callable[[str], None]) -> None:
+        """Call `callback` with every token published so far and from now on."""
+        subscriber = Subscriber(callback)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        subscriber.catch_up(self._tokens)
+
+    def unsubscribe(self, callback: Callable[[str], None]) -> None:
+        """Stop forwarding tokens to `callback`, e.g. once its caller gave up waiting."""
+        with self._lock:
+            subscribers = [subscriber for subscriber in self._subscribers if subscriber.callback == callback]
+            self._subscribers = [subscriber for subscriber in self._subscribers if subscriber.callback != callback]
+        for subscriber in subscribers:
+            # Waits for a delivery under way, so no token reaches the callback after this returns
+            with subscriber.lock:
+                subscriber.active = False
+
+    def result(self):
+        return self.future.result()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str) -> tuple[Flight, bool]:
+        """The flight for `key` and whether the caller leads it (and so must call land)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def land(self, key: str, flight: Flight, result=None, error: BaseException | None = None) -> None:
+        """Resolve a flight led by the caller; later callers with the key start a new one."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if error is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(result)
@@ -0,0 +1,271 @@
+"""
+Persistent store of generated proposals.
+
+Every proposal is kept in a SQLite file (WAL mode, so readers never wait for
+the writer) with its form input, status, prompt versions, estimate, timings
+and token usage, and each section's output. Markdown is stored
+zlib-compressed. Listings are paginated by keyset on (created_at, id) over
+indexes per filter, so a page costs the same at the first or the ten
+thousandth proposal.
+"""
+
+import base64
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+
+def compress(text: str | None) -> bytes | None:
+    return None if text is None else zlib.compress(text.encode("utf-8"))
+
+
+def decompress(data: bytes | None) -> str | None:
+    return None if data is None else zlib.decompress(data).decode("utf-8")
+
+
+def encode_cursor(created_at: float, proposal_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, proposal_id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[float, str]:
+    """The (created_at, id) position a cursor points after; ValueError when it is malformed."""
+    try:
+        created_at, proposal_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(created_at), str(proposal_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+class ProposalStore:
+    # Filters of list(), each backed by an index on (filter, created_at, id)
+    FILTERS = ("client_name", "project_type", "language", "status")
+
+    def __init__(self, path: Path | None = None):
+        """
+        Args:
+            path: SQLite file, or None to keep proposals in memory only
+        """
+        self._lock = threading.Lock()
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(":memory:" if path is None else path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS proposals (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                client_name TEXT NOT NULL COLLATE NOCASE,
+                project_name TEXT NOT NULL,
+                project_type TEXT NOT NULL,
+                language TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                input TEXT NOT NULL,
+                prompt_versions TEXT NOT NULL,
+                estimate TEXT,
+                metrics TEXT,
+                markdown BLOB,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS sections (
+                proposal_id TEXT NOT NULL REFERENCES proposals (id) ON DELETE CASCADE,
+                name TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                content BLOB NOT NULL,
+                prompt_version TEXT,
+                metrics TEXT,
+                PRIMARY KEY (proposal_id, name)
+            );
+            CREATE INDEX IF NOT EXISTS proposals_created_at ON proposals (created_at, id);
+            CREATE INDEX IF NOT EXISTS proposals_client_name ON proposals (client_name, created_at, id);
+            CREATE INDEX IF NOT EXISTS proposals_project_type ON proposals (project_type, created_at, id);
+            CREATE INDEX IF NOT EXISTS proposals_language ON proposals (language, created_at, id);
+            CREATE INDEX IF NOT EXISTS proposals_status ON proposals (status, created_at, id);
+            """
+        )
+        self._db.commit()
+
+    def save(self, proposal: dict, proposal_data: dict, sections: dict[str, str] | None = None, positions: dict[str, int] | None = None) -> None:
+        """
+        Insert or update a proposal.
+
+        Args:
+            proposal: Job fields (id, status, prompt_versions, estimate,
+                metrics, markdown, error), as in ProposalResponse
+            proposal_data: The form data it is generated from
+            sections: Generated section name -> content, stored alongside
+            positions: Section name -> position in the proposal
+        """
+        now = time.time()
+        metrics = proposal.get("metrics") or {}
+        versions = proposal.get("prompt_versions") or {}
+        with self._lock, self._db:
+            self._db.execute(
+                """
+                INSERT INTO proposals (
+                    id, status, client_name, project_name, project_type, language, created_at, updated_at,
+                    input, prompt_versions, estimate, metrics, markdown, error
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    status = excluded.status,
+                    updated_at = excluded.updated_at,
+                    prompt_versions = excluded.prompt_versions,
+                    estimate = excluded.estimate,
+                    metrics = excluded.metrics,
+                    markdown = excluded.markdown,
+                    error = excluded.error
+                """,
+                (
+                    proposal["id"],
+                    proposal["status"],
+                    proposal_data["client_name"],
+                    proposal_data["project_name"],
+                    proposal_data["project_type"],
+                    proposal_data["language"],
+                    now,
+                    now,
+                    json.dumps(proposal_data, ensure_ascii=False),
+                    json.dumps(versions),
+                    None if proposal.get("estimate") is None else json.dumps(proposal["estimate"]),
+                    None if proposal.get("metrics") is None else json.dumps(metrics),
+                    compress(proposal.get("markdown")),
+                    proposal.get("error"),
+                ),
+            )
+            if sections:
+                self._write_sections(proposal["id"], sections, positions or {}, versions, metrics.get("sections", {}))
+
+    def update(self, proposal_id: str, **fields) -> None:
+        """Set some of the job fields (status, prompt_versions, metrics, markdown, error) of a stored proposal."""
+        columns = {
+            "status": lambda value: value,
+            "prompt_versions": json.dumps,
+            "metrics": json.dumps,
+            "markdown": compress,
+            "error": lambda value: value,
+        }
+        unknown = set(fields) - set(columns)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._db:
+            self._db.execute(
+                f"UPDATE proposals SET {assignments}, updated_at = ? WHERE id = ?",
+                (*(columns[name](value) for name, value in fields.items()), time.time(), proposal_id),
+            )
+
+    def save_sections(
+        self,
+        proposal_id: str,
+        sections: dict[str, str],
+        positions: dict[str, int],
+        versions: dict[str, str] | None = None,
+        metrics: dict[str, dict] | None = None,
+    ) -> None:
+        """Store (or replace) generated sections of a proposal, e.g. as each one finishes."""
+        with self._lock, self._db:
+            self._write_sections(proposal_id, sections, positions, versions or {}, metrics or {})
+
+    def _write_sections(self, proposal_id: str, sections: dict, positions: dict, versions: dict, metrics: dict) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO sections (proposal_id, name, position, content, prompt_version, metrics) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    proposal_id,
+                    name,
+                    positions.get(name, 0),
+                    compress(content),
+                    versions.get(name),
+                    json.dumps(metrics[name]) if name in metrics else None,
+                )
+                for name, content in sections.items()
+            ],
+        )
+
+    def delete(self, proposal_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM proposals WHERE id = ?", (proposal_id,))
+
+    def get(self, proposal_id: str) -> dict | None:
+        """A stored proposal with its input and markdown, or None."""
+        with self._lock:
+            cursor = self._db.execute("SELECT * FROM proposals WHERE id = ?", (proposal_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            names = [column[0] for column in cursor.description]
+            sections = self._db.execute(
+                "SELECT name FROM sections WHERE proposal_id = ? ORDER BY position", (proposal_id,)
+            ).fetchall()
+        proposal = dict(zip(names, row))
+        for field in ("input", "prompt_versions", "estimate", "metrics"):
+            if proposal[field] is not None:
+                proposal[field] = json.loads(proposal[field])
+        proposal["markdown"] = decompress(proposal["markdown"])
+        proposal["section_names"] = [name for (name,) in sections]
+        return proposal
+
+    def state(self, proposal_id: str) -> tuple[str, str | None] | None:
+        """(status, error) of a stored proposal, or None."""
+        with self._lock:
+            return self._db.execute("SELECT status, error FROM proposals WHERE id = ?", (proposal_id,)).fetchone()
+
+    def sections(self, proposal_id: str) -> dict[str, str]:
+        """Section name -> content of a stored proposal, in proposal order."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, content FROM sections WHERE proposal_id = ? ORDER BY position", (proposal_id,)
+            ).fetchall()
+        return {name: decompress(content) for name, content in rows}
+
+    def list(self, limit: int = 50, cursor: str | None = None, **filters) -> tuple[list[dict], str | None]:
+        """
+        A page of proposals, newest first, without their markdown.
+
+        Args:
+            limit: Page size
+            cursor: next_cursor of the previous page
+            filters: Exact matches on FILTERS (client_name ignores case)
+
+        Returns:
+            The page and the cursor of the next one (None on the last page)
+        """
+        unknown = set(filters) - set(self.FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+        clauses = []
+        parameters = []
+        for name, value in filters.items():
+            if value is not None:
+                clauses.append(f"{name} = ?")
+                parameters.append(value)
+        if cursor is not None:
+            clauses.append("(created_at, id) < (?, ?)")
+            parameters.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._db.execute(
+                f"""
+                SELECT id, status, client_name, project_name, project_type, language, created_at, updated_at
+                FROM proposals {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+                """,
+                (*parameters, limit + 1),
+            ).fetchall()
+        columns = ("id", "status", "client_name", "project_name", "project_type", "language", "created_at", "updated_at")
+        page = [dict(zip(columns, row)) for row in rows[:limit]]
+        next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"]) if len(rows) > limit else None
+        return page, next_cursor
+
+
+def create_proposal_store(settings) -> ProposalStore:
+    if not settings.PROPOSAL_STORE_ENABLED:
+        return ProposalStore(path=None)
+    return ProposalStore(path=settings.DATA_DIR / "proposals.sqlite3")
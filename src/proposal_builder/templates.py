@@ -0,0 +1,276 @@
+"""
+Deterministic rendering of proposal sections.
+
+Section skeletons, localized strings (English and Portuguese) and the
+commercial terms per project type live here. Sections with fixed content
+(SIFIDE, commercial conditions) are rendered without any model call, and
+sections with a fixed structure (timeline table, team, client requirements)
+only ask the model for their prose slots, which are substituted into the
+skeleton. Every template is compiled, and every fully static section
+rendered, once at import.
+"""
+
+import hashlib
+import re
+from string import Template
+
+LANGUAGES = ("English", "Portuguese")
+PROJECT_TYPES = ("Gen-OS", "Closed Project", "Co-Creation")
+
+# Localized strings used by the skeletons
+STRINGS = {
+    "English": {
+        "timeline_title": "# 3. Timeline and Planning",
+        "timeline_header": "| Phase | Overview |",
+        "stakeholders_title": "# 4. Key Stakeholders",
+        "team_title": "# 5. DareData Team",
+        "team_intro": "The DareData team allocated to this project combines the following roles:",
+        "team_principal": (
+            "**Principal**: Oversees strategic management, technical validation and continuous project alignment. "
+            "These Senior Principal Engineers take the role of Project Manager, are responsible for the development "
+            "of the solution and are the main point of contact with ${client_name}'s stakeholders. They also gather "
+            "the functional and technical requirements of the solution."
+        ),
+        "team_specialists": (
+            "**Tech Specialist Network**: Senior DareData profiles responsible for the quality of the technical work, "
+            "ensuring it follows best practices and solving possible bottlenecks in the development of the project."
+        ),
+        "team_engineers": (
+            "**DareData Engineers**: Engineers and Data Scientists who implement the technical developments and work "
+            "directly on the project. They develop, test and implement the architecture, gather more detailed business "
+            "requirements and ensure that development follows the project plan and established best practices."
+        ),
+        "team_genos": (
+            "**Gen-OS Team**: Responsible for onboarding Gen-OS in ${client_name}'s infrastructure and ensuring a "
+            "stable integration."
+        ),
+        "requirements_title": "# 6. Client Requirements and Starting Date",
+        "requirements_intro": (
+            "The DareData team should have access to all data, documentation and systems needed to develop the "
+            "project before the starting date. DareData also expects the following support from ${client_name} "
+            "during the project:"
+        ),
+        "requirements_items": (
+            "1. **Secure a Champion and a project owner** - DareData needs a business champion at ${client_name} to "
+            "help design a solution tailored for success, as well as a project owner for clarifications and reporting.\n"
+            "2. **End-user involvement** - DareData needs end users to explain the current process, how the solution "
+            "should look and for clarifications and refinements, through a designated Business User contact.\n"
+            "3. **Navigate the tech ecosystem** - DareData needs support in understanding the technology stack, "
+            "infrastructure and internal processes, through a designated IT contact."
+        ),
+        "requirements_start": (
+            "The project's official starting date will be scheduled after the contract is signed, at least 2 weeks "
+            "from the date of acceptance."
+        ),
+        "agreement_title": "# 8. Commercial Conditions",
+        "agreement_work": "Work agreement",
+        "agreement_remote": "All the work will be done remotely.",
+        "agreement_payment": "Payment terms",
+        "agreement_due": "Payment due within 30 days of invoice issue date",
+        "agreement_vat": "VAT, where applicable, should be applied to all figures in this proposal",
+        "agreement_validity": "Validity",
+        "agreement_valid_for": "This proposal is valid for 30 working days",
+        "agreement_bills": "All bills should be paid to:",
+        "agreement_company": "Company: DareData, SA",
+        "agreement_vat_number": "VAT Number: PT 515362166",
+        "agreement_address": "Address: AV FONTES PEREIRA MELO , 31 5 C LISBOA 1050-117 LISBOA",
+    },
+    "Portuguese": {
+        "timeline_title": "# 3. Planeamento e Calendário",
+        "timeline_header": "| Fase | Descrição |",
+        "stakeholders_title": "# 4. Stakeholders Principais",
+        "team_title": "# 5. Equipa DareData",
+        "team_intro": "A equipa da DareData alocada a este projeto combina os seguintes perfis:",
+        "team_principal": (
+            "**Principal**: Assegura a gestão estratégica, a validação técnica e o alinhamento contínuo do projeto. "
+            "Estes Senior Principal Engineers assumem o papel de Gestor de Projeto, são responsáveis pelo "
+            "desenvolvimento da solução e são o principal ponto de contacto com os stakeholders da ${client_name}. "
+            "Recolhem também os requisitos funcionais e técnicos da solução."
+        ),
+        "team_specialists": (
+            "**Tech Specialist Network**: Perfis seniores da DareData responsáveis pela qualidade do trabalho técnico, "
+            "garantindo que segue as melhores práticas e resolvendo possíveis bloqueios no desenvolvimento do projeto."
+        ),
+        "team_engineers": (
+            "**DareData Engineers**: Engenheiros e Data Scientists que implementam os desenvolvimentos técnicos e "
+            "trabalham diretamente no projeto. Desenvolvem, testam e implementam a arquitetura, recolhem requisitos de "
+            "negócio mais detalhados e garantem que o desenvolvimento segue o plano do projeto e as melhores práticas."
+        ),
+        "team_genos": (
+            "**Equipa Gen-OS**: Responsável pelo onboarding do Gen-OS na infraestrutura da ${client_name} e por "
+            "garantir uma integração estável."
+        ),
+        "requirements_title": "# 6. Requisitos do Cliente e Data de Início",
+        "requirements_intro": (
+            "A equipa da DareData deverá ter acesso a todos os dados, documentação e sistemas necessários ao "
+            "desenvolvimento do projeto antes da data de início. A DareData espera também o seguinte apoio da "
+            "${client_name} durante o projeto:"
+        ),
+        "requirements_items": (
+            "1. **Garantir um Champion e um responsável pelo projeto** - A DareData necessita de um champion de negócio "
+            "na ${client_name} que ajude a desenhar uma solução à medida, bem como de um responsável pelo projeto para "
+            "esclarecimentos e reporte.\n"
+            "2. **Envolvimento dos utilizadores finais** - A DareData necessita que os utilizadores finais expliquem o "
+            "processo atual, como deverá ser a solução e apoiem esclarecimentos e refinamentos, através de um contacto "
+            "de negócio designado.\n"
+            "3. **Apoio no ecossistema tecnológico** - A DareData necessita de apoio para compreender a stack "
+            "tecnológica, a infraestrutura e os processos internos, através de um contacto de TI designado."
+        ),
+        "requirements_start": (
+            "A data oficial de início do projeto será agendada após a assinatura do contrato, com pelo menos 2 semanas "
+            "de antecedência a contar da data de aceitação."
+        ),
+        "agreement_title": "# 8. Condições Comerciais",
+        "agreement_work": "Acordo de trabalho",
+        "agreement_remote": "Todo o trabalho será efetuado remotamente (preferencialmente).",
+        "agreement_payment": "Condições de pagamento",
+        "agreement_due": "Pagamento devido no prazo de 30 dias a contar da data de apresentação da fatura",
+        "agreement_vat": "O IVA, se aplicável, deve ser aplicado a todos os valores da presente proposta",
+        "agreement_validity": "Validade",
+        "agreement_valid_for": "A presente proposta é válida por 30 dias úteis",
+        "agreement_bills": "Todas as faturas deverão ser pagas à:",
+        "agreement_company": "Empresa: DareData, SA",
+        "agreement_vat_number": "NIF: PT 515362166",
+        "agreement_address": "Endereço: AV FONTES PEREIRA MELO , 31 5 C LISBOA 1050-117 LISBOA",
+    },
+}
+
+# Payment terms per project type
+COMMERCIAL_TERMS = {
+    "Closed Project": {
+        "English": "Payment of 30% on acceptance of the proposal, payment of 70% at the end",
+        "Portuguese": "Pagamento do 30% aquando da aceitação da proposta, 70% no final",
+    },
+    "Gen-OS": {
+        "English": "Setup: Payment of 30% on acceptance of the proposal, payment of 70% at the end\n\nRun: Monthly Payment / Annual Payment (5% discount)",
+        "Portuguese": "Setup: 30% aquando da aceitação da proposta, 70% no final\n\nRun: Pagamentos Mensais/ Anuais (5% desconto)",
+    },
+    "Co-Creation": {
+        "English": "Payment based on work timesheets",
+        "Portuguese": "Pagamento com base em timesheets",
+    },
+}
+
+SIFIDE = """# 7. Preço
+A DareData é reconhecida com o Selo ID: Reconhecimento de Idoneidade. Isso significa acesso ao sistema de incentivos fiscais para R&D empresarial que visa aumentar a competitividade das empresas, apoiando os seus esforços em Pesquisa e Desenvolvimento através da dedução total das despesas de R&D na cobrança do IRC.
+Vários dos nossos clientes conseguem poupar significativamente na dedução do IRC (de 32,5% até 82,5%) porque somos uma empresa certificada. É necessário criar um projeto interno de I&D na sua organização, dentro do âmbito do SIFIDE.
+
+Nota: no primeiro ano em que se candidatar, tem garantido um desconto de 82,5%. A maioria das empresas já tem um departamento para estes processos, mas podemos ajudar com a proposta, se necessário.
+
+Exemplo de preço de um projeto:
+- Preço do projeto: 100k€
+- Despesa elegível ao abrigo do SIFIDE: 100k€
+- Possível benefício fiscal no IRC: 32,5k€-82,5k€
+
+Novo preço (através de desconto indireto via benefício fiscal IRC):
+- Máximo: 100,000€ -> 67,500€
+- Mínimo:  100,000 € -> 17,500€
+
+O mínimo de 32,5% e o máximo de 82,5% dos possíveis benefícios fiscais no IRC baseiam-se no total das despesas elegíveis em I&D da sua organização!
+
+Melhores práticas:
+- Familiarize-se com os processos SIFIDE;
+- Tenha um projeto interno de I&D (ou crie um) para cada projeto DareData;
+- Inscreva-se no SIFIDE todos os anos, associando cada projeto DareData como uma despesa dentro do projeto interno de I&D da organização.
+"""
+
+# Section skeletons in terms of STRINGS; $-placeholders other than the
+# strings are filled per proposal: client_name, and the prose slots written
+# by the model (rows, stakeholders, expectations)
+SKELETONS = {
+    "timeline_planning": "$timeline_title\n\n$timeline_header\n|---|---|\n$$rows\n",
+    "stakeholders_and_team": "$stakeholders_title\n\n$$stakeholders\n\n$team_title\n\n$team_intro\n\n$$team\n",
+    "requirements": "$requirements_title\n\n$requirements_intro\n\n$requirements_items\n\n$${expectations}$requirements_start\n",
+    "work_agreement": "\n\n".join([
+        " ",
+        "$agreement_title",
+        "$agreement_work",
+        "$agreement_remote",
+        " ",
+        "$agreement_payment",
+        "$$terms",
+        "$agreement_due",
+        "$agreement_vat",
+        " ",
+        "$agreement_validity",
+        "$agreement_valid_for",
+        " ",
+        "$agreement_bills",
+        "$agreement_company",
+        "$agreement_vat_number",
+        "$agreement_address",
+    ]),
+}
+
+# The localized strings are substituted once; what is left are the per-proposal placeholders
+TEMPLATES = {
+    (section, language): Template(Template(skeleton).substitute(STRINGS[language]))
+    for section, skeleton in SKELETONS.items()
+    for language in LANGUAGES
+}
+TEAM_ROLES = {
+    (language, genos): Template("\n\n".join(
+        STRINGS[language][role]
+        for role in ("team_principal", "team_specialists", "team_engineers") + (("team_genos",) if genos else ())
+    ))
+    for language in LANGUAGES
+    for genos in (False, True)
+}
+# Sections without slots, rendered in full up front
+STATIC_SECTIONS = {
+    ("work_agreement", language, project_type): TEMPLATES["work_agreement", language].substitute(
+        terms=COMMERCIAL_TERMS[project_type][language]
+    )
+    for language in LANGUAGES
+    for project_type in PROJECT_TYPES
+}
+STATIC_SECTIONS.update({("sifide", "Portuguese", project_type): SIFIDE for project_type in PROJECT_TYPES})
+
+# Version of the templates, part of the prompt version of every section rendered from them,
+# so stored sections are redone when a template changes
+VERSION = hashlib.sha256(repr((SKELETONS, STRINGS, COMMERCIAL_TERMS, SIFIDE)).encode("utf-8")).hexdigest()[:12]
+TEMPLATE_SECTIONS = {"timeline_planning", "stakeholders_and_team", "requirements", "sifide", "work_agreement"}
+
+TABLE_SEPARATOR = re.compile(r"^\|?\s*:?-{3,}")
+
+
+def version(section: str) -> str:
+    """Version of the templates a section is rendered with, or "" when it has none."""
+    return VERSION if section in TEMPLATE_SECTIONS else ""
+
+
+def render_static(section: str, data: dict) -> str:
+    return STATIC_SECTIONS[section, data["language"], data["project_type"]]
+
+
+def render_timeline(data: dict, rows: str) -> str:
+    """The timeline section around the table rows written by the model."""
+    lines = [line for line in rows.strip().splitlines() if line.strip() and not line.lstrip().startswith("#")]
+    # A header and separator row, when the model adds them anyway
+    for index, line in enumerate(lines):
+        if TABLE_SEPARATOR.match(line.strip()):
+            del lines[max(0, index - 1):index + 1]
+            break
+    return TEMPLATES["timeline_planning", data["language"]].substitute(rows="\n".join(lines))
+
+
+def render_stakeholders_and_team(data: dict, stakeholders: str) -> str:
+    """The stakeholders list written by the model, followed by the DareData team roles."""
+    team = TEAM_ROLES[data["language"], data["project_type"] == "Gen-OS"].substitute(client_name=data["client_name"])
+    return TEMPLATES["stakeholders_and_team", data["language"]].substitute(
+        stakeholders=strip_headings(stakeholders),
+        team=team,
+    )
+
+
+def render_requirements(data: dict, expectations: str | None = None) -> str:
+    """Client requirements, with a paragraph on the client's own expectations when the model wrote one."""
+    return TEMPLATES["requirements", data["language"]].substitute(
+        client_name=data["client_name"],
+        expectations=f"{strip_headings(expectations)}\n\n" if expectations and expectations.strip() else "",
+    )
+
+
+def strip_headings(text: str) -> str:
+    """Prose slot without the section headings the skeleton already has."""
+    return "\n".join(line for line in text.strip().splitlines() if not line.lstrip().startswith("#")).strip()
@@ -0,0 +1,265 @@
+"""
+Workers that generate the proposals queued by the API.
+
+Run from src/, next to the API (or in its own containers sharing DATA_DIR):
+
+    python -m proposal_builder.worker --processes 4 --threads 4
+
+Every process runs --threads jobs at a time (default MAX_CONCURRENT_PROPOSALS)
+leased from the job queue, stores each section in the proposal store as it
+finishes and publishes stream events for whichever API process is serving
+the proposal. Sections that miss their deadline are left out and the job ends
+as partial; a job cancelled through the API stops its LLM requests. A process
+that dies is replaced, and its jobs are leased again once their leases expire.
+The API also runs worker threads in its own process unless API_EMBEDDED_WORKERS
+is off. Separate workers need the shared proposal store (PROPOSAL_STORE_ENABLED).
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+
+from config import settings
+from proposal_builder.agent import (
+    GenerationCancelled,
+    assemble_proposal,
+    describe_failures,
+    example_library,
+    generate_sections,
+    prompt_versions,
+    proposal_sections,
+)
+from proposal_builder.jobs import JobQueue, create_job_queue
+from proposal_builder.llm import warm_up
+from proposal_builder.metrics import summarize_calls
+from proposal_builder.store import ProposalStore, create_proposal_store
+
+logger = logging.getLogger(__name__)
+
+# How often buffered token events are published to stream subscribers
+EVENT_FLUSH_SECONDS = 0.1
+# How often a running job checks whether it was cancelled
+CANCEL_POLL_SECONDS = 0.5
+
+
+class Worker:
+    def __init__(self, store: ProposalStore, queue: JobQueue, name: str | None = None):
+        self.store = store
+        self.queue = queue
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def run(self, stop: threading.Event) -> None:
+        """Lease and run jobs until `stop` is set, polling every JOB_POLL_SECONDS when idle."""
+        while not stop.is_set():
+            try:
+                if not self.run_once():
+                    stop.wait(settings.JOB_POLL_SECONDS)
+            except Exception:
+                logger.exception("Worker %s failed to run a job", self.name)
+                stop.wait(settings.JOB_POLL_SECONDS)
+
+    def run_once(self) -> bool:
+        """Run the next queued job; False when there was none."""
+        for job_id in self.queue.abandon():
+            self.store.update(job_id, status="failed", error=f"Gave up after {self.queue.max_attempts} attempts")
+        leased = self.queue.lease(self.name)
+        if leased is None:
+            return False
+        job_id, payload = leased
+        self.run_job(job_id, payload["proposal_data"], payload.get("fresh", False))
+        return True
+
+    def run_job(self, job_id: str, proposal_data: dict, fresh: bool = False) -> str | None:
+        """
+        Generate a leased proposal and return its final status, or None when
+        the lease was lost to another worker, whose results are the ones kept.
+        """
+        try:
+            positions = {name: i for i, name in enumerate(proposal_sections(proposal_data))}
+            versions = {name: version for name, version in prompt_versions(proposal_data).items() if name in positions}
+        except (KeyError, TypeError) as e:
+            # A payload no section can be written from fails once, rather than on every lease
+            self.store.update(job_id, status="failed", error=f"Invalid proposal data: missing or unknown {e}")
+            self.queue.finish(job_id, self.name, "failed")
+            return "failed"
+        self.store.update(job_id, status="running", prompt_versions=versions)
+        # Reused sections, and those a crashed worker finished before its lease expired
+        sections = self.store.sections(job_id)
+
+        events = []
+        events_lock = threading.Lock()
+        done = threading.Event()
+        cancel = threading.Event()
+        lost = threading.Event()
+        failures = {}
+
+        def holds_lease() -> bool:
+            # Renewing the lease also keeps other workers off the job for lease_seconds, so what is
+            # written right after a successful heartbeat cannot overwrite another worker's results
+            if not lost.is_set() and not self.queue.heartbeat(job_id, self.name):
+                logger.warning("Worker %s lost the lease of job %s; dropping its results", self.name, job_id)
+                lost.set()
+                cancel.set()
+            return not lost.is_set()
+
+        def flush() -> None:
+            with events_lock:
+                pending = events[:]
+                events.clear()
+            if not lost.is_set():
+                self.queue.publish(job_id, pending)
+
+        def keep_alive() -> None:
+            # Publish buffered tokens, renew the lease and watch for cancellation until the job is done
+            last_heartbeat = last_cancel_poll = time.monotonic()
+            while not done.wait(EVENT_FLUSH_SECONDS):
+                flush()
+                if time.monotonic() - last_cancel_poll >= CANCEL_POLL_SECONDS:
+                    if self.queue.cancel_requested(job_id):
+                        cancel.set()
+                    last_cancel_poll = time.monotonic()
+                if time.monotonic() - last_heartbeat >= self.queue.lease_seconds / 3:
+                    holds_lease()
+                    last_heartbeat = time.monotonic()
+
+        def on_section(name: str, content: str) -> None:
+            if not holds_lease():
+                return
+            self.store.save_sections(job_id, {name: content}, positions, versions)
+            with events_lock:
+                events.append(("section", {"section": name, "position": positions[name], "content": content}))
+
+        def on_token(name: str, token: str) -> None:
+            with events_lock:
+                events.append(("token", {"section": name, "position": positions[name], "token": token}))
+
+        def on_failure(name: str, reason: str) -> None:
+            failures[name] = reason
+            with events_lock:
+                events.append(("section_failed", {"section": name, "position": positions[name], "reason": reason}))
+
+        calls = []
+        started = time.monotonic()
+        keeper = threading.Thread(target=keep_alive, daemon=True)
+        keeper.start()
+        markdown = error = None
+        try:
+            generate_sections(
+                proposal_data,
+                on_section=on_section,
+                on_token=on_token,
+                on_call=calls.append,
+                on_failure=on_failure,
+                sections=sections,
+                fresh=fresh,
+                cancel=cancel,
+            )
+            markdown = assemble_proposal(sections)
+            status = "completed"
+            if failures:
+                # Retrying with ?previous_proposal_id= regenerates only the missing sections
+                status = "partial"
+                error = describe_failures(failures)
+        except GenerationCancelled:
+            error = "Cancelled"
+            status = "cancelled"
+        except Exception as e:
+            error = str(e)
+            status = "failed"
+        finally:
+            done.set()
+            keeper.join()
+            flush()
+
+        if not holds_lease():
+            return None
+        metrics = summarize_calls(calls)
+        metrics["total_seconds"] = time.monotonic() - started
+        if failures:
+            metrics["failed_sections"] = failures
+        self.store.save_sections(job_id, sections, positions, versions, metrics["sections"])
+        self.store.update(job_id, status=status, metrics=metrics, markdown=markdown, error=error)
+        self.queue.finish(job_id, self.name, status)
+        if status == "completed":
+            # Later proposals can use this one as an example
+            try:
+                example_library.add_proposals([(job_id, proposal_data, sections)])
+            except Exception:
+                logger.exception("Could not add proposal %s to the example index", job_id)
+        return status
+
+
+def start_workers(store: ProposalStore, queue: JobQueue, threads: int) -> threading.Event:
+    """Run `threads` workers in this process; set the returned event to stop them."""
+    stop = threading.Event()
+    for _ in range(threads):
+        worker = Worker(store, queue)
+        threading.Thread(target=worker.run, args=(stop,), daemon=True).start()
+    return stop
+
+
+def configure_logging() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    # One line per LLM request is too much at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def serve(threads: int) -> None:
+    """Worker process: run `threads` workers until SIGTERM or SIGINT, letting running jobs finish."""
+    configure_logging()
+    # Open the LLM connections while the first jobs are being leased
+    threading.Thread(target=warm_up, args=(settings,), daemon=True).start()
+    store = create_proposal_store(settings)
+    queue = create_job_queue(settings)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    workers = [threading.Thread(target=Worker(store, queue).run, args=(stop,)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", type=int, default=settings.MAX_CONCURRENT_PROPOSALS, help="Jobs run at a time per process")
+    args = parser.parse_args()
+    if not settings.PROPOSAL_STORE_ENABLED:
+        parser.error("Workers need the shared proposal store; set PROPOSAL_STORE_ENABLED=true or use the API's embedded workers")
+
+    configure_logging()
+    # Workers are started fresh rather than forked, so they share no SQLite or HTTP connections
+    context = multiprocessing.get_context("spawn")
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    def start(index: int):
+        process = context.Process(target=serve, args=(args.threads,), name=f"worker-{index}")
+        process.start()
+        return process
+
+    processes = [start(index) for index in range(args.processes)]
+    logger.info("Started %d worker processes with %d threads each", args.processes, args.threads)
+    while not stopping.wait(1):
+        for index, process in enumerate(processes):
+            if not process.is_alive():
+                logger.warning("Worker process %s exited with code %s; restarting it", process.name, process.exitcode)
+                processes[index] = start(index)
+
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
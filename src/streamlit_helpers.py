@@ -4,7 +4,7 @@ Core functionality for the Proposal Builder application.
 
 import streamlit as st
 import datetime
-from typing import Dict, Tuple, Any
+from typing import Callable, Dict, Tuple, Any
 
 
 def setup_page_config() -> None:
@@ -148,147 +148,198 @@ def apply_styles() -> None:
     """, unsafe_allow_html=True)
 
 
-def render_proposal_form() -> Tuple[Dict[str, Any], bool]:
+# Form field -> value before the user touches it
+FORM_DEFAULTS = {
+    "client_name": "",
+    "language": "Portuguese",
+    "project_name": "",
+    "project_type": "Co-Creation",
+    "technology_focus": "AWS",
+    "general_description": "",
+    "extended_description": False,
+    "planning": "",
+    "client_stakeholders": "",
+    "daredata_team": "",
+    "client_expectations": "",
+    "special_conditions": "",
+    "mlops": "No",
+    "devops": "No",
+    "llmops": "No",
+    "wow": "No",
+}
+
+
+def form_data() -> Dict[str, Any]:
+    """Current values of the proposal form, read from the widgets' session state."""
+    return {field: st.session_state.get(field, default) for field, default in FORM_DEFAULTS.items()}
+
+
+@st.fragment
+def render_client_information(on_change: Callable[[Dict[str, Any]], None] | None = None) -> None:
+    st.markdown('<h2 class="section-header">Client Information</h2>', unsafe_allow_html=True)
+
+    st.text_input("**Client Name**", key="client_name")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.selectbox(
+            "**Proposal Language**",
+            options=["Portuguese", "English"],
+            key="language"
+        )
+
+    with col2:
+        st.text_input("**Project Name**", key="project_name")
+
+    st.selectbox(
+        "**Project Type**",
+        options=["Co-Creation", "Gen-OS", "Closed Project"],
+        key="project_type"
+    )
+
+    if on_change is not None:
+        on_change(form_data())
+
+
+@st.fragment
+def render_project_details(on_change: Callable[[Dict[str, Any]], None] | None = None) -> None:
+    st.markdown('<h2 class="section-header">Project Details</h2>', unsafe_allow_html=True)
+
+    st.selectbox(
+        "**Technology Focus**",
+        options=["AWS", "GCP", "Azure", "OnPrem"],
+        key="technology_focus"
+    )
+
+    col1, _ , _, col4 = st.columns([2, 1, 1, 1])
+    with col1:
+        st.markdown("**General Description**")
+    with col4:
+        st.checkbox("Extended", key="extended_description", help="Generate a more detailed and comprehensive project description")
+
+    st.text_area(
+        "General Description",
+        key="general_description",
+        label_visibility="collapsed"
+    )
+
+    if on_change is not None:
+        on_change(form_data())
+
+
+@st.fragment
+def render_planning_and_team(on_change: Callable[[Dict[str, Any]], None] | None = None) -> None:
+    st.markdown('<h2 class="section-header">Planning and Team</h2>', unsafe_allow_html=True)
+
+    st.text_area("**Planning - Timeline, Team Effort and Project Milestones**", key="planning")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.text_area(
+            "**Key Client Stakeholders**",
+            key="client_stakeholders",
+            help="List Client Sponsor (main contact with mandate) and DareData Account Lead (Principal/AM for scoping)"
+        )
+
+    with col2:
+        st.text_area(
+            "**DareData Team**",
+            key="daredata_team",
+            help="Include Principal (PM), Tech Specialists (quality), Engineers (implementation), and Gen-OS Team if applicable"
+        )
+
+    if on_change is not None:
+        on_change(form_data())
+
+
+@st.fragment
+def render_additional_information(on_change: Callable[[Dict[str, Any]], None] | None = None) -> None:
+    st.markdown('<h2 class="section-header">Additional Information</h2>', unsafe_allow_html=True)
+
+    st.text_area(
+        "**What we expect from Client**",
+        key="client_expectations",
+        help="Access to data/systems, project champion, business user contact, IT contact, 2-week minimum start notice")
+
+    st.text_area("**Special Financial Conditions**", key="special_conditions")
+
+    if on_change is not None:
+        on_change(form_data())
+
+
+@st.fragment
+def render_best_practices(on_change: Callable[[Dict[str, Any]], None] | None = None) -> None:
+    st.markdown('<h2 class="section-header"> Best Practices </h2>', unsafe_allow_html=True)
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.selectbox(
+            "**Ways of Working**",
+            options=["No", "Yes"],
+            key="wow",
+        )
+
+    with col2:
+        st.selectbox(
+            "**MLOps**",
+            options=["No", "Yes"],
+            key="mlops",
+        )
+
+    with col3:
+        st.selectbox(
+            "**DevOps**",
+            options=["No", "Yes"],
+            key="devops",
+        )
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.selectbox(
+            "**LLMOps**",
+            options=["No", "Yes"],
+            key="llmops",
+        )
+
+    st.checkbox(
+        "Regenerate fresh",
+        key="regenerate_fresh",
+        help="Ignore cached sections and ask the model for a new draft of every section"
+    )
+
+    if on_change is not None:
+        on_change(form_data())
+
+
+def render_proposal_form(on_change: Callable[[Dict[str, Any]], None] | None = None) -> Tuple[Dict[str, Any], bool]:
     """
     Render the proposal form and collect input data.
-    
+
+    Each group of fields is a fragment: editing a field reruns only its group,
+    not the whole app, and then calls on_change with the current form data so
+    sections can be generated while the rest of the form is still being filled.
+    Text fields report their value when they lose focus, not on every keystroke.
+
+    Args:
+        on_change: Called with the form data after any group is rendered
+
     Returns:
         Tuple containing:
             - Dictionary with proposal data
             - Boolean indicating if form was submitted
     """
-    proposal_data = {}
-    
-    with st.form("proposal_form"):
-        st.markdown('<h2 class="section-header">Client Information</h2>', unsafe_allow_html=True)
-        
-        client_name = st.text_input("**Client Name**", key="client_name")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            language = st.selectbox(
-                "**Proposal Language**",
-                options=["Portuguese", "English"],
-                key="language"
-            )
-        
-        with col2:
-            project_name = st.text_input("**Project Name**", key="project_name")
-        
-        project_type = st.selectbox(
-            "**Project Type**",
-            options=["Co-Creation", "Gen-OS", "Closed Project"],
-            key="project_type"
-        )
-        
-        st.markdown('<h2 class="section-header">Project Details</h2>', unsafe_allow_html=True)
-                
-        technology_focus = st.selectbox(
-            "**Technology Focus**",
-            options=["AWS", "GCP", "Azure", "OnPrem"],
-            key="technology_focus"
-        )
-        
-        
-        
-        col1, _ , _, col4 = st.columns([2, 1, 1, 1])
-        with col1:
-            st.markdown("**General Description**")
-        with col4:
-            extended_description = st.checkbox("Extended", key="extended_description", help="Generate a more detailed and comprehensive project description")
-
-        general_description = st.text_area(
-            "General Description",
-            key="general_description",
-            label_visibility="collapsed" 
-        )
-        
-        st.markdown('<h2 class="section-header">Planning and Team</h2>', unsafe_allow_html=True)
-        
-        planning = st.text_area("**Planning - Timeline, Team Effort and Project Milestones**", key="planning")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            client_stakeholders = st.text_area(
-                "**Key Client Stakeholders**",
-                key="client_stakeholders",
-                help="List Client Sponsor (main contact with mandate) and DareData Account Lead (Principal/AM for scoping)"
-            )
-
-        with col2:
-            daredata_team = st.text_area(
-                "**DareData Team**",
-                key="daredata_team",
-                help="Include Principal (PM), Tech Specialists (quality), Engineers (implementation), and Gen-OS Team if applicable"
-            )
-        
-        st.markdown('<h2 class="section-header">Additional Information</h2>', unsafe_allow_html=True)
-        
-        client_expectations = st.text_area(
-            "**What we expect from Client**",
-            key="client_expectations",
-            help="Access to data/systems, project champion, business user contact, IT contact, 2-week minimum start notice")
-        
-        special_conditions = st.text_area("**Special Financial Conditions**", key="special_conditions")
-        
-        st.markdown('<h2 class="section-header"> Best Practices </h2>', unsafe_allow_html=True)
+    with st.container(border=True):
+        render_client_information(on_change)
+        render_project_details(on_change)
+        render_planning_and_team(on_change)
+        render_additional_information(on_change)
+        render_best_practices(on_change)
 
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            wow = st.selectbox(
-                "**Ways of Working**",
-                options=["No", "Yes"],
-                key="wow",
-            )
-            
-        with col2:
-            mlops = st.selectbox(
-                "**MLOps**",
-                options=["No", "Yes"],
-                key="mlops",
-            )
-
-        with col3:
-            devops = st.selectbox(
-                "**DevOps**",
-                options=["No", "Yes"],
-                key="devops",
-            )
-
-        col1, col2, col3 = st.columns(3)
-
-        with col1:
-            llmops = st.selectbox(
-                "**LLMOps**",
-                options=["No", "Yes"],
-                key="llmops",
-            )
+        submitted = st.button("Generate Proposal")
 
-        
-        submitted = st.form_submit_button("Generate Proposal")
-    
-    if submitted:
-        # Create proposal data as JSON
-        proposal_data = {
-            "client_name": client_name,
-            "language": language,
-            "project_name": project_name,
-            "project_type": project_type,
-            "technology_focus": technology_focus,
-            "general_description": general_description,
-            "extended_description": extended_description,
-            "planning": planning,
-            "client_stakeholders": client_stakeholders,
-            "daredata_team": daredata_team,
-            "client_expectations": client_expectations,
-            "special_conditions": special_conditions,
-            "mlops": mlops,
-            "devops": devops,
-            "llmops": llmops,
-            "wow": wow,
-        }
-    
+    proposal_data = form_data() if submitted else {}
     return proposal_data, submitted
 
 
@@ -0,0 +1,83 @@
+"""
+Test settings: a throwaway DATA_DIR and placeholder Azure OpenAI credentials,
+set before config is imported. No test talks to a real model. Also the
+form data and the fake chat completions the tests share.
+"""
+
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="proposal-builder-tests-"))
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "http://localhost:9/")
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test")
+os.environ.setdefault("AZURE_OPENAI_API_VERSION", "2024-02-01")
+os.environ.setdefault("AZURE_OPENAI_DEPLOYMENT", "test")
+os.environ.setdefault("COMPLETION_CACHE_ENABLED", "false")
+os.environ.setdefault("EXAMPLES_TOP_K", "0")
+
+PROPOSAL = {
+    "client_name": "ACME", "language": "English", "project_name": "X", "project_type": "Co-Creation",
+    "technology_focus": "AWS", "general_description": "d", "planning": "p", "client_stakeholders": "s",
+    "daredata_team": "t", "client_expectations": "e", "special_conditions": "",
+    "extended_description": False, "mlops": "No", "devops": "No", "llmops": "No", "wow": "No",
+}
+
+
+class Stream:
+    """Streamed chat completion: one word per `delay` seconds."""
+
+    def __init__(self, delay: float, words: int = 20):
+        self.delay = delay
+        self.words = words
+        self.closed = False
+
+    def __iter__(self):
+        for i in range(self.words):
+            time.sleep(self.delay)
+            if self.closed:
+                return
+            delta = SimpleNamespace(content=f"w{i} ")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)], usage=None)
+
+    def close(self):
+        self.closed = True
+
+
+class Completions:
+    """Answers after `delay` seconds (streamed: per word), or `slow` seconds for prompts containing `slow_marker`."""
+
+    def __init__(self, delay: float = 0.0, slow: float = 0.0, slow_marker: str = ""):
+        self.delay = delay
+        self.slow = slow
+        self.slow_marker = slow_marker
+        self.streams = []
+
+    def create(self, model, messages, stream=False, **kwargs):
+        delay = self.slow if self.slow_marker and self.slow_marker in messages[-1]["content"] else self.delay
+        if stream:
+            self.streams.append(Stream(delay))
+            return self.streams[-1]
+        time.sleep(delay * 20)
+        message = SimpleNamespace(content="done")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    # Imported here, once the settings above are in place
+    from proposal_builder import llm
+
+    def install(**options):
+        completions = Completions(**options)
+        monkeypatch.setattr(llm, "_llm", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+        return completions
+
+    return install
+
+
+def messages(text: str = "hello") -> list:
+    return [{"role": "user", "content": f"{text} {time.monotonic()}"}]
@@ -0,0 +1,47 @@
+from fastapi.testclient import TestClient
+
+import api
+
+PROPOSAL = {
+    "client_name": "ACME", "language": "English", "project_name": "X", "project_type": "Gen-OS",
+    "technology_focus": "AWS", "general_description": "d", "planning": "p", "client_stakeholders": "s",
+    "daredata_team": "t", "client_expectations": "e", "special_conditions": "",
+}
+
+
+def test_unknown_language_or_project_type_is_a_422():
+    # Without the lifespan no workers start, so nothing is generated
+    client = TestClient(api.app)
+    for field, value in (("language", "French"), ("project_type", "Foo")):
+        assert client.post("/proposals/", json=dict(PROPOSAL, **{field: value})).status_code == 422
+        line = '{"id": "a", ' + ", ".join(f'"{k}": "{v}"' for k, v in dict(PROPOSAL, **{field: value}).items()) + "}"
+        response = client.post("/proposals/batch", content=line)
+        assert response.status_code == 422 and response.json()["detail"].startswith("Line 1:")
+
+
+def test_cancelled_proposal_streams_its_final_status():
+    client = TestClient(api.app)
+    proposal_id = client.post("/proposals/", json=PROPOSAL).json()["id"]
+    assert client.post(f"/proposals/{proposal_id}/cancel").json()["status"] == "cancelled"
+    assert client.post(f"/proposals/{proposal_id}/cancel").status_code == 409
+    events = [line for line in client.get(f"/proposals/{proposal_id}/stream").text.splitlines() if line.startswith("event:")]
+    assert events[0] == "event: status" and events[-1] == "event: done"
+    assert 'data: {"status": "cancelled", "error": "Cancelled"}' in client.get(f"/proposals/{proposal_id}/stream").text
+
+
+def test_shared_proposal_is_cancelled_once_every_client_cancelled_it():
+    client = TestClient(api.app)
+    proposal = dict(PROPOSAL, client_name="Shared")
+    proposal_id = client.post("/proposals/", json=proposal).json()["id"]
+    assert client.post("/proposals/", json=proposal).json()["id"] == proposal_id
+    # The first client leaves; the second one still gets its proposal
+    assert client.post(f"/proposals/{proposal_id}/cancel").json()["status"] == "queued"
+    assert client.post(f"/proposals/{proposal_id}/cancel").json()["status"] == "cancelled"
+
+
+def test_stream_ends_when_the_proposal_is_deleted(monkeypatch):
+    client = TestClient(api.app)
+    proposal_id = client.post("/proposals/", json=dict(PROPOSAL, client_name="Deleted")).json()["id"]
+    monkeypatch.setattr(api.proposal_store, "state", lambda proposal_id: None)
+    text = client.get(f"/proposals/{proposal_id}/stream").text
+    assert text.endswith('event: done\ndata: {"status": "failed", "error": "Proposal not found"}\n\n')
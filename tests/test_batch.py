@@ -0,0 +1,43 @@
+import json
+
+from proposal_builder.batch import InvalidLine, generate_result, parse_request, read_requests, run_batch
+
+
+def test_parse_request_names_lines_without_id():
+    assert parse_request('{"id": "acme", "client_name": "ACME"}', 3) == ("acme", {"client_name": "ACME"})
+    assert parse_request('{"client_name": "ACME"}', 3) == ("line-3", {"client_name": "ACME"})
+
+
+def test_read_requests_keeps_going_after_invalid_lines():
+    lines = ['{"id": "a"}', "", "{not json", "[1, 2]", '{"id": "b"}']
+    items = list(read_requests(lines))
+    assert [item_id for item_id, _ in items] == ["a", "line-3", "line-4", "b"]
+    assert isinstance(items[1][1], InvalidLine) and items[1][1].error.startswith("Line 3:")
+    assert items[2][1].error == "Line 4: expected a JSON object"
+
+
+def test_invalid_lines_fail_on_their_own():
+    results = []
+    progress = run_batch(
+        read_requests(["{not json", json.dumps({"id": "x", "client_name": "ACME"})]),
+        generate_result,
+        concurrency=2,
+        on_result=lambda result, progress: results.append(result),
+    )
+    assert progress.failed == 2 and progress.completed == 0
+    by_id = {result["id"]: result for result in results}
+    assert by_id["line-1"]["status"] == "failed"
+    # Parsed but incomplete: rejected by validation, without calling the model
+    assert "Field required" in by_id["x"]["error"]
+
+
+def test_unknown_language_or_project_type_fails_validation():
+    base = {
+        "client_name": "ACME", "language": "English", "project_name": "X", "project_type": "Gen-OS",
+        "technology_focus": "AWS", "general_description": "d", "planning": "p", "client_stakeholders": "s",
+        "daredata_team": "t", "client_expectations": "e", "special_conditions": "",
+    }
+    for field, value in (("language", "French"), ("project_type", "Foo")):
+        result = generate_result("bad", dict(base, **{field: value}))
+        assert result["status"] == "failed"
+        assert field in result["error"]
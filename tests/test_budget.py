@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+from proposal_builder import agent
+from proposal_builder.budget import MIN_REFERENCE_TOKENS, TRIM_MARKER, estimate_tokens, fit_references
+from conftest import PROPOSAL
+
+EXAMPLE = "Past description. " * 400
+REFERENCE = "MLOps practice. " * 250
+
+
+def test_fit_references_trims_or_drops_the_least_important_first():
+    first, second, third = "a" * 4000, "b" * 4000, "c" * 4000
+    assert fit_references([first, second], 2000) == [first, second]
+    kept = fit_references([first, second, third], 1500)
+    assert kept[0] == first and kept[1].startswith("b") and kept[1].endswith(TRIM_MARKER)
+    assert len(kept) == 2
+    # What is left below MIN_REFERENCE_TOKENS is not worth a trimmed framework
+    assert fit_references([first, second], 1000 + MIN_REFERENCE_TOKENS - 1) == [first]
+
+
+def test_examples_are_dropped_before_references_are_trimmed(monkeypatch):
+    monkeypatch.setattr(agent, "example_library", SimpleNamespace(find=lambda section, data, sleep=None: [EXAMPLE]))
+    monkeypatch.setattr(agent, "reference_library", SimpleNamespace(select=lambda name, data: REFERENCE))
+    prompts = []
+    monkeypatch.setattr(agent, "complete", lambda messages, section, run, **kwargs: prompts.append(messages) or "done")
+    data = dict(PROPOSAL, mlops="Yes")
+
+    def prompt(budget: int) -> str:
+        monkeypatch.setattr(agent.settings, "PROMPT_TOKEN_BUDGET", budget)
+        agent.generate_project_description(data, agent.GenerationRun())
+        return "\n".join(message["content"] for message in prompts[-1])
+
+    full = prompt(100_000)
+    assert EXAMPLE.strip() in full and REFERENCE in full
+    without_examples = estimate_tokens(prompts[-1]) - estimate_tokens([{"content": EXAMPLE}])
+    kept = prompt(without_examples + 50)
+    assert "Past description." not in kept and REFERENCE in kept
+    trimmed = prompt(without_examples - 500)
+    assert "Past description." not in trimmed and REFERENCE not in trimmed and TRIM_MARKER in trimmed
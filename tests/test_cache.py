@@ -0,0 +1,67 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from proposal_builder import agent, llm
+from proposal_builder.cache import CompletionCache
+
+MESSAGES = [{"role": "system", "content": "You write proposals."}, {"role": "user", "content": "Scope"}]
+
+
+def test_key_is_stable_and_depends_on_model_and_every_message():
+    key = CompletionCache.key("gpt", MESSAGES)
+    assert key == CompletionCache.key("gpt", [dict(reversed(list(m.items()))) for m in MESSAGES])
+    assert key != CompletionCache.key("other", MESSAGES)
+    assert key != CompletionCache.key("gpt", MESSAGES[:1] + [{"role": "user", "content": "Scope "}])
+    assert key != CompletionCache.key("gpt", list(reversed(MESSAGES)))
+
+
+def test_memory_only_cache():
+    cache = CompletionCache(path=None)
+    assert cache.get("k") is None
+    cache.set("k", "value")
+    assert cache.get("k") == "value"
+    cache.clear()
+    assert cache.get("k") is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = CompletionCache(path=None, memory_entries=0)
+    cache.set("k", "value")
+    assert cache.get("k") is None
+
+
+def test_persistent_tier_is_shared_and_expires(tmp_path):
+    CompletionCache(tmp_path / "cache.sqlite3").set("k", "value")
+    assert CompletionCache(tmp_path / "cache.sqlite3").get("k") == "value"
+    expired = CompletionCache(tmp_path / "cache.sqlite3", ttl_seconds=0)
+    time.sleep(0.01)
+    assert expired.get("k") is None
+    assert CompletionCache(tmp_path / "cache.sqlite3").get("k") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = CompletionCache(tmp_path / "cache.sqlite3", memory_entries=0, max_bytes=10)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    cache.get("a")
+    cache.set("c", "12345")
+    assert cache.get("a") == "12345"
+    assert cache.get("b") is None
+    assert cache.get("c") == "12345"
+
+
+@pytest.mark.parametrize("finish_reason, cached", [("stop", True), ("length", False)])
+def test_only_complete_responses_are_cached(monkeypatch, finish_reason, cached):
+    def create(**kwargs):
+        message = SimpleNamespace(content="scope")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)], usage=None)
+
+    monkeypatch.setattr(llm, "_llm", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    cache = CompletionCache(path=None)
+    monkeypatch.setattr(agent, "completion_cache", cache)
+    messages = [{"role": "user", "content": f"scope {finish_reason} {time.monotonic()}"}]
+    assert agent.complete(messages, "requirements", agent.GenerationRun(fresh=True), stream=False) == "scope"
+    key = cache.key(agent.settings.AZURE_OPENAI_DEPLOYMENT, messages)
+    assert (cache.get(key) == "scope") is cached
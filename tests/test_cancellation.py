@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from proposal_builder import agent
+from conftest import PROPOSAL, messages
+
+
+def test_cancel_stops_a_non_streamed_call_waiting_for_the_model(completions):
+    completions(delay=0.1)  # 2s before the response
+    run = agent.GenerationRun(fresh=True)
+    threading.Timer(0.3, run.cancelled.set).start()
+    started = time.monotonic()
+    with pytest.raises(agent.GenerationCancelled):
+        agent.complete(messages(), "requirements", run, stream=False)
+    assert time.monotonic() - started < 1
+
+
+def test_cancel_closes_a_streamed_call(completions):
+    fake = completions(delay=0.1)
+    run = agent.GenerationRun(fresh=True, on_token=lambda section, token: None)
+    threading.Timer(0.3, run.cancelled.set).start()
+    with pytest.raises(agent.GenerationCancelled):
+        agent.complete(messages(), "requirements", run)
+    time.sleep(0.3)
+    assert fake.streams[0].closed
+
+
+def test_section_past_its_deadline_is_left_out(completions, monkeypatch):
+    completions(slow=0.2, slow_marker="client_expectations")
+    monkeypatch.setattr(agent.settings, "SECTION_TIMEOUTS", {"requirements": 0.5})
+    failures = {}
+    started = time.monotonic()
+    sections = agent.generate_sections(
+        PROPOSAL, on_token=lambda section, token: None, on_failure=failures.__setitem__, fresh=True
+    )
+    assert time.monotonic() - started < 2
+    assert failures == {"requirements": "timed out after 0.5s"}
+    assert "requirements" not in sections and "timeline_planning" in sections
+
+
+def test_cancelled_proposal_raises_and_keeps_finished_sections(completions):
+    completions(slow=0.2, slow_marker="client_expectations")
+    cancel = threading.Event()
+    threading.Timer(0.5, cancel.set).start()
+    sections = {}
+    failures = {}
+    with pytest.raises(agent.GenerationCancelled):
+        agent.generate_sections(PROPOSAL, sections=sections, on_failure=failures.__setitem__, cancel=cancel, fresh=True)
+    assert failures["requirements"] == "cancelled"
+    assert "timeline_planning" in sections
+
+
+def test_follower_takes_over_when_the_leader_is_cancelled(completions):
+    completions(delay=0.05)
+    shared = messages()
+    leader = agent.GenerationRun(fresh=True, on_token=lambda section, token: None)
+    results = {}
+
+    def lead():
+        try:
+            agent.complete(shared, "requirements", leader)
+        except agent.GenerationCancelled:
+            results["leader"] = "cancelled"
+
+    thread = threading.Thread(target=lead)
+    thread.start()
+    time.sleep(0.1)
+    threading.Timer(0.2, leader.cancelled.set).start()
+    results["follower"] = agent.complete(shared, "requirements", agent.GenerationRun(fresh=True))
+    thread.join()
+    assert results["leader"] == "cancelled"
+    # Made its own (non-streamed) call once the leader stopped
+    assert results["follower"] == "done"
@@ -0,0 +1,55 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from proposal_builder import agent, examples
+from proposal_builder.examples import ExampleLibrary, VectorIndex
+from conftest import PROPOSAL
+
+DATA = {"language": "English", "technology_focus": "AWS", "general_description": "Churn model"}
+
+
+def test_search_ranks_by_cosine_within_matching_rows(tmp_path):
+    index = VectorIndex(tmp_path)
+    index.add([
+        ("a", [1.0, 0.0], {"language": "English"}, "close"),
+        ("b", [0.0, 1.0], {"language": "English"}, "far"),
+        ("c", [1.0, 0.1], {"language": "Portuguese"}, "other language"),
+    ])
+    assert index.add([("a", [1.0, 0.0], {"language": "English"}, "close")]) == 0
+    matches = index.search([2.0, 0.1], 2, {"language": "English"})
+    assert [index.text(row) for _, row in matches] == ["close", "far"]
+
+
+def test_embedding_retries_stop_when_the_run_is_cancelled(tmp_path, monkeypatch):
+    def create(**kwargs):
+        response = httpx.Response(429, request=httpx.Request("POST", "https://example.com"))
+        raise openai.RateLimitError("busy", response=response, body=None)
+
+    monkeypatch.setattr(examples, "get_llm", lambda settings: SimpleNamespace(embeddings=SimpleNamespace(create=create)))
+    library = ExampleLibrary(tmp_path, SimpleNamespace(AZURE_OPENAI_EMBEDDING_DEPLOYMENT="embeddings", LLM_MAX_RETRIES=10))
+    library.index("project_description").add([("p1", [1.0, 0.0], {"language": "English"}, "excerpt")])
+    monkeypatch.setattr(agent, "example_library", library)
+    run = agent.GenerationRun(fresh=True)
+    threading.Timer(0.2, run.cancelled.set).start()
+    started = time.monotonic()
+    with pytest.raises(agent.GenerationCancelled):
+        agent.find_examples("project_description", DATA, run)
+    assert time.monotonic() - started < 1
+
+
+def test_estimate_and_run_build_the_same_timeline_prompt(monkeypatch):
+    monkeypatch.setattr(agent, "example_library", SimpleNamespace(find=lambda section, data, sleep=None: ["| Phase 1 |"]))
+    prompts = []
+    monkeypatch.setattr(agent, "complete", lambda messages, section, run: prompts.append(messages) or "| a |")
+    agent.generate_timeline_planning(PROPOSAL, agent.GenerationRun(estimates=[]))
+    agent.generate_timeline_planning(PROPOSAL, agent.GenerationRun())
+    estimated, generated = prompts
+    assert estimated == generated
+    # Static instructions first, then the examples, then the client's data
+    assert "| Phase 1 |" in generated[2]["content"]
+    assert generated[-1]["content"].startswith("{")
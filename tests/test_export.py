@@ -0,0 +1,69 @@
+import io
+import subprocess
+import sys
+from pathlib import Path
+
+import docx
+
+from proposal_builder.export import Exporter, export_filename, parse_markdown, render
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+MARKDOWN = """# Scope
+
+Intro with **bold**, *italic*, `code` and a [link](https://example.com).
+
+1. First
+2. Second
+   - Detail
+
+Between the lists.
+
+1. Again
+
+| Phase | Weeks |
+|---|---|
+| Discovery | 2 |
+"""
+
+
+def test_parse_markdown_blocks():
+    kinds = [block[0] for block in parse_markdown(MARKDOWN)]
+    assert kinds == ["heading", "paragraph", "list", "paragraph", "list", "table"]
+
+
+def test_docx_restarts_numbered_lists_and_keeps_tables():
+    document = docx.Document(io.BytesIO(render(MARKDOWN, "docx", "ACME")))
+    assert document.core_properties.title == "ACME"
+    numbered = [p for p in document.paragraphs if p.style.name == "List Number"]
+    num_ids = [p._p.pPr.numPr.numId.val for p in numbered]
+    assert len(num_ids) == 3 and num_ids[0] == num_ids[1] != num_ids[2]
+    assert [cell.text for cell in document.tables[0].rows[1].cells] == ["Discovery", "2"]
+
+
+def test_pdf_and_html_render():
+    assert render(MARKDOWN, "pdf", "ACME").startswith(b"%PDF")
+    html = render(MARKDOWN, "html", "ACME").decode()
+    assert '<a href="https://example.com">link</a>' in html
+    assert "<th>Phase</th>" in html
+
+
+def test_exports_are_cached_by_content(tmp_path):
+    exporter = Exporter(cache_dir=tmp_path)
+    try:
+        first = exporter.export(MARKDOWN, "html", "ACME").result(timeout=60)
+        assert len(list(tmp_path.iterdir())) == 1
+        assert exporter.export(MARKDOWN, "html", "ACME").done()
+        assert exporter.export(MARKDOWN, "html", "ACME").result() == first
+    finally:
+        exporter.shutdown()
+
+
+def test_export_filename_is_ascii():
+    assert export_filename({"client_name": "Ação", "project_name": "Churn model"}, "pdf") == "Proposal-Churn-model-Acao.pdf"
+
+
+def test_renderer_libraries_are_only_loaded_to_render():
+    code = "import sys, proposal_builder.export; print(sorted({m.split('.')[0] for m in sys.modules} & {'docx', 'reportlab'}))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,84 @@
+import time
+from types import SimpleNamespace
+
+from proposal_builder import jobs
+from proposal_builder.jobs import JobQueue, create_job_queue
+
+
+def test_lease_heartbeat_and_finish():
+    queue = JobQueue(lease_seconds=30)
+    queue.enqueue("job", {"n": 1})
+    assert queue.lease("a") == ("job", {"n": 1})
+    assert queue.lease("b") is None
+    assert queue.heartbeat("job", "a")
+    assert not queue.heartbeat("job", "b")
+    assert not queue.finish("job", "b", "completed")
+    assert queue.finish("job", "a", "completed")
+    assert queue.status("job") == "completed"
+    assert not queue.heartbeat("job", "a")
+
+
+def test_identical_requests_share_a_job():
+    queue = JobQueue()
+    assert queue.enqueue("first", {}, key="k") == "first"
+    assert queue.enqueue("second", {}, key="k") == "first"
+    # The job goes on until every request attached to it gave it up
+    assert queue.cancel("first") == "attached"
+    assert queue.status("first") == "queued"
+    assert queue.cancel("first") == "queued"
+    assert queue.enqueue("third", {}, key="k") == "third"
+
+
+def test_expired_lease_is_taken_over_and_given_up_after_max_attempts():
+    queue = JobQueue(lease_seconds=0.05, max_attempts=2)
+    queue.enqueue("job", {})
+    assert queue.lease("a") is not None
+    time.sleep(0.1)
+    assert queue.abandon() == []
+    assert queue.lease("b") is not None
+    # The worker that stalled past its lease no longer holds it
+    assert not queue.heartbeat("job", "a")
+    time.sleep(0.1)
+    assert queue.lease("c") is None
+    assert queue.abandon() == ["job"]
+    assert queue.status("job") == "failed"
+
+
+def test_cancel_queued_and_leased_jobs():
+    queue = JobQueue()
+    queue.enqueue("queued", {})
+    assert queue.cancel("queued") == "queued"
+    assert queue.status("queued") == "cancelled"
+    queue.enqueue("leased", {})
+    queue.lease("a")
+    assert queue.cancel("leased") == "leased"
+    assert queue.cancel_requested("leased")
+    assert queue.finish("leased", "a", "cancelled")
+    assert not queue.cancel_requested("leased")
+    assert queue.cancel("missing") is None
+
+
+def test_events_are_read_after_a_sequence_number():
+    queue = JobQueue()
+    queue.publish("job", [("token", {"t": "a"}), ("token", {"t": "b"})])
+    events = queue.events("job")
+    assert [data["t"] for _, _, data in events] == ["a", "b"]
+    assert queue.events("job", after=events[0][0]) == events[1:]
+
+
+def test_queue_stays_in_the_process_when_proposals_are_kept_in_memory(tmp_path):
+    settings = SimpleNamespace(PROPOSAL_STORE_ENABLED=False, DATA_DIR=tmp_path, JOB_LEASE_SECONDS=30, JOB_MAX_ATTEMPTS=3)
+    create_job_queue(settings).enqueue("job", {})
+    assert not (tmp_path / "jobs.sqlite3").exists()
+
+
+def test_events_are_pruned_once_their_job_left_the_retention_period(monkeypatch):
+    monkeypatch.setattr(jobs, "EVENT_RETENTION_SECONDS", 0.05)
+    queue = JobQueue()
+    for job_id in ("old", "new"):
+        queue.enqueue(job_id, {})
+        queue.lease("a")
+        queue.publish(job_id, [("token", {"t": "a"})])
+        queue.finish(job_id, "a", "completed")
+        time.sleep(0.1)
+    assert queue.events("old") == [] and queue.events("new") != []
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from proposal_builder import metrics
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+LABELS = 'section="requirements",call="requirements",project_type="Gen-OS",language="English"'
+
+
+def run(code: str, data_dir: Path) -> str:
+    env = dict(os.environ, DATA_DIR=str(data_dir), PYTHONPATH=str(SRC))
+    return subprocess.run([sys.executable, "-c", code], cwd=SRC, env=env, capture_output=True, text=True, check=True).stdout
+
+
+def test_calls_recorded_in_one_process_are_reported_by_another(tmp_path):
+    record = (
+        "from proposal_builder import agent, metrics\n"
+        "labels = dict(section='requirements', call='requirements', project_type='Gen-OS', language='English')\n"
+        "metrics.LLM_CALLS.inc(cache='miss', **labels)\n"
+        "metrics.LLM_LATENCY.observe(1.5, **labels)\n"
+    )
+    run(record, tmp_path)
+    run(record, tmp_path)
+    rendered = run("from proposal_builder import agent, metrics\nprint(metrics.render())", tmp_path)
+    lines = rendered.splitlines()
+    assert f'proposal_llm_calls_total{{{LABELS},cache="miss"}} 2' in lines
+    assert f"proposal_llm_latency_seconds_count{{{LABELS}}} 2" in lines
+    assert f"proposal_llm_latency_seconds_sum{{{LABELS}}} 3.0" in lines
+
+
+def test_render_sums_the_states_of_every_process():
+    counter = metrics.Counter("test_total", "Test", ("kind",))
+    histogram = metrics.Histogram("test_seconds", "Test", buckets=(1, 10))
+    metrics.REGISTRY[-2:] = []
+    counter.inc(kind="a")
+    histogram.observe(5)
+    assert counter.render([counter.state(), counter.state()])[2] == 'test_total{kind="a"} 2'
+    assert histogram.render([histogram.state(), histogram.state()])[2:] == [
+        'test_seconds_bucket{le="1"} 0',
+        'test_seconds_bucket{le="10"} 2',
+        'test_seconds_bucket{le="+Inf"} 2',
+        "test_seconds_sum 10.0",
+        "test_seconds_count 2",
+    ]
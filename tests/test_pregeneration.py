@@ -0,0 +1,42 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from proposal_builder import pregeneration
+from proposal_builder.pregeneration import Pregenerator
+from conftest import PROPOSAL
+
+FORM = {**PROPOSAL, "planning": "", "client_stakeholders": "", "daredata_team": "", "client_expectations": ""}
+
+
+def test_group_waits_for_its_inputs_to_settle(monkeypatch):
+    started = []
+    monkeypatch.setattr(
+        pregeneration, "generate_group",
+        lambda group, data, fresh, cancel: started.append(data["general_description"]) or {},
+    )
+    pregenerator = Pregenerator(ThreadPoolExecutor(1), debounce_seconds=0.3)
+    assert pregenerator.update({**FORM, "general_description": "first"}) == ["project_description"]
+    time.sleep(0.1)
+    pregenerator.update({**FORM, "general_description": "second"})
+    assert pregenerator.status() == {"project_description": "waiting"}
+    time.sleep(0.5)
+    assert started == ["second"]
+    assert pregenerator.status() == {"project_description": "ready"}
+
+
+def test_replaced_run_is_cancelled(monkeypatch):
+    cancels = []
+
+    def generate_group(group, data, fresh, cancel):
+        cancels.append(cancel)
+        cancel.wait(5)
+        return {}
+
+    monkeypatch.setattr(pregeneration, "generate_group", generate_group)
+    pregenerator = Pregenerator(ThreadPoolExecutor(2))
+    pregenerator.update({**FORM, "general_description": "first"})
+    pregenerator.update({**FORM, "general_description": "second"})
+    time.sleep(0.1)
+    assert [cancel.is_set() for cancel in cancels] == [True, False]
+    pregenerator.cancel()
+    assert cancels[1].is_set()
@@ -0,0 +1,48 @@
+import shutil
+import time
+
+import config
+from proposal_builder import agent
+from proposal_builder.prompt_registry import PromptRegistry
+from conftest import PROPOSAL
+
+
+def test_version_changes_when_the_file_changes(tmp_path):
+    (tmp_path / "system.txt").write_text("Be concise.", encoding="utf-8")
+    registry = PromptRegistry(tmp_path, {"SYSTEM_PROMPT": "system.txt"}, reload_interval=0.05)
+    version = registry.version("SYSTEM_PROMPT")
+    (tmp_path / "system.txt").write_text("Be very concise.", encoding="utf-8")
+    # Until the next check the prompt read before is kept
+    assert registry.SYSTEM_PROMPT == "Be concise."
+    time.sleep(0.1)
+    assert registry.SYSTEM_PROMPT == "Be very concise."
+    assert registry.version("SYSTEM_PROMPT") != version
+
+
+def test_prompt_change_makes_only_the_sections_written_from_it_stale(tmp_path, monkeypatch):
+    shutil.copytree(config.PROMPTS_PATH, tmp_path, dirs_exist_ok=True)
+    monkeypatch.setattr(agent, "prompts", PromptRegistry(tmp_path, config.PROMPT_FILES, reload_interval=0))
+    genos = dict(PROPOSAL, project_type="Gen-OS")
+    versions, genos_versions = agent.prompt_versions(PROPOSAL), agent.prompt_versions(genos)
+    assert agent.stale_sections(PROPOSAL, PROPOSAL, versions) == set()
+
+    def append(name: str, text: str) -> None:
+        path = tmp_path / config.PROMPT_FILES[name]
+        path.write_text(path.read_text(encoding="utf-8") + text, encoding="utf-8")
+
+    append("STAKEHOLDERS_AND_TEAM", "\nName every stakeholder's role.")
+    assert agent.stale_sections(PROPOSAL, PROPOSAL, versions) == {"stakeholders_and_team"}
+    # Gen-OS guidance only affects the description, and the summary written from it, of Gen-OS proposals
+    append("GENOS", "\nMention the Gen-OS roadmap.")
+    assert agent.stale_sections(PROPOSAL, PROPOSAL, versions) == {"stakeholders_and_team"}
+    assert agent.stale_sections(genos, genos, genos_versions) == {
+        "stakeholders_and_team", "project_description", "executive_summary",
+    }
+
+
+def test_genos_description_mode_is_part_of_its_version(monkeypatch):
+    genos = dict(PROPOSAL, project_type="Gen-OS")
+    versions, genos_versions = agent.prompt_versions(PROPOSAL), agent.prompt_versions(genos)
+    monkeypatch.setattr(agent.settings, "GENOS_SINGLE_PASS", not agent.settings.GENOS_SINGLE_PASS)
+    assert agent.stale_sections(genos, genos, genos_versions) == {"project_description", "executive_summary"}
+    assert agent.stale_sections(PROPOSAL, PROPOSAL, versions) == set()
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from proposal_builder import agent, llm
+from proposal_builder.llm import RateLimiter
+from conftest import messages
+
+
+class Limiter(RateLimiter):
+    """Rate limiter that records each settlement."""
+
+    def __init__(self):
+        super().__init__(tokens_per_minute=100_000)
+        self.settled = []
+
+    def settle(self, reserved: int, used: int, request: bool = True) -> None:
+        self.settled.append((reserved, used))
+        super().settle(reserved, used, request)
+
+
+def test_settle_gives_back_unused_tokens():
+    limiter = RateLimiter(tokens_per_minute=600)
+    assert limiter.try_acquire(500) == 0
+    assert limiter.try_acquire(500) > 0
+    limiter.settle(500, 100)
+    assert limiter.try_acquire(500) == 0
+
+
+def test_async_acquire_waits_for_the_bucket_to_refill():
+    limiter = RateLimiter(tokens_per_minute=6000)
+    assert limiter.try_acquire(6000) == 0
+    waited = asyncio.run(limiter.acquire_async(30))
+    assert 0.2 < waited < 1
+
+
+def test_cancelled_stream_settles_its_reservation(completions, monkeypatch):
+    completions(delay=0.1)
+    limiter = Limiter()
+    monkeypatch.setattr(agent, "rate_limiter", limiter)
+    run = agent.GenerationRun(fresh=True, on_token=lambda section, token: None)
+    threading.Timer(0.35, run.cancelled.set).start()
+    with pytest.raises(agent.GenerationCancelled):
+        agent.complete(messages(), "requirements", run)
+    [(reserved, used)] = limiter.settled
+    assert 0 < used < reserved
+
+
+def test_rejected_call_settles_its_reservation(monkeypatch):
+    def create(**kwargs):
+        response = httpx.Response(400, request=httpx.Request("POST", "https://example.com"))
+        raise openai.BadRequestError("bad request", response=response, body=None)
+
+    monkeypatch.setattr(llm, "_llm", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    limiter = Limiter()
+    monkeypatch.setattr(agent, "rate_limiter", limiter)
+    with pytest.raises(openai.BadRequestError):
+        agent.complete(messages(), "requirements", agent.GenerationRun(fresh=True))
+    [(reserved, used)] = limiter.settled
+    assert used == 0 < reserved
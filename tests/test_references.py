@@ -0,0 +1,66 @@
+from proposal_builder.references import ReferenceIndex, ReferenceLibrary, split_chunks
+
+PARAGRAPH = " ".join(["Each practice is adopted step by step across the delivery teams."] * 2)
+DOCUMENT = f"""
+MLOps framework
+This framework lists the practices every machine learning project should follow. {PARAGRAPH}
+Model monitoring
+Production models are monitored with CloudWatch alarms on drift and latency metrics. {PARAGRAPH}
+Feature store
+Features are versioned in a shared feature store so training and serving agree. {PARAGRAPH}
+Pipelines
+Training pipelines run on SageMaker Pipelines with every step reproducible. {PARAGRAPH}
+Notebooks
+Exploration notebooks are reviewed and kept out of the production code path. {PARAGRAPH}
+"""
+
+
+class Prompts:
+    """Prompt registry holding one document, whose version changes with its text."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def get(self, name: str) -> str:
+        return self.text
+
+    def version(self, name: str) -> str:
+        return str(hash(self.text))
+
+
+def test_chunks_keep_their_heading():
+    chunks = split_chunks(DOCUMENT)
+    assert [chunk.heading for chunk in chunks] == ["MLOps framework", "Model monitoring", "Feature store", "Pipelines", "Notebooks"]
+
+
+def test_select_keeps_the_introduction_and_the_best_chunks_in_document_order():
+    index = ReferenceIndex(DOCUMENT)
+    selected = index.select("AWS sagemaker pipelines with cloudwatch monitoring", 2)
+    assert selected.splitlines()[::2] == ["MLOps framework", "Model monitoring", "Pipelines"]
+    # Only k chunks are taken besides the introduction, however many match
+    assert "Feature store" not in selected and "Notebooks" not in selected
+
+
+def test_select_without_a_match_keeps_the_first_chunks():
+    selected = ReferenceIndex(DOCUMENT).select("quantum blockchain", 1)
+    assert selected.splitlines()[::2] == ["MLOps framework", "Model monitoring"]
+
+
+def test_select_returns_short_documents_whole():
+    index = ReferenceIndex(DOCUMENT)
+    assert index.select("anything", 4) == index.select("", 10)
+    assert len(index.select("anything", 4).splitlines()) == 10
+
+
+def test_library_rebuilds_an_index_when_the_prompt_changes():
+    prompts = Prompts(DOCUMENT)
+    library = ReferenceLibrary(prompts, ["MLOPS"], chunks=1)
+    data = {"general_description": "drift monitoring", "technology_focus": "AWS"}
+    assert "Model monitoring" in library.select("MLOPS", data)
+    index = library.index("MLOPS")
+    assert library.index("MLOPS") is index
+    prompts.text = DOCUMENT.replace("Model monitoring", "Observability")
+    assert library.index("MLOPS") is not index
+    assert "Observability" in library.select("MLOPS", data)
+    # With chunking off, the whole document is used
+    assert ReferenceLibrary(prompts, ["MLOPS"], chunks=0).select("MLOPS", data) == prompts.text
@@ -0,0 +1,42 @@
+import threading
+import time
+
+from proposal_builder.singleflight import Flight
+
+
+def test_followers_get_every_token_once_and_in_order():
+    flight = Flight()
+    received = [[] for _ in range(8)]
+
+    def publish():
+        for i in range(2000):
+            flight.publish(str(i))
+
+    leader = threading.Thread(target=publish)
+    leader.start()
+    for tokens in received:
+        flight.subscribe(tokens.append)
+    leader.join()
+    for tokens in received:
+        assert tokens == [str(i) for i in range(2000)]
+
+
+def test_slow_follower_does_not_hold_up_others():
+    flight = Flight()
+    flight.subscribe(lambda token: time.sleep(1))
+    threading.Thread(target=flight.publish, args=("a",), daemon=True).start()
+    time.sleep(0.1)
+    received = []
+    started = time.monotonic()
+    flight.subscribe(received.append)
+    assert received == ["a"] and time.monotonic() - started < 0.5
+
+
+def test_no_token_after_unsubscribe():
+    flight = Flight()
+    received = []
+    flight.subscribe(received.append)
+    flight.publish("a")
+    flight.unsubscribe(received.append)
+    flight.publish("b")
+    assert received == ["a"]
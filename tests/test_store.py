@@ -0,0 +1,53 @@
+import pytest
+
+from proposal_builder import store
+from proposal_builder.store import ProposalStore, decode_cursor, encode_cursor
+from conftest import PROPOSAL
+
+
+def save(proposals: ProposalStore, proposal_id: str, **fields) -> None:
+    proposals.save({"id": proposal_id, "status": "completed"}, dict(PROPOSAL, **fields))
+
+
+def pages(proposals: ProposalStore, limit: int, **filters) -> list[list[str]]:
+    result, cursor = [], None
+    while True:
+        page, cursor = proposals.list(limit=limit, cursor=cursor, **filters)
+        result.append([item["id"] for item in page])
+        if cursor is None:
+            return result
+
+
+def test_pages_split_proposals_created_at_the_same_time(monkeypatch):
+    monkeypatch.setattr(store.time, "time", lambda: 1000.0)
+    proposals = ProposalStore()
+    for proposal_id in "abcde":
+        save(proposals, proposal_id)
+    # Ties on created_at are broken by id, so no proposal is skipped or repeated
+    assert pages(proposals, 2) == [["e", "d"], ["c", "b"], ["a"]]
+
+
+def test_full_last_page_has_no_next_cursor():
+    proposals = ProposalStore()
+    for proposal_id in "abcd":
+        save(proposals, proposal_id)
+    assert [len(page) for page in pages(proposals, 2)] == [2, 2]
+    # A cursor past the oldest proposal gives an empty page
+    assert proposals.list(limit=3, cursor=encode_cursor(0.0, "")) == ([], None)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(1700000000.123456, "abc")) == (1700000000.123456, "abc")
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+def test_client_name_filter_ignores_case():
+    proposals = ProposalStore()
+    save(proposals, "a", client_name="ACME")
+    save(proposals, "b", client_name="Globex")
+    save(proposals, "c", client_name="acme")
+    assert pages(proposals, 10, client_name="Acme") == [["c", "a"]]
+    assert pages(proposals, 10, client_name="Acme", status="failed") == [[]]
+    with pytest.raises(ValueError):
+        proposals.list(owner="me")
@@ -0,0 +1,49 @@
+from proposal_builder import templates
+
+DATA = {"language": "English", "project_type": "Gen-OS", "client_name": "ACME"}
+
+
+def test_every_static_section_is_rendered_at_import():
+    for language in templates.LANGUAGES:
+        for project_type in templates.PROJECT_TYPES:
+            agreement = templates.render_static("work_agreement", {"language": language, "project_type": project_type})
+            assert templates.STRINGS[language]["agreement_title"] in agreement
+            assert templates.COMMERCIAL_TERMS[project_type][language] in agreement
+            assert "$" not in agreement
+    # SIFIDE is only offered in Portuguese
+    assert templates.render_static("sifide", dict(DATA, language="Portuguese")) == templates.SIFIDE
+    assert ("sifide", "English", "Gen-OS") not in templates.STATIC_SECTIONS
+
+
+def test_requirements_with_and_without_client_expectations():
+    plain = templates.render_requirements(DATA)
+    assert plain.startswith("# 6. Client Requirements and Starting Date\n\n")
+    assert "support from ACME" in plain and "$" not in plain
+    assert plain.endswith(templates.STRINGS["English"]["requirements_start"] + "\n")
+    # The model's paragraph goes before the starting date, without the headings it may repeat
+    written = templates.render_requirements(DATA, "# Requirements\nA VPN account for each engineer.")
+    assert written == plain.replace(
+        templates.STRINGS["English"]["requirements_start"],
+        "A VPN account for each engineer.\n\n" + templates.STRINGS["English"]["requirements_start"],
+    )
+    assert templates.render_requirements(DATA, "  \n") == plain
+
+
+def test_timeline_keeps_only_the_rows_the_model_wrote():
+    rows = "# Timeline\n| Phase | Overview |\n|---|---|\n| 1. Discovery | Interviews |\n\n| 2. Build | MVP |"
+    assert templates.render_timeline(dict(DATA, language="Portuguese"), rows) == (
+        "# 3. Planeamento e Calendário\n\n| Fase | Descrição |\n|---|---|\n| 1. Discovery | Interviews |\n| 2. Build | MVP |\n"
+    )
+
+
+def test_team_roles_depend_on_the_project_type():
+    genos = templates.render_stakeholders_and_team(DATA, "- CTO")
+    closed = templates.render_stakeholders_and_team(dict(DATA, project_type="Closed Project"), "- CTO")
+    assert "**Gen-OS Team**" in genos and "**Gen-OS Team**" not in closed
+    assert "ACME's stakeholders" in closed
+
+
+def test_only_template_sections_carry_the_template_version():
+    assert templates.version("requirements") == templates.VERSION
+    assert templates.version("sifide") == templates.VERSION
+    assert templates.version("project_description") == ""
@@ -0,0 +1,40 @@
+from proposal_builder import worker
+from proposal_builder.jobs import JobQueue
+from proposal_builder.store import ProposalStore
+from proposal_builder.worker import Worker
+from conftest import PROPOSAL
+
+
+def test_invalid_payload_fails_once():
+    store, queue = ProposalStore(), JobQueue(max_attempts=3)
+    # Queued before the API validated these fields, e.g. by an older version
+    data = {"client_name": "ACME", "project_name": "X", "language": "French", "project_type": "Foo"}
+    store.save({"id": "job", "status": "queued"}, data)
+    queue.enqueue("job", {"proposal_data": data})
+
+    assert Worker(store, queue, name="w").run_once()
+    assert queue.status("job") == "failed"
+    assert store.get("job")["status"] == "failed"
+    assert "Invalid proposal data" in store.get("job")["error"]
+    # Nothing left to lease again
+    assert not Worker(store, queue, name="w").run_once()
+
+
+def test_results_of_a_lost_lease_are_dropped(monkeypatch):
+    store, queue = ProposalStore(), JobQueue(lease_seconds=30)
+    store.save({"id": "job", "status": "queued"}, PROPOSAL)
+    queue.enqueue("job", {"proposal_data": PROPOSAL})
+    job_id, payload = queue.lease("a")
+
+    def generate_sections(data, on_section, sections, **kwargs):
+        # Worker a stalls past its lease and worker b takes the job over
+        queue._db.execute("UPDATE jobs SET worker = 'b' WHERE id = ?", (job_id,))
+        on_section("requirements", "stale")
+        sections["requirements"] = "stale"
+        return sections
+
+    monkeypatch.setattr(worker, "generate_sections", generate_sections)
+    assert Worker(store, queue, name="a").run_job(job_id, payload["proposal_data"]) is None
+    assert store.sections("job") == {}
+    assert store.get("job")["status"] == "running"
+    assert queue.status("job") == "leased"